@@ -4,12 +4,15 @@ import java.net.HttpURLConnection;
 import java.net.URL;
 import java.util.concurrent.ExecutorService;
 import java.util.concurrent.Executors;
+import java.util.concurrent.ThreadLocalRandom;
 import java.util.concurrent.TimeUnit;
 import java.util.concurrent.atomic.AtomicInteger;
+import java.util.concurrent.atomic.AtomicLongArray;
 
 public class ConcurrencyTester {
     // VM에 배포된 Python API 서버의 IP 주소와 포트를 설정합니다.
-    private static final String API_URL = "http://172.16.249.144:5000/api/view/increment/1";
+    private static final String API_BASE_URL = "http://172.16.249.144:5000/api/view/increment/";
+    private static final String API_URL = API_BASE_URL + "1";
 //    private static final String API_URL = "http://172.16.249.144:5000/content/1/view";
 //    private static final String API_URL = "http://172.16.249.144:5000/view/1";
     // 테스트 조건 설정
@@ -17,6 +20,14 @@ public class ConcurrencyTester {
     private static final int CALLS_PER_THREAD = 100; // 스레드당 반복 호출 횟수
     private static final int TOTAL_EXPECTED_CALLS = NUM_THREADS * CALLS_PER_THREAD; // 총 예상 호출 횟수: 5,000
 
+    // 여러 게시글로 부하 분산 (1 이면 기존처럼 1번 게시글만 호출)
+    // 게시글 1..NUM_POSTS 를 Zipf 분포(순위 k 의 확률 ∝ 1 / k^ZIPF_EXPONENT)로 선택합니다.
+    private static final int NUM_POSTS = 1;
+    private static final double ZIPF_EXPONENT = 1.0;
+    private static final double[] ZIPF_CDF = buildZipfCdf(NUM_POSTS, ZIPF_EXPONENT);
+    // 게시글별 성공 호출 수 (Redis/DB 값과 게시글 단위로 비교하기 위함)
+    private static final AtomicLongArray successfulCallsPerPost = new AtomicLongArray(NUM_POSTS + 1);
+
     // 실제로 성공한 API 호출 횟수를 기록합니다. (정확한 카운트를 위해 AtomicInteger 사용)
     private static final AtomicInteger successfulCalls = new AtomicInteger(0);
 
@@ -28,7 +39,11 @@ public class ConcurrencyTester {
         System.out.println("  스레드 수: " + NUM_THREADS);
         System.out.println("  스레드당 호출 횟수: " + CALLS_PER_THREAD);
         System.out.println("  총 예상 호출 횟수 (정상 값): " + TOTAL_EXPECTED_CALLS);
-        System.out.println("  API 주소: " + API_URL);
+        if (NUM_POSTS == 1) {
+            System.out.println("  API 주소: " + API_URL);
+        } else {
+            System.out.println("  API 주소: " + API_BASE_URL + "{1.." + NUM_POSTS + "} (Zipf s=" + ZIPF_EXPONENT + ")");
+        }
         System.out.println("-------------------------------------------------");
 
         // ExecutorService를 사용하여 스레드 풀을 생성합니다.
@@ -62,9 +77,58 @@ public class ConcurrencyTester {
         System.out.println("3. 경과 시간: " + (endTime - startTime) + " ms");
 
         // 이 후, VM에서 직접 DB와 캐시 값을 조회하여 비교해야 합니다.
+        // 여러 게시글로 분산했다면 실제로 가장 많이 호출된 게시글을 기준으로 안내합니다.
+        int hottestPostId = 1;
+        for (int postId = 2; postId <= NUM_POSTS; postId++) {
+            if (successfulCallsPerPost.get(postId) > successfulCallsPerPost.get(hottestPostId)) {
+                hottestPostId = postId;
+            }
+        }
         System.out.println("\n🚨 다음 단계: VM에서 직접 DB와 Redis 최종 값을 조회하여 '불일치'를 확인하세요.");
-        System.out.println("  - Redis 조회: GET post:1:view_count");
-        System.out.println("  - MariaDB 조회: SELECT view_count FROM w11_exam.content WHERE id = 1;");
+        System.out.println("  - Redis 조회: GET post:" + hottestPostId + ":view_count");
+        System.out.println("  - MariaDB 조회: SELECT view_count FROM w11_exam.content WHERE id = " + hottestPostId + ";");
+        if (NUM_POSTS > 1) {
+            System.out.println("  (post " + hottestPostId + " 성공 호출 수: " + successfulCallsPerPost.get(hottestPostId) + ")");
+        }
+
+        if (NUM_POSTS > 1) {
+            System.out.println("\n게시글별 성공 호출 수 (상위 10개):");
+            for (int postId = 1; postId <= Math.min(NUM_POSTS, 10); postId++) {
+                System.out.println("  post " + postId + ": " + successfulCallsPerPost.get(postId));
+            }
+        }
+    }
+
+    // Zipf 누적 분포 (인덱스 i = 게시글 i+1 까지의 누적 확률)
+    private static double[] buildZipfCdf(int n, double s) {
+        double[] cdf = new double[n];
+        double sum = 0;
+        for (int k = 1; k <= n; k++) {
+            sum += 1.0 / Math.pow(k, s);
+            cdf[k - 1] = sum;
+        }
+        for (int i = 0; i < n; i++) {
+            cdf[i] /= sum;
+        }
+        return cdf;
+    }
+
+    // 누적 분포에서 이진 탐색으로 게시글 ID 선택
+    private static int nextPostId() {
+        if (NUM_POSTS == 1) {
+            return 1;
+        }
+        double u = ThreadLocalRandom.current().nextDouble();
+        int lo = 0, hi = NUM_POSTS - 1;
+        while (lo < hi) {
+            int mid = (lo + hi) >>> 1;
+            if (ZIPF_CDF[mid] < u) {
+                lo = mid + 1;
+            } else {
+                hi = mid;
+            }
+        }
+        return lo + 1;
     }
 
     // API 호출 작업을 수행하는 Runnable 클래스
@@ -80,7 +144,8 @@ public class ConcurrencyTester {
             for (int i = 0; i < CALLS_PER_THREAD; i++) {
                 try {
                     // API 호출
-                    URL url = new URL(API_URL);
+                    int postId = nextPostId();
+                    URL url = new URL(API_BASE_URL + postId);
                     HttpURLConnection conn = (HttpURLConnection) url.openConnection();
                     conn.setRequestMethod("POST");
                     conn.setDoOutput(true);
@@ -89,6 +154,7 @@ public class ConcurrencyTester {
 
                     if (responseCode == HttpURLConnection.HTTP_OK) {
                         successfulCalls.incrementAndGet();
+                        successfulCallsPerPost.incrementAndGet(postId);
                         // 응답 본문을 읽어 로그 출력
                         try (BufferedReader br = new BufferedReader(new InputStreamReader(conn.getInputStream()))) {
                             String response = br.readLine();
@@ -0,0 +1,284 @@
+import time
+import asyncio
+import logging
+
+import aiomysql
+import redis.asyncio as aioredis
+from quart import Quart, jsonify
+
+from common import DB_CONFIG, REDIS_CONFIG, DELAY_SECONDS, keyspace, WARMUP_TOP_N, WARMUP_CHUNK_SIZE
+from content_sql import INCREMENT_RETURNING_SQL
+from retry_policy import RetryPolicy, RetryExhausted, RetryDeadlineExceeded
+
+# --------------------
+# 1. 설정
+# --------------------
+# Flask 스레드 서버(app_*.py)와 같은 API 를 asyncio 이벤트 루프 하나로 처리하는 ASGI 버전입니다.
+# 요청마다 스레드를 점유하지 않으므로 50ms 지연(await asyncio.sleep) 동안에도
+# 수천 개의 요청을 동시에 처리할 수 있습니다.
+#
+# 실행: uvicorn app_async:app --host 0.0.0.0 --port 5000
+#   (또는 python app_async.py → Quart 개발 서버)
+
+DB_POOL_MIN_SIZE = 5
+DB_POOL_MAX_SIZE = 50     # 비동기에서도 DB 동시 연결 수는 제한 (초과 요청은 풀에서 대기)
+REDIS_MAX_CONNECTIONS = 200
+DEFAULT_STRATEGY = "incr"
+POST_LOCK_STRIPES = 64    # record_lock 전략의 게시글 락 개수 (게시글 수와 무관하게 고정)
+
+# cas 전략 재시도 정책 (app_cas.py 와 같은 값, 초과 시 409 / 마감 초과 시 503)
+CAS_MAX_ATTEMPTS = 50
+CAS_BACKOFF_BASE = 0.005
+CAS_BACKOFF_CAP = 0.5
+CAS_DEADLINE_SECONDS = 10.0
+
+cas_retry_policy = RetryPolicy(
+    max_attempts=CAS_MAX_ATTEMPTS,
+    base=CAS_BACKOFF_BASE,
+    cap=CAS_BACKOFF_CAP,
+    deadline=CAS_DEADLINE_SECONDS)
+
+app = Quart(__name__)
+logger = logging.getLogger(__name__)
+
+# before_serving 에서 이벤트 루프 위에 생성
+redis_client = None
+db_pool = None
+
+# 락 계열 전략용 asyncio 락 (스레드가 아니라 코루틴을 줄 세움)
+global_lock = asyncio.Lock()
+# 게시글마다 락을 만들면 처음 보는 게시글마다 테이블이 커지므로 striped_lock.py 처럼 고정 크기 배열에 해싱
+post_locks = [asyncio.Lock() for _ in range(POST_LOCK_STRIPES)]
+init_lock = asyncio.Lock()
+
+active_strategy = DEFAULT_STRATEGY
+
+
+def aiomysql_config():
+    # PyMySQL 설정 이름을 aiomysql 인자 이름으로 변환 (database → db)
+    config = dict(DB_CONFIG)
+    config["db"] = config.pop("database")
+    return config
+
+
+@app.before_serving
+async def startup():
+    global redis_client, db_pool
+    redis_client = aioredis.Redis(max_connections=REDIS_MAX_CONNECTIONS, **REDIS_CONFIG)
+    db_pool = await aiomysql.create_pool(minsize=DB_POOL_MIN_SIZE, maxsize=DB_POOL_MAX_SIZE, **aiomysql_config())
+    # 0 으로 초기화하지 않고 MySQL 상위 게시글로 캐시를 채운 뒤 요청을 받음 (warmup.py 와 같은 방식)
+    loaded = await warm_up()
+    logger.info(f"Async server ready (strategy: {active_strategy}, warmed up: {loaded})")
+
+
+async def warm_up():
+    loaded = 0
+    async with db_pool.acquire() as conn:
+        async with conn.cursor(aiomysql.SSCursor) as cursor:
+            await cursor.execute("SELECT id, view_count FROM content ORDER BY view_count DESC LIMIT %s",
+                                 (WARMUP_TOP_N,))
+            while True:
+                rows = await cursor.fetchmany(WARMUP_CHUNK_SIZE)
+                if not rows:
+                    break
+                pipe = redis_client.pipeline(transaction=False)
+                for post_id, view_count in rows:
+                    keyspace.set_nx(pipe, post_id, view_count)
+                loaded += sum(1 for created in await pipe.execute() if created)
+        await conn.commit()
+    return loaded
+
+
+@app.after_serving
+async def shutdown():
+    db_pool.close()
+    await db_pool.wait_closed()
+    await redis_client.aclose()
+
+
+async def db_read_count(cursor, post_id):
+    await cursor.execute("SELECT view_count FROM content WHERE id = %s", (post_id,))
+    row = await cursor.fetchone()
+    return row[0] if row else 0
+
+
+# --------------------
+# 2. 전략 (app_*.py 와 같은 순서의 로직을 비동기로 옮긴 것)
+# --------------------
+async def read_modify_write(post_id):
+    # Basic / Lock 계열 공통 본문: 캐시 읽기 → +1 → DB UPDATE → 지연 → 캐시 SET
+    async with db_pool.acquire() as conn:
+        async with conn.cursor() as cursor:
+            current = await keyspace.get(redis_client, post_id)
+            if current is None:
+                read_count = await db_read_count(cursor, post_id)
+                await keyspace.set(redis_client, post_id, read_count)
+            else:
+                read_count = int(current)
+            new_count = read_count + 1
+
+            await cursor.execute("UPDATE content SET view_count = view_count + 1 WHERE id = %s", (post_id,))
+            await conn.commit()
+
+            await asyncio.sleep(DELAY_SECONDS)
+            await keyspace.set(redis_client, post_id, new_count)
+            return new_count
+
+
+async def strategy_basic(post_id):
+    return await read_modify_write(post_id)
+
+
+async def strategy_lock(post_id):
+    async with global_lock:
+        return await read_modify_write(post_id)
+
+
+async def strategy_record_lock(post_id):
+    async with post_locks[hash(post_id) % POST_LOCK_STRIPES]:
+        return await read_modify_write(post_id)
+
+
+async def strategy_cas(post_id):
+    async with db_pool.acquire() as conn:
+        async with conn.cursor() as cursor:
+            started = time.monotonic()
+            attempt = 0
+            while True:
+                attempt += 1
+                try:
+                    async with redis_client.pipeline() as pipe:
+                        await pipe.watch(keyspace.key(post_id))
+                        current = await keyspace.get(pipe, post_id)
+                        read_count = int(current) if current is not None else await db_read_count(cursor, post_id)
+                        new_count = read_count + 1
+
+                        await asyncio.sleep(DELAY_SECONDS)
+
+                        pipe.multi()
+                        keyspace.set(pipe, post_id, new_count)
+                        await pipe.execute()
+
+                    await cursor.execute("UPDATE content SET view_count = %s WHERE id = %s", (new_count, post_id))
+                    await conn.commit()
+                    return new_count
+                except aioredis.WatchError:
+                    # 이벤트 루프를 막지 않도록 asyncio.sleep 으로 백오프 (한도를 넘으면 예외 → 409/503)
+                    await asyncio.sleep(cas_retry_policy.next_delay(attempt, started))
+
+
+async def strategy_incr(post_id):
+    current = await keyspace.incr(redis_client, post_id)
+    async with db_pool.acquire() as conn:
+        async with conn.cursor() as cursor:
+            await cursor.execute("UPDATE content SET view_count = view_count + 1 WHERE id = %s", (post_id,))
+            await conn.commit()
+    await asyncio.sleep(DELAY_SECONDS)
+    return current
+
+
+async def strategy_write_through(post_id, invalidate=False):
+    async with db_pool.acquire() as conn:
+        async with conn.cursor() as cursor:
+            # 증가 후 값을 같은 왕복에서 받음 (content_sql.py 의 LAST_INSERT_ID 관용구)
+            await cursor.execute(INCREMENT_RETURNING_SQL, (1, post_id))
+            final_count = cursor.lastrowid if cursor.rowcount else None
+            await conn.commit()
+            await asyncio.sleep(DELAY_SECONDS)
+            if invalidate:
+                await keyspace.delete(redis_client, post_id)
+            elif final_count is not None:
+                await keyspace.set(redis_client, post_id, final_count)
+            return final_count
+
+
+async def strategy_write_through_invalidate(post_id):
+    return await strategy_write_through(post_id, invalidate=True)
+
+
+async def strategy_dcl(post_id):
+    if not await keyspace.exists(redis_client, post_id):
+        async with init_lock:
+            if not await keyspace.exists(redis_client, post_id):
+                async with db_pool.acquire() as conn:
+                    async with conn.cursor() as cursor:
+                        init_count = await db_read_count(cursor, post_id)
+                await keyspace.set(redis_client, post_id, init_count)
+    return await strategy_incr(post_id)
+
+
+STRATEGIES = {
+    "basic": strategy_basic,
+    "lock": strategy_lock,
+    "record_lock": strategy_record_lock,
+    "cas": strategy_cas,
+    "incr": strategy_incr,
+    "write_through": strategy_write_through,
+    "write_through_invalidate": strategy_write_through_invalidate,
+    "dcl": strategy_dcl,
+}
+
+
+# --------------------
+# 3. API
+# --------------------
+async def run_strategy(name, post_id):
+    try:
+        final_count = await STRATEGIES[name](post_id)
+        return jsonify({
+            "status": "success",
+            "post_id": post_id,
+            "final_view_count_reported": final_count
+        })
+    except RetryExhausted as e:
+        logger.warning(f"CAS gave up: {e}")
+        return jsonify({"error": str(e)}), 409
+    except RetryDeadlineExceeded as e:
+        logger.warning(f"CAS deadline exceeded: {e}")
+        return jsonify({"error": str(e)}), 503, {"Retry-After": "1"}
+    except Exception as e:
+        # 트랜잭션 도중 실패한 연결은 aiomysql 풀이 반납 시 닫아버리므로 별도 롤백은 필요 없음
+        logger.error(f"Error: {e}", exc_info=True)
+        return jsonify({"error": str(e)}), 500
+
+
+@app.route('/api/view/increment/<int:post_id>', methods=['POST'])
+async def increment_view_count(post_id):
+    return await run_strategy(active_strategy, post_id)
+
+
+@app.route('/api/strategy/<name>/view/increment/<int:post_id>', methods=['POST'])
+async def increment_view_count_with(name, post_id):
+    if name not in STRATEGIES:
+        return jsonify({"error": f"Unknown strategy: {name}"}), 404
+    return await run_strategy(name, post_id)
+
+
+@app.route('/admin/strategy', methods=['GET'])
+async def get_strategy():
+    return jsonify({"active": active_strategy, "available": list(STRATEGIES)})
+
+
+@app.route('/admin/strategy/<name>', methods=['PUT', 'POST'])
+async def set_strategy(name):
+    global active_strategy
+    if name not in STRATEGIES:
+        return jsonify({"error": f"Unknown strategy: {name}", "available": list(STRATEGIES)}), 404
+    previous, active_strategy = active_strategy, name
+    return jsonify({"previous": previous, "active": name})
+
+
+@app.route('/api/pool/stats', methods=['GET'])
+async def pool_stats():
+    return jsonify({
+        "max_size": db_pool.maxsize,
+        "open": db_pool.size,
+        "idle": db_pool.freesize,
+        "in_use": db_pool.size - db_pool.freesize,
+        "utilization": round((db_pool.size - db_pool.freesize) / db_pool.maxsize, 4),
+    })
+
+
+if __name__ == '__main__':
+    logger.info("Starting Async (ASGI) API Server...")
+    app.run(host='0.0.0.0', port=5000, debug=False)
@@ -1,62 +1,165 @@
-import pymysql
 import redis
-from flask import Flask, jsonify
+from flask import Flask, jsonify, Response
 import time
 import logging
+from common import redis_client, keyspace, db_pool, log_sampler, cache_warmer, DELAY_SECONDS
+from retry_policy import RetryPolicy, RetryStats, RetryExhausted, RetryDeadlineExceeded
+from metrics import stage_metrics, CONTENT_TYPE
 
 # --------------------
-# 1. 설정
+# 1. 설정 - DB/Redis 접속 정보, 지연 시간 등 공통 설정은 common.py
 # --------------------
-DB_CONFIG = {
-    "user": "w11",
-    "password": "q1w2e3r4",
-    "host": "127.0.0.1",
-    "database": "w11_exam",
-    "autocommit": False
-}
-
-REDIS_CONFIG = {
-    "host": "127.0.0.1",
-    "port": 6379,
-    "decode_responses": True
-}
-
-POST_ID = 1
-CACHE_KEY = f"post:{POST_ID}:view_count"
-DELAY_SECONDS = 0.05
+# CAS 방식 선택
+#  - "watch": 기존 WATCH/GET/MULTI/SET/EXEC 재시도 루프 (충돌 시 처음부터 다시)
+#  - "lua"  : Redis 안에서 읽기-수정-쓰기를 Lua 스크립트(EVALSHA) 한 번으로 원자적으로 수행 (재시도 없음)
+CAS_MODE = "watch"
+
+# [watch 모드 재시도 정책]
+# 충돌 즉시 무한 재시도하면 경쟁 스레드들이 같은 박자로 Redis 를 두드리며 livelock 에 빠집니다.
+# 지수 백오프 + Full Jitter 로 재시도 시점을 흩뜨리고, 횟수/마감 시간을 넘기면 포기합니다.
+CAS_MAX_ATTEMPTS = 50        # 초과 시 409 Conflict (0 이면 무제한)
+CAS_BACKOFF_BASE = 0.005     # 첫 재시도 최대 대기 5ms, 이후 2배씩
+CAS_BACKOFF_CAP = 0.5        # 한 번에 쉬는 최대 시간
+CAS_DEADLINE_SECONDS = 10.0  # 요청 전체 마감, 초과 시 503 (0 이면 무제한)
+
+cas_retry_policy = RetryPolicy(
+    max_attempts=CAS_MAX_ATTEMPTS,
+    base=CAS_BACKOFF_BASE,
+    cap=CAS_BACKOFF_CAP,
+    deadline=CAS_DEADLINE_SECONDS)
+# 요청별 재시도 횟수 분포 (/api/cas/stats)
+cas_retry_stats = RetryStats()
 
 app = Flask(__name__)
-redis_client = redis.Redis(**REDIS_CONFIG)
 
-logging.basicConfig(level=logging.INFO, format='%(asctime)s - (%(threadName)s) - %(message)s')
 logger = logging.getLogger(__name__)
 
+# 단계별 지연 히스토그램 (/metrics). cas_attempt 는 WATCH ~ EXEC 한 번(성공/충돌 모두)
+stages = stage_metrics.recorder("cas")
+lua_stages = stage_metrics.recorder("cas_lua")
+
+# [Lua Read-Modify-Write 스크립트]
+# Redis 는 스크립트를 실행하는 동안 다른 명령을 끼워넣지 않으므로 GET → 계산 → SET 전체가 원자적입니다.
+# 키가 없으면(cold) 'cold' 를 돌려주고, 호출자가 MySQL 값을 ARGV[3] 으로 넘겨 다시 호출하면 그 값에서 시작합니다.
+#
+# KEYS[1]: 조회수 키 (string 키 또는 hash 버킷 키)
+# ARGV[1]: hash 필드 ('' 이면 string 키)
+# ARGV[2]: 더할 값
+# ARGV[3]: 키가 없을 때 시작값으로 쓸 MySQL 값 ('' 이면 'cold' 반환)
+RMW_SCRIPT = """
+local field = ARGV[1]
+local cur
+if field == '' then
+  cur = redis.call('GET', KEYS[1])
+else
+  cur = redis.call('HGET', KEYS[1], field)
+end
+if not cur then
+  if ARGV[3] == '' then
+    return {'cold'}
+  end
+  cur = ARGV[3]
+end
+local new = tonumber(cur) + tonumber(ARGV[2])
+if field == '' then
+  redis.call('SET', KEYS[1], new)
+else
+  redis.call('HSET', KEYS[1], field, new)
+end
+return {'ok', new}
+"""
+# register_script 는 EVALSHA 로 호출하고, 서버에 스크립트가 없으면(NOSCRIPT) 자동으로 로드합니다.
+rmw_script = redis_client.register_script(RMW_SCRIPT)
+
+
+def redis_rmw(post_id, amount, load_seed=None):
+    """
+    Lua 스크립트로 원자적 읽기-수정-쓰기를 수행하고 (상태, 값) 을 반환합니다.
+    키가 비어 있으면 load_seed() 로 MySQL 값을 읽어 한 번 더 호출합니다.
+    """
+    key, field = keyspace.location(post_id)
+    result = rmw_script(keys=[key], args=[field, amount, ""])
+    if result[0] == "cold" and load_seed is not None:
+        result = rmw_script(keys=[key], args=[field, amount, load_seed()])
+    return result[0], (int(result[1]) if len(result) > 1 else None)
+
+
+def increment_view_count_lua(post_id):
+    db_conn = None
+    try:
+        with lua_stages.time("db_connect"):
+            db_conn = db_pool.acquire()
+        db_cursor = db_conn.cursor()
+
+        def load_seed():
+            db_cursor.execute("SELECT view_count FROM content WHERE id = %s", (post_id,))
+            row = db_cursor.fetchone()
+            return row[0] if row else 0
+
+        # 1. Redis 안에서 +1 (충돌이 날 구간 자체가 없으므로 재시도 없음)
+        with lua_stages.time("redis_rmw"):
+            _, new_count = redis_rmw(post_id, 1, load_seed=load_seed)
+
+        # (지연 시간 - 이제는 정합성에 영향 없음)
+        with lua_stages.time("delay"):
+            time.sleep(DELAY_SECONDS)
+
+        # 2. DB 업데이트
+        # 스레드마다 커밋 순서가 Redis 순서와 다를 수 있으므로, 더 작은 값으로 되돌아가지 않도록 GREATEST 사용
+        with lua_stages.time("db_write"):
+            db_cursor.execute("UPDATE content SET view_count = GREATEST(view_count, %s) WHERE id = %s", (new_count, post_id))
+            db_conn.commit()
+
+        return jsonify({
+            "status": "success",
+            "post_id": post_id,
+            "final_view_count_reported": new_count
+        })
+
+    except Exception as e:
+        logger.error(f"Error: {e}")
+        if db_conn:
+            try: db_conn.rollback()
+            except: pass
+        return jsonify({"error": str(e)}), 500
+    finally:
+        db_pool.release(db_conn)
+
 @app.route('/api/view/increment/<int:post_id>', methods=['POST'])
 def increment_view_count(post_id):
-    if post_id != POST_ID:
-        return jsonify({"error": "Invalid Post ID"}), 400
+    if CAS_MODE == "lua":
+        return increment_view_count_lua(post_id)
 
     db_conn = None
     final_count = 0
+    attempt = 0
+    backoff_total = 0.0
+    started = time.monotonic()
 
     try:
         # DB 연결 (성공 후 쓰기를 위해 미리 연결하거나, 루프 안에서 연결할 수도 있음)
-        db_conn = pymysql.connect(**DB_CONFIG)
+        with stages.time("db_connect"):
+            db_conn = db_pool.acquire()
         db_cursor = db_conn.cursor()
 
-        # [CAS 루프] 성공할 때까지 무한 반복
+        # [CAS 루프] 성공할 때까지 반복 (단, 재시도 정책의 횟수/마감 시간 안에서)
         while True:
+            attempt += 1
+            attempt_started = time.perf_counter()
             try:
                 # 1. 감시 시작 (Redis Watch)
                 with redis_client.pipeline() as pipe:
-                    pipe.watch(CACHE_KEY)
+                    # (hash 인코딩에서는 버킷 키 전체를 감시하므로 같은 버킷의 다른 게시글과도 충돌로 잡힘)
+                    pipe.watch(keyspace.key(post_id))
                     
                     # 2. 값 읽기 (READ)
-                    current_val = pipe.get(CACHE_KEY)
+                    with stages.time("redis_read"):
+                        current_val = keyspace.get(pipe, post_id)
                     if current_val is None:
                         # 캐시가 비었으면 DB에서 초기값을 가져와야 안전함
-                        db_cursor.execute("SELECT view_count FROM content WHERE id = %s", (post_id,))
-                        row = db_cursor.fetchone()
+                        with stages.time("db_read"):
+                            db_cursor.execute("SELECT view_count FROM content WHERE id = %s", (post_id,))
+                            row = db_cursor.fetchone()
                         read_count = row[0] if row else 0
                     else:
                         read_count = int(current_val)
@@ -65,14 +168,19 @@ def increment_view_count(post_id):
                     new_count = read_count + 1
                     
                     # (불일치 유발을 위한 지연 시간)
-                    time.sleep(DELAY_SECONDS)
+                    with stages.time("delay"):
+                        time.sleep(DELAY_SECONDS)
 
                     # 4. Redis 저장 시도 (WRITE / Check-And-Set)
                     pipe.multi()
-                    pipe.set(CACHE_KEY, new_count)
+                    keyspace.set(pipe, post_id, new_count)
                     
-                    # execute() 실행 순간, Redis는 그 사이에 누가 CACHE_KEY를 건드렸는지 확인
-                    pipe.execute()
+                    # execute() 실행 순간, Redis는 그 사이에 누가 이 게시글의 키를 건드렸는지 확인
+                    try:
+                        with stages.time("cache_write"):
+                            pipe.execute()
+                    finally:
+                        stages.since("cas_attempt", attempt_started)
                     
                     # ====================================================
                     # [중요] 여기까지 에러 없이 왔다면, 내가 '경쟁에서 승리'한 것임.
@@ -82,28 +190,43 @@ def increment_view_count(post_id):
                     # 5. DB 업데이트
                     # 이미 Redis CAS를 통해 '순서'가 정해졌으므로, 
                     # DB에는 계산된 new_count를 그대로 덮어써도 안전함.
-                    db_cursor.execute("UPDATE content SET view_count = %s WHERE id = %s", (new_count, post_id))
-                    db_conn.commit()
+                    with stages.time("db_write"):
+                        db_cursor.execute("UPDATE content SET view_count = %s WHERE id = %s", (new_count, post_id))
+                        db_conn.commit()
 
                     final_count = new_count
-                    logger.info(f"Success (CAS): Redis & DB updated to {new_count}")
+                    log_sampler.logger(logger, "request").info("Success (CAS): Redis & DB updated to %s", new_count)
                     
                     # 성공했으면 루프 탈출!
                     break
 
             except redis.WatchError:
                 # [실패 시] 누군가 먼저 선수침 -> 재시도
-                logger.warning("Conflict! Retrying CAS...")
+                # 바로 다시 뛰어들지 않고 백오프 (한도를 넘으면 예외 → 409/503)
+                # 충돌마다 남기면 로그가 재시도 수만큼 늘어나므로 1/N 만 남김
+                if log_sampler.sample("cas_conflict"):
+                    logger.warning("Conflict! Retrying CAS... (attempt %d)", attempt)
+                with stages.time("cas_backoff"):
+                    backoff_total += cas_retry_policy.wait(attempt, started)
                 continue
-                
+
+        cas_retry_stats.record("success", attempt, backoff_total)
+
+    except RetryExhausted as e:
+        cas_retry_stats.record("exhausted", attempt, backoff_total)
+        logger.warning(f"CAS gave up: {e}")
+        return jsonify({"error": str(e), "attempts": attempt}), 409
+    except RetryDeadlineExceeded as e:
+        cas_retry_stats.record("deadline", attempt, backoff_total)
+        logger.warning(f"CAS gave up: {e}")
+        return jsonify({"error": str(e), "attempts": attempt}), 503, {"Retry-After": "1"}
     except Exception as e:
         logger.error(f"Error: {e}")
         if db_conn:
             db_conn.rollback()
         return jsonify({"error": str(e)}), 500
     finally:
-        if db_conn:
-            db_conn.close()
+        db_pool.release(db_conn)
 
     return jsonify({
         "status": "success",
@@ -111,7 +234,22 @@ def increment_view_count(post_id):
         "final_view_count_reported": final_count
     })
 
+@app.route('/api/cas/stats', methods=['GET'])
+def cas_stats():
+    # 요청별 재시도 횟수 / 백오프 시간 분포, 포기한 요청 수
+    return jsonify(cas_retry_stats.snapshot())
+
+@app.route('/metrics', methods=['GET'])
+def metrics():
+    # 단계별 지연 히스토그램 (Prometheus 텍스트 형식)
+    return Response(stage_metrics.prometheus(), content_type=CONTENT_TYPE)
+
+@app.route('/api/pool/stats', methods=['GET'])
+def pool_stats():
+    # DB 연결 풀 대기 시간 / 사용률 (풀 크기 산정용)
+    return jsonify(db_pool.stats())
+
 if __name__ == '__main__':
-    logger.info("Starting API Server with Full CAS (Redis + DB Write)...")
-    redis_client.set(CACHE_KEY, 0)
+    logger.info(f"Starting API Server with Full CAS (Redis + DB Write, mode={CAS_MODE})...")
+    cache_warmer.run()
     app.run(host='0.0.0.0', port=5000, threaded=True, debug=False)
@@ -1,99 +1,119 @@
-import pymysql
-import redis
-from flask import Flask, jsonify
+from flask import Flask, jsonify, Response
 import time
 import logging
+from common import redis_client, keyspace, db_pool, lease_locks, cache_warmer, DELAY_SECONDS
+from single_flight import SingleFlight
+from metrics import stage_metrics, CONTENT_TYPE
 from threading import Lock
 
 # --------------------
-# 1. 설정
+# 1. 설정 - DB/Redis 접속 정보, 지연 시간 등 공통 설정은 common.py
 # --------------------
-DB_CONFIG = {
-    "user": "w11",
-    "password": "q1w2e3r4",
-    "host": "127.0.0.1",
-    "database": "w11_exam",
-    "autocommit": False
-}
-
-REDIS_CONFIG = {
-    "host": "127.0.0.1",
-    "port": 6379,
-    "decode_responses": True
-}
-
-POST_ID = 1
-CACHE_KEY = f"post:{POST_ID}:view_count"
-DELAY_SECONDS = 0.05
-
 app = Flask(__name__)
-redis_client = redis.Redis(**REDIS_CONFIG)
 
-# [핵심] 초기화(Cache Miss) 시점의 중복 DB 조회를 막기 위한 락
-# 전체 로직을 잠그는 것이 아니라, '데이터 로딩' 순간만 잠급니다.
-init_lock = Lock()
+# [핵심] 초기화(Cache Miss) 시점의 중복 DB 조회를 막는 키별 single-flight 로더
+# 예전에는 글로벌 init_lock 하나로 모든 게시글의 캐시 미스를 줄 세웠지만,
+# 이제는 같은 게시글의 미스만 하나의 DB 조회(Future)를 나눠 받고, 다른 게시글은 병렬로 로딩합니다.
+cache_loader = SingleFlight()
+
+# True 면 로딩을 Redis 임대 락(common.lease_locks)으로도 감싸서,
+# 여러 워커/호스트에서 같은 게시글을 동시에 미스해도 DB 조회는 한 번만 일어납니다.
+FILL_LEASE = False
+
+# 캐시에 키가 있을 때만 증가 (EXISTS + INCR 를 한 번의 왕복으로). 없으면 nil → 로딩 후 재시도
+# KEYS[1] = 키, ARGV[1] = 해시 필드 ('' 이면 문자열 키), ARGV[2] = 증가량
+INCR_IF_EXISTS_SCRIPT = """
+if ARGV[1] == '' then
+    if redis.call('EXISTS', KEYS[1]) == 1 then
+        return redis.call('INCRBY', KEYS[1], ARGV[2])
+    end
+elseif redis.call('HEXISTS', KEYS[1], ARGV[1]) == 1 then
+    return redis.call('HINCRBY', KEYS[1], ARGV[1], ARGV[2])
+end
+return false
+"""
+incr_if_exists_script = redis_client.register_script(INCR_IF_EXISTS_SCRIPT)
+
+# 히트 / 미스 횟수 (로딩 합치기 통계는 cache_loader.stats())
+stats_lock = Lock()
+cache_stats = {"hits": 0, "misses": 0}
 
-logging.basicConfig(level=logging.INFO, format='%(asctime)s - (%(threadName)s) - %(message)s')
 logger = logging.getLogger(__name__)
 
+# 단계별 지연 히스토그램 (/metrics). cache_fill 은 미스 시 로딩을 기다린 시간 (합쳐진 요청 포함)
+stages = stage_metrics.recorder("dcl")
+
+def incr_if_exists(post_id):
+    key, field = keyspace.location(post_id)
+    return incr_if_exists_script(keys=[key], args=[field, 1])
+
+
+def load_from_db(post_id):
+    # 리더 한 명만 실행. 임대 락 안에서 한 번 더 확인 (다른 프로세스가 먼저 채웠을 수 있음)
+    if keyspace.exists(redis_client, post_id):
+        return
+    logger.info("Cache Miss! Loading post %s from DB (single-flight)", post_id)
+    with db_pool.connection() as temp_conn:
+        temp_cursor = temp_conn.cursor()
+        temp_cursor.execute("SELECT view_count FROM content WHERE id = %s", (post_id,))
+        row = temp_cursor.fetchone()
+        init_count = row[0] if row else 0
+    # SET NX: 그 사이 누군가 채우고 증가시켰다면 덮어쓰지 않음
+    keyspace.set_nx(redis_client, post_id, init_count)
+    logger.info("Cache Initialized to %s", init_count)
+
+
+def fill_cache(post_id):
+    if FILL_LEASE:
+        with lease_locks.hold(f"fill:{post_id}"):
+            load_from_db(post_id)
+    else:
+        load_from_db(post_id)
+
 # --------------------
 # 2. 핵심 로직: Double-Checked Locking 적용
 # --------------------
 @app.route('/api/view/increment/<int:post_id>', methods=['POST'])
 def increment_view_count(post_id):
-    if post_id != POST_ID:
-        return jsonify({"error": "Invalid Post ID"}), 400
-
     db_conn = None
     final_count = 0
 
     try:
         # ====================================================
-        # [Step 1] Double-Checked Locking (초기값 안전 로딩)
-        # ====================================================
-        
-        # 1-1. [Check 1] 락 없이 먼저 확인 (대부분 여기서 통과되어 성능 좋음)
-        if not redis_client.exists(CACHE_KEY):
-            
-            # 1-2. 캐시가 없다면 락 획득 (줄 서기)
-            with init_lock:
-                # 1-3. [Check 2] 락 안에서 한 번 더 확인 (Double Check)
-                # 내가 줄 서는 동안 앞사람이 채워놨을 수 있으므로 필수!
-                if not redis_client.exists(CACHE_KEY):
-                    
-                    logger.info("Cache Miss! Loading from DB (Protected by DCL)")
-                    
-                    # 1-4. DB에서 초기값 로딩 (단 한 명만 실행됨)
-                    # 여기서는 로딩을 위해 잠시 DB 연결
-                    temp_conn = pymysql.connect(**DB_CONFIG)
-                    temp_cursor = temp_conn.cursor()
-                    temp_cursor.execute("SELECT view_count FROM content WHERE id = %s", (post_id,))
-                    row = temp_cursor.fetchone()
-                    init_count = row[0] if row else 0
-                    temp_conn.close()
-                    
-                    # 1-5. 캐시 초기화
-                    redis_client.set(CACHE_KEY, init_count)
-                    logger.info(f"Cache Initialized to {init_count}")
-        
-        # ====================================================
-        # [Step 2] 조회수 증가 (Atomic Operation)
+        # [Step 1] 조회수 증가 (캐시가 있으면 여기서 끝, 왕복 한 번)
         # ====================================================
-        # 위 DCL 덕분에 캐시 키가 존재한다는 것이 100% 보장됨.
-        # 이제 안전하게 원자적 증가(INCR) 실행.
-        
-        final_count = redis_client.incr(CACHE_KEY)
-        
+        with stages.time("redis_incr"):
+            final_count = incr_if_exists(post_id)
+
+        if final_count is None:
+            # ====================================================
+            # [Step 2] 캐시 미스: 같은 게시글의 동시 미스는 DB 조회 하나를 공유
+            # ====================================================
+            with stats_lock:
+                cache_stats["misses"] += 1
+            with stages.time("cache_fill"):
+                cache_loader.do(post_id, lambda: fill_cache(post_id))
+
+            # 로딩 이후에는 키가 존재하므로 원자적 증가(INCR) 실행
+            with stages.time("redis_incr"):
+                final_count = keyspace.incr(redis_client, post_id)
+        else:
+            with stats_lock:
+                cache_stats["hits"] += 1
+
         # [Step 3] DB 비동기/동기 업데이트 (Write-Back or Atomic Update)
         # 여기서는 DB도 원자적 쿼리로 안전하게 증가
-        db_conn = pymysql.connect(**DB_CONFIG)
+        with stages.time("db_connect"):
+            db_conn = db_pool.acquire()
         db_cursor = db_conn.cursor()
         
-        db_cursor.execute("UPDATE content SET view_count = view_count + 1 WHERE id = %s", (post_id,))
-        db_conn.commit()
+        with stages.time("db_write"):
+            db_cursor.execute("UPDATE content SET view_count = view_count + 1 WHERE id = %s", (post_id,))
+            db_conn.commit()
 
         # (테스트를 위한 지연)
-        time.sleep(DELAY_SECONDS)
+        with stages.time("delay"):
+            time.sleep(DELAY_SECONDS)
 
         return jsonify({
             "status": "success",
@@ -108,15 +128,31 @@ def increment_view_count(post_id):
             except: pass
         return jsonify({"error": str(e)}), 500
     finally:
-        if db_conn:
-            db_conn.close()
+        db_pool.release(db_conn)
+
+@app.route('/metrics', methods=['GET'])
+def metrics():
+    # 단계별 지연 히스토그램 (Prometheus 텍스트 형식)
+    return Response(stage_metrics.prometheus(), content_type=CONTENT_TYPE)
+
+@app.route('/api/pool/stats', methods=['GET'])
+def pool_stats():
+    # DB 연결 풀 대기 시간 / 사용률 (풀 크기 산정용)
+    return jsonify(db_pool.stats())
+
+@app.route('/api/dcl/stats', methods=['GET'])
+def dcl_stats():
+    # 캐시 히트/미스 및 합쳐진(coalesced) 로딩 수
+    with stats_lock:
+        stats = dict(cache_stats)
+    stats["loader"] = cache_loader.stats()
+    return jsonify(stats)
 
 if __name__ == '__main__':
     logger.info("Starting API Server with Double-Checked Locking Pattern...")
     
-    # [테스트 환경 설정]
-    # DCL 동작을 확인하기 위해, 시작할 때 캐시를 일부러 지웁니다.
-    redis_client.delete(CACHE_KEY)
-    logger.info("Cache cleared to test Double-Checked Locking.")
+    # 캐시를 지우고 시작하면 첫 요청들이 모두 DCL 로딩에 줄을 서므로, 상위 게시글은 미리 채워 둡니다.
+    # 워밍업 범위 밖의 게시글은 그대로 DCL 경로로 채워집니다.
+    cache_warmer.run()
     
     app.run(host='0.0.0.0', port=5000, threaded=True, debug=False)
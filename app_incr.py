@@ -1,71 +1,231 @@
-import pymysql
-import redis
-from flask import Flask, jsonify
+from flask import Flask, jsonify, request, Response
 import time
+import socket
 import logging
+import pymysql
+import redis
+from common import redis_client, keyspace, db_pool, log_sampler, cache_warmer, hot_keys, unique_viewers, view_buckets
+from common import DELAY_SECONDS, TIME_BUCKETS
+from write_behind import WriteBehindFlusher
+from counter_buffer import CounterBuffer
+from metrics import stage_metrics, CONTENT_TYPE
+from db_pool import PoolTimeout
+import journal as journal_metrics
+from journal import Journal, JournalReplayer, SINK_ALL, SINK_MYSQL
 
 # --------------------
-# 1. 설정 (Configuration)
+# 1. 설정 (Configuration) - DB/Redis 접속 정보, 지연 시간 등 공통 설정은 common.py
 # --------------------
-DB_CONFIG = {
-    "user": "w11",
-    "password": "q1w2e3r4",
-    "host": "127.0.0.1",
-    "database": "w11_exam",
-    "autocommit": False
-}
-
-REDIS_CONFIG = {
-    "host": "127.0.0.1",
-    "port": 6379,
-    "decode_responses": True
-}
-
-POST_ID = 1
-CACHE_KEY = f"post:{POST_ID}:view_count"
-DELAY_SECONDS = 0.05
+# Write-Behind 모드 설정
+# True 이면 요청 경로에서는 Redis INCR 만 수행하고, DB 반영은 백그라운드 플러셔가 모아서 처리합니다.
+WRITE_BEHIND = False
+FLUSH_INTERVAL_SECONDS = 1.0   # 누적 증가분을 DB에 반영하는 주기
+MAX_FLUSH_LAG_SECONDS = 10.0   # 플러시가 이보다 오래 멈추면 요청 경로가 동기 UPDATE 로 전환
+INFLIGHT_POLICY = "exactly_once"  # exactly_once / at_least_once / discard (write_behind.py 참고)
+
+# 프로세스 내 집계 버퍼 설정 (핫한 게시글용)
+# True 이면 요청마다 Redis INCR 을 하지 않고 스레드별 stripe 에 모았다가 주기적으로 INCRBY 합니다.
+# 응답의 final_view_count_reported 는 근사값이 됩니다. (정확도 범위는 counter_buffer.py 참고)
+COUNTER_BUFFER = False
+BUFFER_STRIPES = 16
+BUFFER_FLUSH_INTERVAL_SECONDS = 0.005  # 5ms
+
+# 장애 우회 저널 설정 (journal.py)
+# True 이면 Redis/MySQL 연결 장애 시 증가분을 로컬 저널에 덧붙이고 바로 202 로 응답합니다.
+# 한 번 장애를 만나면 저널을 다 비울 때까지 요청은 백엔드를 건너뛰고 저널에만 씁니다 (죽은 백엔드에 줄 서지 않음).
+JOURNAL = False
+JOURNAL_DIR = "journal"
+JOURNAL_FSYNC = "interval"             # always / group / interval
+JOURNAL_FSYNC_INTERVAL_SECONDS = 0.005  # group / interval 의 fsync 주기
+JOURNAL_SEGMENT_BYTES = 64 * 1024 * 1024
+JOURNAL_NAME = socket.gethostname()     # 반영 오프셋 키 (호스트마다 고유해야 함)
+REPLAY_BATCH_SIZE = 1000
+REPLAY_INTERVAL_SECONDS = 0.5
+
+# 저널로 우회할 장애 (그 외 예외는 기존처럼 500)
+BACKEND_ERRORS = (redis.exceptions.ConnectionError, redis.exceptions.TimeoutError,
+                  pymysql.err.OperationalError, pymysql.err.InterfaceError, PoolTimeout)
+
+MAX_VIEWER_ID_LENGTH = 128  # 순 방문자 집계용 viewer_id 최대 길이
+
+MAX_BATCH_ITEMS = 1000  # 배치 증가 API 한 번에 받을 수 있는 최대 (post_id, delta) 쌍 수
 
 app = Flask(__name__)
-redis_client = redis.Redis(**REDIS_CONFIG)
 
-logging.basicConfig(level=logging.INFO, format='%(asctime)s - (%(threadName)s) - %(message)s')
+write_behind = WriteBehindFlusher(
+    redis_client, db_pool, keyspace,
+    flush_interval=FLUSH_INTERVAL_SECONDS,
+    max_lag=MAX_FLUSH_LAG_SECONDS,
+    inflight_policy=INFLIGHT_POLICY,
+    hot_keys=hot_keys)
+
+# Write-Behind 와 함께 쓰면 버퍼 플러시 파이프라인에 미반영 증가분(delta) 기록도 같이 실립니다.
+# 시간대별 버킷도 플러시 파이프라인에서 기록합니다 (플러시 시각의 분으로, 최대 flush_interval 늦음).
+def on_buffer_flush(pipe, post_id, n):
+    if WRITE_BEHIND:
+        write_behind.queue_delta(pipe, post_id, n)
+    if TIME_BUCKETS:
+        view_buckets.add(pipe, post_id, n)
+
+counter_buffer = CounterBuffer(
+    redis_client, keyspace,
+    stripes=BUFFER_STRIPES,
+    flush_interval=BUFFER_FLUSH_INTERVAL_SECONDS,
+    on_flush=on_buffer_flush if WRITE_BEHIND or TIME_BUCKETS else None,
+    hot_keys=hot_keys)
+
+journal = journal_replayer = None
+if JOURNAL:
+    journal = Journal(JOURNAL_DIR, segment_bytes=JOURNAL_SEGMENT_BYTES, fsync=JOURNAL_FSYNC,
+                      group_commit_interval=JOURNAL_FSYNC_INTERVAL_SECONDS)
+    journal_replayer = JournalReplayer(journal, redis_client, db_pool, keyspace, JOURNAL_NAME,
+                                       batch_size=REPLAY_BATCH_SIZE, interval=REPLAY_INTERVAL_SECONDS,
+                                       view_buckets=view_buckets if TIME_BUCKETS else None)
+
 logger = logging.getLogger(__name__)
 
+# 단계별 지연 히스토그램 (/metrics)
+stages = stage_metrics.recorder("incr")
+
 # --------------------
 # 2. 핵심 API 로직 (원자적 연산 버전)
 # --------------------
+def journal_append(post_id, delta, sinks, error=None):
+    # 백엔드 장애: 증가분을 로컬 저널에 남김 (재반영은 JournalReplayer)
+    if error is not None:
+        if not journal.degraded:
+            logger.warning(f"Backend unavailable, switching to journal: {error}")
+        journal.enter_degraded()
+    return journal.append(post_id, delta, sinks)
+
+def journaled(post_id, sinks, error=None, delta=1):
+    offset = journal_append(post_id, delta, sinks, error)
+    return jsonify({
+        "status": "journaled",
+        "post_id": post_id,
+        "journal_offset": offset,
+        "final_view_count_reported": None
+    }), 202
+
+def journaled_batch(deltas, sinks, error=None):
+    # 배치는 게시글마다 (post_id, delta) 레코드 하나씩
+    return jsonify({
+        "status": "journaled",
+        "results": [
+            {"post_id": post_id, "delta": delta, "journal_offset": journal_append(post_id, delta, sinks, error),
+             "final_view_count_reported": None}
+            for post_id, delta in deltas.items()
+        ]
+    }), 202
+
+def parse_viewer_id():
+    # ?viewer_id=... 또는 JSON 본문 {"viewer_id": ...}. 없으면 None (조회수만 셈)
+    viewer_id = request.args.get("viewer_id")
+    if viewer_id is None:
+        payload = request.get_json(silent=True)
+        if isinstance(payload, dict) and payload.get("viewer_id") is not None:
+            viewer_id = str(payload["viewer_id"])
+    if viewer_id is not None and not 0 < len(viewer_id) <= MAX_VIEWER_ID_LENGTH:
+        raise ValueError(f"viewer_id must be 1-{MAX_VIEWER_ID_LENGTH} characters")
+    return viewer_id
+
+def add_viewer_separately(add_viewer):
+    # 요청마다 Redis 증가를 하지 않는 경로(집계 버퍼)용: PFADD 만 따로 보냄
+    pipe = redis_client.pipeline(transaction=False)
+    add_viewer(pipe)
+    pipe.execute()
+
 @app.route('/api/view/increment/<int:post_id>', methods=['POST'])
 def increment_view_count(post_id):
-    if post_id != POST_ID:
-        return jsonify({"error": "Invalid Post ID"}), 400
+    try:
+        viewer_id = parse_viewer_id()
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    # viewer_id 가 있으면 INCR 과 같은 파이프라인에 PFADD 를 붙임 (순 방문자 HyperLogLog)
+    add_viewer = None
+    if viewer_id is not None:
+        add_viewer = lambda pipe: unique_viewers.add(pipe, post_id, viewer_id)
+    # INCR 과 같은 파이프라인에 붙일 명령: 분 단위 버킷 + PFADD (집계 버퍼 경로의 버킷은 플러시에서 기록)
+    extra = None
+    if TIME_BUCKETS or add_viewer:
+        def extra(pipe):
+            if TIME_BUCKETS:
+                view_buckets.add(pipe, post_id)
+            if add_viewer:
+                add_viewer(pipe)
+
+    # (저널 경로는 조회수만 남김: 순 방문자는 근사값이라 장애 중 누락은 감수)
+    if JOURNAL and journal.degraded:
+        return journaled(post_id, SINK_ALL)
+
+    # [Write-Behind 모드] 요청 경로에서는 Redis 만 증가시키고 DB 반영은 플러셔에게 맡깁니다.
+    # 플러셔가 MAX_FLUSH_LAG_SECONDS 이상 멈춰 있으면 아래의 기존 동기 경로로 처리합니다.
+    # (집계 버퍼를 쓰는 경우 버퍼 플러시가 delta 를 함께 기록하므로 동기 경로로 돌아가지 않습니다)
+    if WRITE_BEHIND and (COUNTER_BUFFER or not write_behind.lagging()):
+        try:
+            with stages.time("redis_incr"):
+                if COUNTER_BUFFER:
+                    current_redis_count = counter_buffer.add(post_id)
+                    if add_viewer:
+                        add_viewer_separately(add_viewer)
+                else:
+                    current_redis_count = write_behind.record(post_id, extra=extra)
+            with stages.time("delay"):
+                time.sleep(DELAY_SECONDS)
+            return jsonify({
+                "status": "success",
+                "post_id": post_id,
+                "final_view_count_reported": current_redis_count
+            })
+        except BACKEND_ERRORS as e:
+            if not JOURNAL:
+                logger.error(f"Error: {e}", exc_info=True)
+                return jsonify({"error": str(e)}), 500
+            return journaled(post_id, SINK_ALL, e)
+        except Exception as e:
+            logger.error(f"Error: {e}", exc_info=True)
+            return jsonify({"error": str(e)}), 500
 
     db_conn = None
+    redis_done = False  # Redis 증가까지 끝났으면 저널에는 MySQL 반영분만 남김
     try:
         # [특징] Python 코드 레벨의 Lock(global_lock 등)이 없습니다.
         # 따라서 스레드들은 여기서 병목 없이 쭉쭉 진입합니다.
 
-        db_conn = pymysql.connect(**DB_CONFIG)
+        with stages.time("db_connect"):
+            db_conn = db_pool.acquire()
         db_cursor = db_conn.cursor()
 
         # (1) Redis Atomic Increment
         # 읽기(Get)와 쓰기(Set)를 쪼개지 않고, "증가시켜(Incr)" 명령 하나로 처리합니다.
         # Redis는 싱글 스레드이므로 이 명령은 무조건 순차적으로 정확히 실행됩니다.
         # 리턴값은 증가된 후의 최신 값입니다.
-        current_redis_count = redis_client.incr(CACHE_KEY)
-        logger.info(f"Redis INCR Result: {current_redis_count}")
+        # (집계 버퍼 모드에서는 로컬 stripe 에 +1 하고 근사 누적값을 받습니다)
+        # (HOT_KEY_SHARDING 이면 핫 게시글은 여러 분산 키 중 하나를 증가시키고 합계를 받습니다)
+        with stages.time("redis_incr"):
+            if COUNTER_BUFFER:
+                current_redis_count = counter_buffer.add(post_id)
+                if add_viewer:
+                    add_viewer_separately(add_viewer)
+            else:
+                current_redis_count = hot_keys.incr(post_id, extra=extra)
+        redis_done = True
+        log_sampler.logger(logger, "request").info("Redis INCR Result: %s", current_redis_count)
 
         # (2) DB Atomic Update
         # Python에서 값을 계산해서 넣는 것이 아니라(%s 사용 안 함),
         # DB 엔진에게 "현재 값에 1을 더해라"라고 쿼리로 명령합니다.
         # DB는 이 행(Row)을 업데이트하는 순간 자동으로 락을 걸어 충돌을 방지합니다.
-        db_cursor.execute("UPDATE content SET view_count = view_count + 1 WHERE id = %s", (post_id,))
-        db_conn.commit()
+        with stages.time("db_write"):
+            db_cursor.execute("UPDATE content SET view_count = view_count + 1 WHERE id = %s", (post_id,))
+            db_conn.commit()
         
         # (3) 지연 시간 (테스트용)
         # 이제는 이 지연 시간이 있어도 데이터 정합성에 아무런 영향을 주지 않습니다.
         # 이미 Redis와 DB는 각자 알아서 1을 증가시켰기 때문입니다.
         # 다만 응답 속도(Latency)만 0.05초 늦어질 뿐입니다.
-        time.sleep(DELAY_SECONDS)
+        with stages.time("delay"):
+            time.sleep(DELAY_SECONDS)
 
         # (4) 결과 반환
         return jsonify({
@@ -74,6 +234,14 @@ def increment_view_count(post_id):
             "final_view_count_reported": current_redis_count
         })
 
+    except BACKEND_ERRORS as e:
+        if db_conn:
+            try: db_conn.rollback()
+            except: pass
+        if not JOURNAL:
+            logger.error(f"Error: {e}", exc_info=True)
+            return jsonify({"error": str(e)}), 500
+        return journaled(post_id, SINK_MYSQL if redis_done else SINK_ALL, e)
     except Exception as e:
         logger.error(f"Error: {e}", exc_info=True)
         if db_conn:
@@ -81,18 +249,179 @@ def increment_view_count(post_id):
             except: pass
         return jsonify({"error": str(e)}), 500
     finally:
+        db_pool.release(db_conn)
+
+# --------------------
+# 3. 배치 증가 API
+# --------------------
+# 엣지에서 모아둔 조회 이벤트를 한 번에 반영합니다.
+# 요청 본문: {"increments": [[post_id, delta], ...]} 또는 {"increments": [{"post_id": 1, "delta": 3}, ...]}
+# Redis 는 파이프라인 한 번(게시글별 INCRBY), DB 는 CASE UPDATE 문 한 번으로 처리합니다.
+def parse_batch(payload):
+    items = payload.get("increments") if isinstance(payload, dict) else None
+    if not isinstance(items, list) or not items:
+        raise ValueError("'increments' must be a non-empty list")
+    if len(items) > MAX_BATCH_ITEMS:
+        raise ValueError(f"Too many increments (max {MAX_BATCH_ITEMS})")
+
+    deltas = {}  # 같은 게시글이 여러 번 오면 합쳐서 한 번만 반영
+    for item in items:
+        if isinstance(item, dict):
+            post_id, delta = item.get("post_id"), item.get("delta", 1)
+        elif isinstance(item, (list, tuple)) and len(item) == 2:
+            post_id, delta = item
+        else:
+            raise ValueError(f"Invalid increment entry: {item!r}")
+        if type(post_id) is not int or type(delta) is not int or post_id < 0 or delta <= 0:
+            raise ValueError(f"post_id must be a non-negative int and delta a positive int: {item!r}")
+        deltas[post_id] = deltas.get(post_id, 0) + delta
+    return deltas
+
+@app.route('/api/view/increment:batch', methods=['POST'])
+def increment_view_count_batch():
+    try:
+        deltas = parse_batch(request.get_json(silent=True))
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    if JOURNAL and journal.degraded:
+        return journaled_batch(deltas, SINK_ALL)
+
+    post_ids = list(deltas)
+    db_conn = None
+    redis_done = False  # 파이프라인까지 끝났으면 저널에는 MySQL 반영분만 남김
+    try:
+        # (1) Redis: 게시글별 INCRBY 를 하나의 파이프라인(MULTI)으로 전송
+        # Write-Behind 모드라면 같은 파이프라인에 미반영 증가분 기록도 함께 싣고 DB 는 건너뜁니다.
+        # (HOT_KEY_SHARDING 이면 핫 게시글은 분산 키를 증가시키고 같은 파이프라인에서 합계를 읽습니다)
+        pipe = redis_client.pipeline(transaction=True)
+        spans = []
+        for post_id in post_ids:
+            spans.append((len(pipe), hot_keys.queue_incr(pipe, post_id, deltas[post_id])))
+            if WRITE_BEHIND:
+                write_behind.queue_delta(pipe, post_id, deltas[post_id])
+            if TIME_BUCKETS:
+                view_buckets.add(pipe, post_id, deltas[post_id])
+        results = pipe.execute()
+        redis_done = True
+        counts = [hot_keys.total(results[start:start + n]) for start, n in spans]
+
+        # (2) DB: CASE 문 하나로 모든 게시글을 원자적으로 증가
+        # UPDATE content SET view_count = view_count + CASE id WHEN 1 THEN 3 WHEN 7 THEN 1 END
+        # WHERE id IN (1, 7)
+        if not WRITE_BEHIND:
+            db_conn = db_pool.acquire()
+            db_cursor = db_conn.cursor()
+            cases = " ".join(["WHEN %s THEN %s"] * len(post_ids))
+            placeholders = ", ".join(["%s"] * len(post_ids))
+            params = []
+            for post_id in post_ids:
+                params += [post_id, deltas[post_id]]
+            params += post_ids
+            db_cursor.execute(
+                f"UPDATE content SET view_count = view_count + CASE id {cases} END WHERE id IN ({placeholders})",
+                params)
+            db_conn.commit()
+
+        # (3) 지연 시간 (테스트용, 배치당 한 번)
+        time.sleep(DELAY_SECONDS)
+
+        return jsonify({
+            "status": "success",
+            "results": [
+                {"post_id": post_id, "delta": deltas[post_id], "final_view_count_reported": count}
+                for post_id, count in zip(post_ids, counts)
+            ]
+        })
+
+    except BACKEND_ERRORS as e:
+        if db_conn:
+            try: db_conn.rollback()
+            except: pass
+        if not JOURNAL:
+            logger.error(f"Error: {e}", exc_info=True)
+            return jsonify({"error": str(e)}), 500
+        return journaled_batch(deltas, SINK_MYSQL if redis_done else SINK_ALL, e)
+    except Exception as e:
+        logger.error(f"Error: {e}", exc_info=True)
         if db_conn:
-            db_conn.close()
+            try: db_conn.rollback()
+            except: pass
+        return jsonify({"error": str(e)}), 500
+    finally:
+        db_pool.release(db_conn)
+
+@app.route('/api/write-behind/stats', methods=['GET'])
+def write_behind_stats():
+    # 플러시 횟수 / 지연(lag) / 반영된 증가분
+    return jsonify(write_behind.stats())
+
+@app.route('/api/counter-buffer/stats', methods=['GET'])
+def counter_buffer_stats():
+    # 플러시 횟수 / 플러시당 배치 크기
+    return jsonify(counter_buffer.stats())
+
+@app.route('/api/hot-keys/stats', methods=['GET'])
+def hot_key_stats():
+    # 분산 중인 게시글과 분산 키 수, 늘리기 / 접기 / 합치기 횟수
+    return jsonify(hot_keys.stats())
+
+@app.route('/api/unique-viewers/stats', methods=['GET'])
+def unique_viewer_stats():
+    # PFADD 수, MySQL 영속화 횟수 / 저장한 HLL 수, 되살린 키 수
+    return jsonify(unique_viewers.stats())
+
+@app.route('/api/view-buckets/stats', methods=['GET'])
+def view_bucket_stats():
+    # 롤업 횟수 / 반영한 시간·일 행 수, 구간 조회가 Redis / MySQL 을 읽은 횟수
+    return jsonify(view_buckets.stats())
+
+@app.route('/api/journal/stats', methods=['GET'])
+def journal_stats():
+    # 저널 크기 / fsync 정책·횟수 / degraded 여부, 재반영 오프셋·지연·처리량
+    if not JOURNAL:
+        return jsonify({"enabled": False})
+    return jsonify({"enabled": True, "journal": journal.stats(), "replay": journal_replayer.stats()})
+
+@app.route('/metrics', methods=['GET'])
+def metrics():
+    # 단계별 지연 히스토그램 (Prometheus 텍스트 형식) + 저널 지표
+    text = stage_metrics.prometheus()
+    if JOURNAL:
+        text += journal_metrics.prometheus(journal, journal_replayer)
+    return Response(text, content_type=CONTENT_TYPE)
+
+@app.route('/api/pool/stats', methods=['GET'])
+def pool_stats():
+    # DB 연결 풀 대기 시간 / 사용률 (풀 크기 산정용)
+    return jsonify(db_pool.stats())
 
 if __name__ == '__main__':
     logger.info("Starting API Server with Atomic Operations (Redis INCR)...")
-    # 테스트 시작 전 0으로 초기화
-    redis_client.set(CACHE_KEY, 0)
-    # DB도 0으로 초기화한다고 가정 (실제 운영환경에선 조심해야 함)
-    # conn = pymysql.connect(**DB_CONFIG)
-    # cur = conn.cursor()
-    # cur.execute("UPDATE content SET view_count = 0 WHERE id = %s", (POST_ID,))
-    # conn.commit()
-    # conn.close()
-    
+    # 0 으로 초기화하지 않고 MySQL 값으로 캐시를 채움 (INCR 은 키가 없으면 0 부터 세므로 특히 중요)
+    cache_warmer.run()
+
+    if COUNTER_BUFFER:
+        counter_buffer.start()
+        logger.info(f"Counter buffer started (stripes={BUFFER_STRIPES}, interval={BUFFER_FLUSH_INTERVAL_SECONDS}s)")
+
+    # 순 방문자 HLL 을 주기적으로 MySQL 에 저장 (viewer_id 가 온 게시글만)
+    unique_viewers.start()
+    if TIME_BUCKETS:
+        view_buckets.start()
+
+    if hot_keys.enabled:
+        hot_keys.start()
+        logger.info(f"Hot key detector started (threshold={hot_keys.threshold} incr/s, max {hot_keys.max_shards} shards)")
+
+    if JOURNAL:
+        # 이전 프로세스가 남긴 저널부터 반영
+        journal_replayer.start()
+        logger.info(f"Journal replayer started (dir={JOURNAL_DIR}, fsync={JOURNAL_FSYNC})")
+
+    if WRITE_BEHIND:
+        # 이전 프로세스가 남긴 inflight 증가분을 정리한 뒤 플러셔 시작
+        write_behind.start()
+        logger.info(f"Write-Behind flusher started (interval={FLUSH_INTERVAL_SECONDS}s)")
+
     app.run(host='0.0.0.0', port=5000, threaded=True, debug=False)
@@ -1,71 +1,81 @@
-import pymysql
-import redis
-from flask import Flask, jsonify
+from flask import Flask, jsonify, Response
 import time
 import logging
+from common import redis_client, keyspace, db_pool, lease_locks, log_sampler, cache_warmer, DELAY_SECONDS
+from common import LOCK_PROFILING, LOCK_PROFILE_INTERVAL_SECONDS
+from distributed_lock import LockTimeout, FencingTokenRejected
+from metrics import stage_metrics, CONTENT_TYPE
+from lock_profiler import ProfiledLock, lock_profiler
 from threading import Lock  # [변경] Lock 모듈 임포트
+from contextlib import contextmanager
 
 # --------------------
-# 1. 설정 (Configuration)
+# 1. 설정 (Configuration) - DB/Redis 접속 정보, 지연 시간 등 공통 설정은 common.py
 # --------------------
-DB_CONFIG = {
-    "user": "w11",
-    "password": "q1w2e3r4",
-    "host": "127.0.0.1",
-    "database": "w11_exam",
-    "autocommit": False
-}
-
-REDIS_CONFIG = {
-    "host": "127.0.0.1",
-    "port": 6379,
-    "decode_responses": True
-}
-
-POST_ID = 1
-CACHE_KEY = f"post:{POST_ID}:view_count"
-DELAY_SECONDS = 0.05  # 50ms (락 때문에 이제는 이 시간이 누적되어 전체 성능 저하의 주범이 됨)
-
 app = Flask(__name__)
-redis_client = redis.Redis(**REDIS_CONFIG)
 
 # [변경] 글로벌 락 객체 생성
 # 이 자물쇠는 프로그램 전체에서 단 하나만 존재합니다.
-global_lock = Lock()
+# (LOCK_PROFILING 이면 대기/보유 시간, 대기자 수, 소유 스레드를 기록하는 ProfiledLock 으로 대체)
+global_lock = ProfiledLock("global_lock") if LOCK_PROFILING else Lock()
+
+# threading.Lock 은 한 프로세스 안에서만 직렬화합니다. 워커/호스트를 여러 개 띄우면
+# True 로 바꿔 Redis 임대 락(common.lease_locks)을 사용합니다.
+# 같은 프로세스의 대기자는 로컬 락에서 먼저 줄을 서고, DB 쓰기는 펜싱 토큰으로 검사합니다.
+DISTRIBUTED_LOCK = False
+GLOBAL_LOCK_RESOURCE = "global"
+
+@contextmanager
+def acquire_global_lock():
+    # 분산 락이면 Lease(펜싱 토큰), 로컬 락이면 None 을 넘겨줌
+    if DISTRIBUTED_LOCK:
+        with lease_locks.hold(GLOBAL_LOCK_RESOURCE) as lease:
+            yield lease
+    else:
+        with global_lock:
+            yield None
+
+@app.errorhandler(LockTimeout)
+def lock_timeout(e):
+    return jsonify({"error": str(e)}), 503
 
-logging.basicConfig(level=logging.INFO, format='%(asctime)s - (%(threadName)s) - %(message)s')
 logger = logging.getLogger(__name__)
 
+# 단계별 지연 히스토그램 (/metrics). lock_wait 은 락을 얻기까지 줄 선 시간
+stages = stage_metrics.recorder("lock")
+
 # --------------------
 # 2. 핵심 API 로직
 # --------------------
 @app.route('/api/view/increment/<int:post_id>', methods=['POST'])
 def increment_view_count(post_id):
-    if post_id != POST_ID:
-        return jsonify({"error": "Invalid Post ID"}), 400
-
     # [변경] 락 획득 (Global Lock 적용)
     # 이 'with' 블록 안에 들어온 스레드만 코드를 실행할 수 있습니다.
     # 이미 누군가 들어와 있다면, 그 사람이 나갈 때까지 대기합니다.
-    with global_lock:
+    lock_started = time.perf_counter()
+    with acquire_global_lock() as lease:
+        stages.since("lock_wait", lock_started)
         db_conn = None
         try:
             # --- 여기서부터는 한 번에 한 명만 실행됨 (Single Thread 처럼 동작) ---
             
-            db_conn = pymysql.connect(**DB_CONFIG)
+            with stages.time("db_connect"):
+                db_conn = db_pool.acquire()
             db_cursor = db_conn.cursor()
 
             # (1) 캐시에서 조회수 읽기
-            current_count_str = redis_client.get(CACHE_KEY)
+            with stages.time("redis_read"):
+                current_count_str = keyspace.get(redis_client, post_id)
             
             db_count = 0
             if current_count_str is None:
                 # (2) 캐시 미스 처리
-                db_cursor.execute("SELECT view_count FROM content WHERE id = %s", (post_id,))
-                row = db_cursor.fetchone()
+                with stages.time("db_read"):
+                    db_cursor.execute("SELECT view_count FROM content WHERE id = %s", (post_id,))
+                    row = db_cursor.fetchone()
                 if row:
                     db_count = row[0]
-                    redis_client.set(CACHE_KEY, db_count)
+                    keyspace.set(redis_client, post_id, db_count)
                 read_count = db_count
             else:
                 read_count = int(current_count_str)
@@ -73,17 +83,25 @@ def increment_view_count(post_id):
             # (3) 조회수 +1 증가
             new_count = read_count + 1
             
-            # (4) DB에 저장
-            db_cursor.execute("UPDATE content SET view_count = view_count + 1 WHERE id = %s", (post_id,))
-            db_conn.commit()
+            # (4) DB에 저장 (분산 락이면 같은 트랜잭션에서 펜싱 토큰 검사)
+            with stages.time("db_write"):
+                if lease:
+                    lease.fence(db_cursor)
+                db_cursor.execute("UPDATE content SET view_count = view_count + 1 WHERE id = %s", (post_id,))
+                db_conn.commit()
             
             # (5) 의도적인 지연 시간 (이제는 이 시간 동안 다른 스레드들도 줄 서서 기다려야 함)
-            time.sleep(DELAY_SECONDS)
+            with stages.time("delay"):
+                time.sleep(DELAY_SECONDS)
             
-            # (6) 캐시에 저장
-            redis_client.set(CACHE_KEY, new_count)
+            # (6) 캐시에 저장 (분산 락이면 지연 중에 임대를 잃지 않았을 때만, 아니면 새 소유자의 값을 덮어쓰지 않고 건너뜀)
+            with stages.time("cache_write"):
+                if not lease:
+                    keyspace.set(redis_client, post_id, new_count)
+                elif not lease_locks.fenced_set(lease, *keyspace.location(post_id), new_count):
+                    logger.warning(f"Skipped stale cache write for post {post_id} (token {lease.token})")
             
-            logger.info(f"Updated: {read_count} -> {new_count}")
+            log_sampler.logger(logger, "request").info("Updated: %s -> %s", read_count, new_count)
 
             return jsonify({
                 "status": "success",
@@ -91,6 +109,16 @@ def increment_view_count(post_id):
                 "final_view_count_reported": new_count
             })
 
+        except FencingTokenRejected as e:
+            # 임대가 만료된 사이 다른 프로세스가 이미 썼음 → 이번 쓰기는 버림
+            logger.warning(f"Fenced off: {e}")
+            if db_conn:
+                try:
+                    db_conn.rollback()
+                except Exception as rb_e:
+                    logger.error(f"Rollback failed: {rb_e}")
+            return jsonify({"error": str(e)}), 409
+
         except Exception as e:
             logger.error(f"Error occurred: {e}", exc_info=True)
             if db_conn:
@@ -100,11 +128,42 @@ def increment_view_count(post_id):
                     logger.error(f"Rollback failed: {rb_e}")
             return jsonify({"error": str(e)}), 500
         finally:
-            if db_conn:
-                db_conn.close()
+            db_pool.release(db_conn)
     # [변경] with 블록이 끝나면 자동으로 락이 반납(Release)되고, 기다리던 다음 스레드가 진입합니다.
 
+@app.route('/metrics', methods=['GET'])
+def metrics():
+    # 단계별 지연 히스토그램 (Prometheus 텍스트 형식)
+    return Response(stage_metrics.prometheus(), content_type=CONTENT_TYPE)
+
+@app.route('/debug/locks', methods=['GET'])
+def debug_locks():
+    # 락별 대기/보유 시간, 최대 대기자 수, 현재 소유 스레드 (LOCK_PROFILING = True 일 때)
+    return jsonify(lock_profiler.stats())
+
+@app.route('/debug/locks/folded', methods=['GET'])
+def debug_locks_folded():
+    # flamegraph.pl / speedscope 용 folded stack (락;held|waiting;프레임;... 샘플수)
+    return Response(lock_profiler.folded(), content_type="text/plain; charset=utf-8")
+
+@app.route('/debug/locks/reset', methods=['POST'])
+def debug_locks_reset():
+    lock_profiler.reset()
+    return jsonify({"status": "reset"})
+
+@app.route('/api/pool/stats', methods=['GET'])
+def pool_stats():
+    # DB 연결 풀 대기 시간 / 사용률 (풀 크기 산정용)
+    return jsonify(db_pool.stats())
+
+@app.route('/api/lease-lock/stats', methods=['GET'])
+def lease_lock_stats():
+    # 분산 락 획득 지연(로컬 대기 / Redis 대기), 갱신·만료·펜싱 거부 횟수
+    return jsonify(lease_locks.stats())
+
 if __name__ == '__main__':
-    logger.info("Starting API Server with Global Lock...")
-    redis_client.set(CACHE_KEY, 0)
+    logger.info(f"Starting API Server with Global Lock (distributed: {DISTRIBUTED_LOCK})...")
+    cache_warmer.run()
+    if LOCK_PROFILING:
+        lock_profiler.start(LOCK_PROFILE_INTERVAL_SECONDS)
     app.run(host='0.0.0.0', port=5000, threaded=True, debug=False)
@@ -0,0 +1,198 @@
+from flask import Flask, jsonify, request
+import time
+import logging
+from threading import Lock
+from common import redis_client, keyspace, db_pool, hot_keys, unique_viewers, view_buckets, REDIS_CONFIG
+from l1_cache import L1Cache, L1Invalidator
+
+# --------------------
+# 1. 설정 - DB/Redis 접속 정보 등 공통 설정은 common.py
+# --------------------
+# 조회수 읽기 API. 페이지 조회는 증가보다 훨씬 잦으므로 Redis 앞에 프로세스 내부 L1 캐시를 둡니다.
+#   L1 히트 → Redis 왕복 없음 / L1 미스 → Redis (MGET 한 번) / Redis 에도 없으면 → MySQL
+app = Flask(__name__)
+
+L1_MAX_ENTRIES = 10000
+# 배포별 staleness 예산: 읽기 응답이 실제 값보다 최대 이만큼 오래될 수 있음 (L1 TTL)
+L1_TTL_SECONDS = 1.0
+# True 면 Redis keyspace notification 으로 값이 바뀌는 즉시 L1 항목을 지움 (TTL 은 유실 시 상한)
+L1_INVALIDATION = False
+MAX_READ_IDS = 500  # 일괄 조회 한 번에 받을 수 있는 최대 게시글 수
+MAX_UNIQUE_VIEWER_DAYS = 366  # 순 방문자 기간 합계(?days=) 최대 일수
+MAX_UNIQUE_VIEWER_KEYS = 5000  # 순 방문자 합집합 한 번에 합칠 최대 HLL 키 수 (게시글 수 × 일수)
+
+l1_cache = L1Cache(maxsize=L1_MAX_ENTRIES, ttl=L1_TTL_SECONDS)
+l1_invalidator = L1Invalidator(redis_client, l1_cache, keyspace, db=REDIS_CONFIG.get("db", 0))
+
+# L1 미스가 어디서 채워졌는지 (Redis / DB)
+stats_lock = Lock()
+source_stats = {"redis": 0, "db": 0, "not_found": 0}
+
+logger = logging.getLogger(__name__)
+
+# --------------------
+# 2. 핵심 로직
+# --------------------
+def read_counts(post_ids):
+    """게시글 ID 목록 → {post_id: 조회수}. DB 에도 없는 게시글은 None."""
+    counts = {}
+    missing = []
+    for post_id in post_ids:
+        hit, value = l1_cache.get(post_id)
+        if hit:
+            counts[post_id] = value
+        else:
+            missing.append(post_id)
+    if not missing:
+        return counts
+
+    # (1) L1 미스는 한 번의 MGET 으로 Redis 에서 읽음 (핫 게시글은 분산 키 합계까지 같은 왕복으로)
+    not_cached = []
+    for post_id, value in zip(missing, hot_keys.mget(missing)):
+        if value is None:
+            not_cached.append(post_id)
+        else:
+            counts[post_id] = int(value)
+            l1_cache.put(post_id, counts[post_id])
+
+    # (2) Redis 에도 없으면 DB 에서 한 번에 읽음 (캐시 키는 쓰기 전략이 관리하므로 채우지 않음)
+    db_counts = {}
+    if not_cached:
+        with db_pool.connection() as db_conn:
+            db_cursor = db_conn.cursor()
+            placeholders = ", ".join(["%s"] * len(not_cached))
+            db_cursor.execute(f"SELECT id, view_count FROM content WHERE id IN ({placeholders})", not_cached)
+            db_counts = dict(db_cursor.fetchall())
+        for post_id in not_cached:
+            counts[post_id] = db_counts.get(post_id)
+            if counts[post_id] is not None:
+                l1_cache.put(post_id, counts[post_id])
+
+    with stats_lock:
+        source_stats["redis"] += len(missing) - len(not_cached)
+        source_stats["db"] += len(db_counts)
+        source_stats["not_found"] += len(not_cached) - len(db_counts)
+    return counts
+
+def parse_ids(raw):
+    if not raw:
+        raise ValueError("'ids' query parameter is required (e.g. ?ids=1,2,3)")
+    try:
+        post_ids = list(dict.fromkeys(int(part) for part in raw.split(",")))
+    except ValueError:
+        raise ValueError(f"Invalid ids: {raw!r}")
+    if len(post_ids) > MAX_READ_IDS:
+        raise ValueError(f"Too many ids (max {MAX_READ_IDS})")
+    if any(post_id < 0 for post_id in post_ids):
+        raise ValueError("ids must be non-negative")
+    return post_ids
+
+@app.route('/api/view/<int:post_id>', methods=['GET'])
+def get_view_count(post_id):
+    try:
+        count = read_counts([post_id])[post_id]
+    except Exception as e:
+        logger.error(f"Error: {e}", exc_info=True)
+        return jsonify({"error": str(e)}), 500
+    if count is None:
+        return jsonify({"error": f"Post {post_id} not found"}), 404
+    return jsonify({"post_id": post_id, "view_count": count})
+
+@app.route('/api/view', methods=['GET'])
+def get_view_counts():
+    # 목록 페이지용 일괄 조회: GET /api/view?ids=1,2,3
+    try:
+        post_ids = parse_ids(request.args.get("ids"))
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    try:
+        counts = read_counts(post_ids)
+    except Exception as e:
+        logger.error(f"Error: {e}", exc_info=True)
+        return jsonify({"error": str(e)}), 500
+    return jsonify({"view_counts": {str(post_id): counts[post_id] for post_id in post_ids}})
+
+def parse_days(raw):
+    # 없으면 전체 기간, 있으면 오늘부터 최근 days 일 (UTC)
+    if raw is None:
+        return None
+    try:
+        days = int(raw)
+    except ValueError:
+        raise ValueError(f"Invalid days: {raw!r}")
+    if not 1 <= days <= MAX_UNIQUE_VIEWER_DAYS:
+        raise ValueError(f"days must be between 1 and {MAX_UNIQUE_VIEWER_DAYS}")
+    return days
+
+@app.route('/api/view/<int:post_id>/unique-viewers', methods=['GET'])
+def get_unique_viewers(post_id):
+    # 순 방문자 수 (HyperLogLog PFCOUNT, 오차 약 0.81%): GET /api/view/1/unique-viewers?days=7
+    try:
+        days = parse_days(request.args.get("days"))
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    try:
+        count = unique_viewers.count([post_id], days)
+    except Exception as e:
+        logger.error(f"Error: {e}", exc_info=True)
+        return jsonify({"error": str(e)}), 500
+    return jsonify({"post_id": post_id, "days": days, "unique_viewers": count})
+
+@app.route('/api/view/unique-viewers', methods=['GET'])
+def get_unique_viewers_rollup():
+    # 여러 게시글 / 여러 날의 합집합 (PFCOUNT, 크면 PFMERGE): GET /api/view/unique-viewers?ids=1,2,3&days=30
+    try:
+        post_ids = parse_ids(request.args.get("ids"))
+        days = parse_days(request.args.get("days"))
+        if len(set(post_ids)) * (days or 1) > MAX_UNIQUE_VIEWER_KEYS:
+            raise ValueError(f"Too many ids x days (max {MAX_UNIQUE_VIEWER_KEYS} keys)")
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    try:
+        count = unique_viewers.count(post_ids, days)
+    except Exception as e:
+        logger.error(f"Error: {e}", exc_info=True)
+        return jsonify({"error": str(e)}), 500
+    return jsonify({"post_ids": post_ids, "days": days, "unique_viewers": count})
+
+@app.route('/api/view/<int:post_id>/range', methods=['GET'])
+def get_view_range(post_id):
+    # 구간 조회수: GET /api/view/1/range?start=<epoch>&end=<epoch>&step=minute|hour|day (기본: 최근 1시간, 분 단위)
+    # 최근 구간은 Redis 분 단위 버킷, 오래된 구간은 MySQL view_rollup
+    try:
+        end = int(request.args.get("end", time.time()))
+        start = int(request.args.get("start", end - 3600))
+        step = request.args.get("step", "minute")
+        buckets = view_buckets.series(post_id, start, end, step)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    except Exception as e:
+        logger.error(f"Error: {e}", exc_info=True)
+        return jsonify({"error": str(e)}), 500
+    return jsonify({
+        "post_id": post_id,
+        "step": step,
+        "start": start,
+        "end": end,
+        "total": sum(views for _, views in buckets),
+        "buckets": [[bucket_start, views] for bucket_start, views in buckets],
+    })
+
+@app.route('/api/view/cache/stats', methods=['GET'])
+def read_cache_stats():
+    # L1 히트율, 미스가 채워진 경로(Redis/DB), 무효화 메시지 수
+    with stats_lock:
+        sources = dict(source_stats)
+    redis_lookups = sources["redis"] + sources["db"] + sources["not_found"]
+    return jsonify({
+        "l1": l1_cache.stats(),
+        "l1_miss_sources": sources,
+        "redis_hit_ratio": round(sources["redis"] / redis_lookups, 4) if redis_lookups else 0.0,
+        "invalidation": {"enabled": L1_INVALIDATION, "messages": l1_invalidator.messages},
+    })
+
+if __name__ == '__main__':
+    logger.info(f"Starting Read API Server (L1 TTL: {L1_TTL_SECONDS}s, invalidation: {L1_INVALIDATION})...")
+    if L1_INVALIDATION:
+        l1_invalidator.start()
+    app.run(host='0.0.0.0', port=5000, threaded=True, debug=False)
@@ -1,73 +1,84 @@
-import pymysql
-import redis
-from flask import Flask, jsonify
+from flask import Flask, jsonify, Response
 import time
 import logging
-from threading import Lock
-from collections import defaultdict
+from common import redis_client, keyspace, db_pool, lease_locks, log_sampler, cache_warmer, DELAY_SECONDS
+from common import LOCK_PROFILING, LOCK_PROFILE_INTERVAL_SECONDS
+from striped_lock import make_keyed_lock
+from distributed_lock import LockTimeout, FencingTokenRejected
+from metrics import stage_metrics, CONTENT_TYPE
+from lock_profiler import ProfiledLock, lock_profiler
+from contextlib import contextmanager
 
 # --------------------
-# 1. 설정 (Configuration)
+# 1. 설정 (Configuration) - DB/Redis 접속 정보, 지연 시간 등 공통 설정은 common.py
 # --------------------
-DB_CONFIG = {
-    "user": "w11",
-    "password": "q1w2e3r4",
-    "host": "127.0.0.1",
-    "database": "w11_exam",
-    "autocommit": False
-}
-
-REDIS_CONFIG = {
-    "host": "127.0.0.1",
-    "port": 6379,
-    "decode_responses": True
-}
-
-POST_ID = 1
-CACHE_KEY = f"post:{POST_ID}:view_count"
-DELAY_SECONDS = 0.05 
-
 app = Flask(__name__)
-redis_client = redis.Redis(**REDIS_CONFIG)
 
 # [변경] ID별 락 관리자
-# post_locks[1] 은 1번 게시글 전용 락, post_locks[2]는 2번 전용 락...
-# defaultdict를 사용하여 새로운 ID가 들어오면 자동으로 락을 생성합니다.
-post_locks = defaultdict(Lock)
+# defaultdict(Lock) 은 한 번이라도 조회된 게시글마다 락을 만들고 지우지 않으므로,
+# 게시글이 수백만 개면 메모리가 계속 늘어납니다. 대신 다음 중 하나를 사용합니다.
+#  - "striped" : 게시글 ID 를 LOCK_STRIPES 개의 고정 락으로 해싱 (메모리 고정, 다른 게시글끼리 대기 가능)
+#  - "refcount": 게시글별 전용 락을 쓰되 사용 중인 것만 보관 (대기는 정확, 맵 뮤텍스 비용 추가)
+# 어느 쪽이 나은지는 /api/record-lock/stats 의 스트라이프별 대기/보유 시간으로 판단합니다.
+LOCK_MODE = "striped"
+LOCK_STRIPES = 64
+# LOCK_PROFILING 이면 스트라이프마다 ProfiledLock 을 사용 (refcount 모드는 락이 계속 생기고 사라지므로 제외)
+post_locks = make_keyed_lock(
+    LOCK_MODE, LOCK_STRIPES,
+    lock_factory=(lambda i: ProfiledLock(f"post_locks[{i}]")) if LOCK_PROFILING else None)
+
+# 여러 워커/호스트에서 실행할 때는 True: 게시글별 Redis 임대 락 + 펜싱 토큰 (app_lock.py 와 동일)
+DISTRIBUTED_LOCK = False
+
+@contextmanager
+def acquire_post_lock(post_id):
+    # 분산 락이면 Lease(펜싱 토큰), 로컬 락이면 None 을 넘겨줌
+    if DISTRIBUTED_LOCK:
+        with lease_locks.hold(f"post:{post_id}") as lease:
+            yield lease
+    else:
+        with post_locks.hold(post_id):
+            yield None
+
+@app.errorhandler(LockTimeout)
+def lock_timeout(e):
+    return jsonify({"error": str(e)}), 503
 
-logging.basicConfig(level=logging.INFO, format='%(asctime)s - (%(threadName)s) - %(message)s')
 logger = logging.getLogger(__name__)
 
+# 단계별 지연 히스토그램 (/metrics). lock_wait 은 락을 얻기까지 줄 선 시간
+stages = stage_metrics.recorder("record_lock")
+
 # --------------------
 # 2. 핵심 API 로직
 # --------------------
 @app.route('/api/view/increment/<int:post_id>', methods=['POST'])
 def increment_view_count(post_id):
-    if post_id != POST_ID:
-        return jsonify({"error": "Invalid Post ID"}), 400
-
-    # [변경] 해당 게시글 ID에 맞는 락을 가져옴
-    # 현재 테스트는 모두 post_id=1 이므로, 모두가 같은 락 객체를 사용하게 됨
-    current_lock = post_locks[post_id]
-
+    # 단일 게시글 테스트(post_id=1)에서는 모두가 같은 락 객체를 사용하게 되고,
+    # 여러 게시글로 부하를 분산하면(Zipf) 인기 게시글 락에만 대기가 몰림
     # [변경] ID 전용 락 획득
-    # ID가 서로 다르면 동시에 실행되지만, ID가 같으면 대기해야 함.
-    with current_lock:
+    # ID가 서로 다르면 (스트라이프가 겹치지 않는 한) 동시에 실행되지만, ID가 같으면 대기해야 함.
+    lock_started = time.perf_counter()
+    with acquire_post_lock(post_id) as lease:
+        stages.since("lock_wait", lock_started)
         db_conn = None
         try:
-            db_conn = pymysql.connect(**DB_CONFIG)
+            with stages.time("db_connect"):
+                db_conn = db_pool.acquire()
             db_cursor = db_conn.cursor()
 
             # (1) 캐시 읽기
-            current_count_str = redis_client.get(CACHE_KEY)
+            with stages.time("redis_read"):
+                current_count_str = keyspace.get(redis_client, post_id)
             
             db_count = 0
             if current_count_str is None:
-                db_cursor.execute("SELECT view_count FROM content WHERE id = %s", (post_id,))
-                row = db_cursor.fetchone()
+                with stages.time("db_read"):
+                    db_cursor.execute("SELECT view_count FROM content WHERE id = %s", (post_id,))
+                    row = db_cursor.fetchone()
                 if row:
                     db_count = row[0]
-                    redis_client.set(CACHE_KEY, db_count)
+                    keyspace.set(redis_client, post_id, db_count)
                 read_count = db_count
             else:
                 read_count = int(current_count_str)
@@ -75,17 +86,25 @@ def increment_view_count(post_id):
             # (2) 증가
             new_count = read_count + 1
             
-            # (3) DB 쓰기
-            db_cursor.execute("UPDATE content SET view_count = view_count + 1 WHERE id = %s", (post_id,))
-            db_conn.commit()
+            # (3) DB 쓰기 (분산 락이면 같은 트랜잭션에서 펜싱 토큰 검사)
+            with stages.time("db_write"):
+                if lease:
+                    lease.fence(db_cursor)
+                db_cursor.execute("UPDATE content SET view_count = view_count + 1 WHERE id = %s", (post_id,))
+                db_conn.commit()
             
             # (4) 지연 (병목 구간)
-            time.sleep(DELAY_SECONDS)
+            with stages.time("delay"):
+                time.sleep(DELAY_SECONDS)
             
-            # (5) 캐시 쓰기
-            redis_client.set(CACHE_KEY, new_count)
+            # (5) 캐시 쓰기 (분산 락이면 지연 중에 임대를 잃지 않았을 때만, 아니면 새 소유자의 값을 덮어쓰지 않고 건너뜀)
+            with stages.time("cache_write"):
+                if not lease:
+                    keyspace.set(redis_client, post_id, new_count)
+                elif not lease_locks.fenced_set(lease, *keyspace.location(post_id), new_count):
+                    logger.warning(f"Skipped stale cache write for post {post_id} (token {lease.token})")
             
-            logger.info(f"Updated Post {post_id}: {read_count} -> {new_count}")
+            log_sampler.logger(logger, "request").info("Updated Post %s: %s -> %s", post_id, read_count, new_count)
 
             return jsonify({
                 "status": "success",
@@ -93,6 +112,14 @@ def increment_view_count(post_id):
                 "final_view_count_reported": new_count
             })
 
+        except FencingTokenRejected as e:
+            # 임대가 만료된 사이 다른 프로세스가 이미 썼음 → 이번 쓰기는 버림
+            logger.warning(f"Fenced off: {e}")
+            if db_conn:
+                try: db_conn.rollback()
+                except: pass
+            return jsonify({"error": str(e)}), 409
+
         except Exception as e:
             logger.error(f"Error: {e}", exc_info=True)
             if db_conn:
@@ -100,10 +127,46 @@ def increment_view_count(post_id):
                 except: pass
             return jsonify({"error": str(e)}), 500
         finally:
-            if db_conn:
-                db_conn.close()
+            db_pool.release(db_conn)
+
+@app.route('/metrics', methods=['GET'])
+def metrics():
+    # 단계별 지연 히스토그램 (Prometheus 텍스트 형식)
+    return Response(stage_metrics.prometheus(), content_type=CONTENT_TYPE)
+
+@app.route('/debug/locks', methods=['GET'])
+def debug_locks():
+    # 락별 대기/보유 시간, 최대 대기자 수, 현재 소유 스레드 (LOCK_PROFILING = True 일 때)
+    return jsonify(lock_profiler.stats())
+
+@app.route('/debug/locks/folded', methods=['GET'])
+def debug_locks_folded():
+    # flamegraph.pl / speedscope 용 folded stack (락;held|waiting;프레임;... 샘플수)
+    return Response(lock_profiler.folded(), content_type="text/plain; charset=utf-8")
+
+@app.route('/debug/locks/reset', methods=['POST'])
+def debug_locks_reset():
+    lock_profiler.reset()
+    return jsonify({"status": "reset"})
+
+@app.route('/api/pool/stats', methods=['GET'])
+def pool_stats():
+    # DB 연결 풀 대기 시간 / 사용률 (풀 크기 산정용)
+    return jsonify(db_pool.stats())
+
+@app.route('/api/record-lock/stats', methods=['GET'])
+def record_lock_stats():
+    # 스트라이프(또는 키)별 락 대기/보유 시간
+    return jsonify(post_locks.stats())
+
+@app.route('/api/lease-lock/stats', methods=['GET'])
+def lease_lock_stats():
+    # 분산 락 획득 지연(로컬 대기 / Redis 대기), 갱신·만료·펜싱 거부 횟수
+    return jsonify(lease_locks.stats())
 
 if __name__ == '__main__':
-    logger.info("Starting API Server with Fine-grained (ID-level) Lock...")
-    redis_client.set(CACHE_KEY, 0)
+    logger.info(f"Starting API Server with Fine-grained (ID-level) Lock (mode: {LOCK_MODE}, distributed: {DISTRIBUTED_LOCK})...")
+    cache_warmer.run()
+    if LOCK_PROFILING:
+        lock_profiler.start(LOCK_PROFILE_INTERVAL_SECONDS)
     app.run(host='0.0.0.0', port=5000, threaded=True, debug=False)
@@ -1,71 +1,52 @@
-import pymysql
-import redis
-from flask import Flask, jsonify
+from flask import Flask, jsonify, Response
 import time
 import logging
+from common import redis_client, keyspace, db_pool, log_sampler, cache_warmer, DELAY_SECONDS
+from metrics import stage_metrics, CONTENT_TYPE
+from content_sql import increment_returning
 
 # --------------------
-# 1. 설정
+# 1. 설정 - DB/Redis 접속 정보, 지연 시간 등 공통 설정은 common.py
 # --------------------
-DB_CONFIG = {
-    "user": "w11",
-    "password": "q1w2e3r4",
-    "host": "127.0.0.1",
-    "database": "w11_exam",
-    "autocommit": False
-}
-
-REDIS_CONFIG = {
-    "host": "127.0.0.1",
-    "port": 6379,
-    "decode_responses": True
-}
-
-POST_ID = 1
-CACHE_KEY = f"post:{POST_ID}:view_count"
-DELAY_SECONDS = 0.05
-
 app = Flask(__name__)
-redis_client = redis.Redis(**REDIS_CONFIG)
 
-logging.basicConfig(level=logging.INFO, format='%(asctime)s - (%(threadName)s) - %(message)s')
 logger = logging.getLogger(__name__)
 
+# 단계별 지연 히스토그램 (/metrics)
+stages = stage_metrics.recorder("write_through")
+
 # --------------------
 # 2. Write-Through (Update DB -> Update Redis)
 # --------------------
 @app.route('/api/view/increment/<int:post_id>', methods=['POST'])
 def increment_view_count(post_id):
-    if post_id != POST_ID:
-        return jsonify({"error": "Invalid Post ID"}), 400
-
     db_conn = None
     final_count = 0
 
     try:
-        db_conn = pymysql.connect(**DB_CONFIG)
+        with stages.time("db_connect"):
+            db_conn = db_pool.acquire()
         db_cursor = db_conn.cursor()
 
         # (1) DB 업데이트
-        # DB는 안전하게 1 증가
-        db_cursor.execute("UPDATE content SET view_count = view_count + 1 WHERE id = %s", (post_id,))
-        db_conn.commit()
+        # DB는 안전하게 1 증가시키고, 같은 왕복에서 증가 후 값을 돌려받음 (LAST_INSERT_ID 관용구)
+        # 캐시에 넣을 '정확한 값'을 알기 위해 DB를 다시 조회할 필요가 없고,
+        # 그 사이 다른 요청이 올린 값을 읽어오는 일도 없습니다.
+        with stages.time("db_write"):
+            final_count = increment_returning(db_cursor, post_id)
+            db_conn.commit()
 
         # (2) 불일치 유발 시간 (테스트용)
-        time.sleep(DELAY_SECONDS)
+        with stages.time("delay"):
+            time.sleep(DELAY_SECONDS)
 
-        # (3) DB에서 최신 값 가져오기
-        # 캐시에 넣을 '정확한 값'을 알기 위해 DB를 다시 조회합니다.
-        db_cursor.execute("SELECT view_count FROM content WHERE id = %s", (post_id,))
-        row = db_cursor.fetchone()
-        if row:
-            final_count = row[0]
-
-            # (4) 캐시 업데이트 (DELETE가 아니라 SET)
+        if final_count is not None:
+            # (3) 캐시 업데이트 (DELETE가 아니라 SET)
             # 이제 Redis에도 값이 기록됩니다!
-            redis_client.set(CACHE_KEY, final_count)
+            with stages.time("cache_write"):
+                keyspace.set(redis_client, post_id, final_count)
             
-            logger.info(f"DB Updated to {final_count} -> Redis SET Complete")
+            log_sampler.logger(logger, "request").info("DB Updated to %s -> Redis SET Complete", final_count)
 
         return jsonify({
             "status": "success",
@@ -80,10 +61,19 @@ def increment_view_count(post_id):
             except: pass
         return jsonify({"error": str(e)}), 500
     finally:
-        if db_conn:
-            db_conn.close()
+        db_pool.release(db_conn)
+
+@app.route('/metrics', methods=['GET'])
+def metrics():
+    # 단계별 지연 히스토그램 (Prometheus 텍스트 형식)
+    return Response(stage_metrics.prometheus(), content_type=CONTENT_TYPE)
+
+@app.route('/api/pool/stats', methods=['GET'])
+def pool_stats():
+    # DB 연결 풀 대기 시간 / 사용률 (풀 크기 산정용)
+    return jsonify(db_pool.stats())
 
 if __name__ == '__main__':
     logger.info("Starting API Server with Write-Through (Redis UPDATE)...")
-    redis_client.set(CACHE_KEY, 0)
+    cache_warmer.run()
     app.run(host='0.0.0.0', port=5000, threaded=True, debug=False)
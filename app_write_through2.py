@@ -1,74 +1,77 @@
-import pymysql
-import redis
-from flask import Flask, jsonify
+from flask import Flask, jsonify, Response
 import time
 import logging
+from common import redis_client, keyspace, db_pool, log_sampler, cache_warmer, DELAY_SECONDS
+from metrics import stage_metrics, CONTENT_TYPE
+from content_sql import increment_returning
+from stampede import StampedeGuard
 
 # --------------------
-# 1. 설정
+# 1. 설정 - DB/Redis 접속 정보, 지연 시간 등 공통 설정은 common.py
 # --------------------
-DB_CONFIG = {
-    "user": "w11",
-    "password": "q1w2e3r4",
-    "host": "127.0.0.1",
-    "database": "w11_exam",
-    "autocommit": False
-}
-
-REDIS_CONFIG = {
-    "host": "127.0.0.1",
-    "port": 6379,
-    "decode_responses": True
-}
-
-POST_ID = 1
-CACHE_KEY = f"post:{POST_ID}:view_count"
-DELAY_SECONDS = 0.05
-
 app = Flask(__name__)
-redis_client = redis.Redis(**REDIS_CONFIG)
 
-logging.basicConfig(level=logging.INFO, format='%(asctime)s - (%(threadName)s) - %(message)s')
+# 쓰기마다 캐시를 지우므로, 인기 게시글은 지울 때마다 읽기가 한꺼번에 DB 로 몰립니다(스탬피드).
+# True 면 미스 시 임대 토큰을 잡은 한 명만 DB 를 읽고, 나머지는 직전 값(stale)을 받습니다.
+# False 면 미스마다 각자 DB 를 읽어 채움 (비교용). 실행 중에는 PUT /admin/stampede/<on|off> 로 전환
+STAMPEDE_PROTECTION = True
+# 확률적 조기 만료(XFetch): 캐시 TTL 이 끝나기 전에 한 명이 미리 갱신
+EARLY_EXPIRATION = True
+CACHE_TTL_SECONDS = 30.0
+STALE_TTL_SECONDS = 60.0   # 무효화 직전 값을 얼마나 오래 대신 내줄 수 있는지
+LEASE_TTL_SECONDS = 2.0    # 채우는 쪽이 죽어도 이 시간이 지나면 다른 읽기가 임대를 잡음
+
 logger = logging.getLogger(__name__)
 
+def load_view_count(post_id):
+    with db_pool.connection() as db_conn:
+        db_cursor = db_conn.cursor()
+        db_cursor.execute("SELECT view_count FROM content WHERE id = %s", (post_id,))
+        row = db_cursor.fetchone()
+    return row[0] if row else None
+
+stampede_guard = StampedeGuard(
+    redis_client, keyspace, load_view_count,
+    ttl=CACHE_TTL_SECONDS, lease_ttl=LEASE_TTL_SECONDS, stale_ttl=STALE_TTL_SECONDS,
+    enabled=STAMPEDE_PROTECTION, early_expiration=EARLY_EXPIRATION)
+
+# 단계별 지연 히스토그램 (/metrics)
+stages = stage_metrics.recorder("write_through_invalidate")
+
 # --------------------
 # 2. Write-Through (Update DB -> Invalidate Cache)
 # --------------------
 @app.route('/api/view/increment/<int:post_id>', methods=['POST'])
 def increment_view_count(post_id):
-    if post_id != POST_ID:
-        return jsonify({"error": "Invalid Post ID"}), 400
-
     db_conn = None
     final_count = 0
 
     try:
-        db_conn = pymysql.connect(**DB_CONFIG)
+        with stages.time("db_connect"):
+            db_conn = db_pool.acquire()
         db_cursor = db_conn.cursor()
 
         # (1) DB 업데이트 (Source of Truth)
         # 가장 중요한 원본 데이터를 먼저 안전하게 증가시킵니다.
         # DB의 Row Lock 덕분에 순차적으로 정확히 +1 됩니다.
-        db_cursor.execute("UPDATE content SET view_count = view_count + 1 WHERE id = %s", (post_id,))
-        db_conn.commit()
+        # 응답에 쓸 증가 후 값도 같은 왕복에서 돌려받습니다 (LAST_INSERT_ID 관용구, 별도 SELECT 없음)
+        with stages.time("db_write"):
+            final_count = increment_returning(db_cursor, post_id)
+            db_conn.commit()
 
         # (2) 불일치 유발 시간 (테스트용)
         # 이 시간 동안 다른 스레드들이 DB를 더 업데이트 할 수 있습니다.
-        time.sleep(DELAY_SECONDS)
+        with stages.time("delay"):
+            time.sleep(DELAY_SECONDS)
 
         # (3) 캐시 무효화 (Invalidation)
         # [핵심] 값을 계산해서 redis_client.set() 하는 게 아니라, 그냥 지워버립니다.
         # 이렇게 하면 '순서 꼬임'으로 인한 덮어쓰기 문제가 원천 차단됩니다.
-        redis_client.delete(CACHE_KEY)
-        
-        # (4) 응답을 위해 현재 DB 값 조회 (선택 사항)
-        # 실제 API 응답을 위해 최신 값을 DB에서 다시 읽어옵니다.
-        # (혹은 위 UPDATE 문 실행 시 리턴받을 수도 있음)
-        db_cursor.execute("SELECT view_count FROM content WHERE id = %s", (post_id,))
-        row = db_cursor.fetchone()
-        final_count = row[0]
+        # 보호가 켜져 있으면 지우기 직전 값을 stale 복사본으로 남기고, 진행 중인 채우기 임대도 취소합니다.
+        with stages.time("cache_write"):
+            stampede_guard.invalidate(post_id)
         
-        logger.info(f"Updated DB to {final_count} and Deleted Cache")
+        log_sampler.logger(logger, "request").info("Updated DB to %s and Deleted Cache", final_count)
 
         return jsonify({
             "status": "success",
@@ -83,10 +86,48 @@ def increment_view_count(post_id):
             except: pass
         return jsonify({"error": str(e)}), 500
     finally:
-        if db_conn:
-            db_conn.close()
+        db_pool.release(db_conn)
+
+# --------------------
+# 3. 읽기 (Cache-Aside + 스탬피드 방지)
+# --------------------
+@app.route('/api/view/<int:post_id>', methods=['GET'])
+def get_view_count(post_id):
+    try:
+        with stages.time("cache_fill"):
+            count, source = stampede_guard.get(post_id)
+    except Exception as e:
+        logger.error(f"Error: {e}")
+        return jsonify({"error": str(e)}), 500
+    if count is None:
+        return jsonify({"error": f"Post {post_id} not found"}), 404
+    return jsonify({"post_id": post_id, "view_count": count, "source": source})
+
+@app.route('/api/stampede/stats', methods=['GET'])
+def stampede_stats():
+    # 읽기 대비 DB 로딩 횟수(db_loads_per_read), stale 응답 / 대기 / 조기 갱신 횟수
+    return jsonify(stampede_guard.stats())
+
+@app.route('/admin/stampede/<mode>', methods=['PUT'])
+def set_stampede_protection(mode):
+    # 같은 부하에서 보호 on/off 의 DB 부하를 비교할 때 사용
+    if mode not in ("on", "off"):
+        return jsonify({"error": "mode must be 'on' or 'off'"}), 400
+    stampede_guard.enabled = mode == "on"
+    logger.info(f"Stampede protection: {mode}")
+    return jsonify(stampede_guard.stats())
+
+@app.route('/metrics', methods=['GET'])
+def metrics():
+    # 단계별 지연 히스토그램 (Prometheus 텍스트 형식)
+    return Response(stage_metrics.prometheus(), content_type=CONTENT_TYPE)
+
+@app.route('/api/pool/stats', methods=['GET'])
+def pool_stats():
+    # DB 연결 풀 대기 시간 / 사용률 (풀 크기 산정용)
+    return jsonify(db_pool.stats())
 
 if __name__ == '__main__':
-    logger.info("Starting API Server with Write-Through (Cache Deletion)...")
-    redis_client.set(CACHE_KEY, 0)
+    logger.info(f"Starting API Server with Write-Through (Cache Deletion, stampede protection: {STAMPEDE_PROTECTION})...")
+    cache_warmer.run()
     app.run(host='0.0.0.0', port=5000, threaded=True, debug=False)
@@ -0,0 +1,538 @@
+"""
+조회수 증가 API 부하 테스트 / 정합성 검증 도구 (ConcurrencyTester.java 대체)
+
+예시)
+  # Java 테스터와 같은 조건: 50 스레드 x 100회 (closed loop)
+  python bench.py --url http://127.0.0.1:5000 --concurrency 50 --requests 5000 --verify --label incr
+
+  # 초당 500건 고정 도착률(open loop)로 30초, 게시글 1000개에 Zipf 분산
+  python bench.py --rate 500 --duration 30 --posts 1000 --zipf 1.1 --verify
+
+  # 결과 저장 및 이전 실행과 비교
+  python bench.py ... --out results/incr.json --csv results/all.csv --compare results/incr_prev.json
+
+  # 통합 서버(server.py)에서 모든 전략을 차례로 전환하며 측정 → README 비교표 형식으로 출력
+  python bench.py --concurrency 50 --requests 5000 --verify --sweep all --out results/sweep.json
+"""
+import argparse
+import bisect
+import csv
+import http.client
+import json
+import os
+import random
+import sys
+import threading
+import time
+from urllib.parse import urlsplit
+
+from histogram import LatencyHistogram
+
+# 앱 서버들과 같은 기본 접속 정보
+DB_CONFIG = {
+    "user": "w11",
+    "password": "q1w2e3r4",
+    "host": "127.0.0.1",
+    "database": "w11_exam",
+}
+
+REDIS_CONFIG = {
+    "host": "127.0.0.1",
+    "port": 6379,
+    "decode_responses": True
+}
+
+
+# --------------------
+# 게시글 선택 (Zipf)
+# --------------------
+class ZipfPicker:
+    """게시글 1..n 을 순위 k 의 확률 ∝ 1 / k^s 로 선택합니다."""
+
+    def __init__(self, n, s):
+        self.n = n
+        weights = [1.0 / (k ** s) for k in range(1, n + 1)]
+        total = sum(weights)
+        acc = 0.0
+        self.cdf = []
+        for w in weights:
+            acc += w
+            self.cdf.append(acc / total)
+
+    def pick(self, rng):
+        if self.n == 1:
+            return 1
+        return min(bisect.bisect_left(self.cdf, rng.random()), self.n - 1) + 1
+
+
+# --------------------
+# HTTP 워커
+# --------------------
+class Worker:
+    def __init__(self, base_url, path, method, timeout, read_path=None):
+        parts = urlsplit(base_url)
+        self.host = parts.hostname
+        self.port = parts.port or 80
+        self.path = path
+        self.method = method
+        self.read_path = read_path  # 읽기/쓰기 혼합 부하에서 읽기 요청(GET) 경로
+        self.timeout = timeout
+        self.conn = None
+        self.hist = LatencyHistogram()
+        self.read_hist = LatencyHistogram()
+        self.reads = 0
+        self.ok = 0
+        self.errors = 0
+        self.status_counts = {}
+        self.ok_per_post = {}
+
+    def call(self, post_id, intended_start=None, read=False):
+        start = time.perf_counter()
+        status = None
+        try:
+            if self.conn is None:
+                self.conn = http.client.HTTPConnection(self.host, self.port, timeout=self.timeout)
+            if read:
+                self.conn.request("GET", self.read_path.format(post_id=post_id))
+            else:
+                self.conn.request(self.method, self.path.format(post_id=post_id))
+            resp = self.conn.getresponse()
+            resp.read()
+            status = resp.status
+            if resp.getheader("Connection", "").lower() == "close" or resp.version == 10:
+                self.conn.close()
+                self.conn = None
+        except Exception:
+            status = "exception"
+            if self.conn is not None:
+                self.conn.close()
+                self.conn = None
+        # open loop 에서는 '보내기로 예정된 시각' 기준으로 지연을 잽니다 (coordinated omission 보정)
+        elapsed = time.perf_counter() - (intended_start if intended_start is not None else start)
+        self.hist.record(elapsed * 1_000_000)
+        if read:
+            self.reads += 1
+            self.read_hist.record(elapsed * 1_000_000)
+        self.status_counts[str(status)] = self.status_counts.get(str(status), 0) + 1
+        if status in (200, 202):  # 202: 백엔드 장애로 저널에 기록됨 (나중에 반영)
+            self.ok += 1
+            if not read:  # 정합성 검증은 성공한 증가 요청만 셈
+                self.ok_per_post[post_id] = self.ok_per_post.get(post_id, 0) + 1
+        else:
+            self.errors += 1
+
+
+def run_closed_loop(args, picker, workers):
+    """각 워커가 응답을 받자마자 다음 요청을 보냅니다. (Java 테스터와 같은 방식)"""
+    remaining = [args.requests]
+    lock = threading.Lock()
+    deadline = time.monotonic() + args.duration if args.duration else None
+
+    def loop(worker, seed):
+        rng = random.Random(seed)
+        while True:
+            if deadline is not None and time.monotonic() >= deadline:
+                return
+            if args.requests:
+                with lock:
+                    if remaining[0] <= 0:
+                        return
+                    remaining[0] -= 1
+            worker.call(picker.pick(rng), read=rng.random() < args.read_ratio)
+
+    return _run_threads([threading.Thread(target=loop, args=(w, i)) for i, w in enumerate(workers)])
+
+
+def run_open_loop(args, picker, workers):
+    """응답과 무관하게 --rate 로 정해진 간격(포아송 도착)마다 요청을 예약합니다."""
+    total = args.requests or int(args.rate * args.duration)
+    interval = 1.0 / args.rate
+    start = time.perf_counter()
+    rng = random.Random(0)
+    # 예약 시각을 미리 계산하여 워커들이 공유하는 인덱스로 꺼내 씁니다.
+    schedule = []
+    t = 0.0
+    for _ in range(total):
+        schedule.append((start + t, picker.pick(rng), rng.random() < args.read_ratio))
+        t += rng.expovariate(1.0 / interval) if args.poisson else interval
+    cursor = [0]
+    lock = threading.Lock()
+
+    def loop(worker):
+        while True:
+            with lock:
+                i = cursor[0]
+                if i >= total:
+                    return
+                cursor[0] += 1
+            intended, post_id, read = schedule[i]
+            delay = intended - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+            worker.call(post_id, intended_start=intended, read=read)
+
+    return _run_threads([threading.Thread(target=loop, args=(w,)) for w in workers])
+
+
+def _run_threads(threads):
+    started = time.perf_counter()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    return time.perf_counter() - started
+
+
+# --------------------
+# Redis / DB 정합성 검증
+# --------------------
+class Verifier:
+    """실행 전/후 Redis 와 DB 값을 읽어 유실률과 Redis↔DB 차이를 계산합니다."""
+
+    def __init__(self, args, post_ids):
+        import redis
+        import pymysql
+        from post_keys import CounterKeySpace
+        from hot_keys import ShardedCounters
+
+        self.redis = redis.Redis(**dict(REDIS_CONFIG, host=args.redis_host, port=args.redis_port))
+        self.db_config = dict(DB_CONFIG, host=args.db_host)
+        self.pymysql = pymysql
+        self.keyspace = CounterKeySpace(args.key_encoding)
+        # 서버가 핫 게시글을 분산 키로 나눴을 수 있으므로 분산 키 합계까지 더해 읽음
+        self.counters = ShardedCounters(self.redis, self.keyspace, enabled=True)
+        self.post_ids = post_ids
+
+    def snapshot(self):
+        self.counters.refresh()
+        values = self.counters.mget(self.post_ids)
+        redis_counts = {pid: int(v) if v is not None else None for pid, v in zip(self.post_ids, values)}
+        conn = self.pymysql.connect(**self.db_config)
+        try:
+            with conn.cursor() as cur:
+                db_counts = {}
+                for i in range(0, len(self.post_ids), 1000):
+                    chunk = self.post_ids[i:i + 1000]
+                    placeholders = ", ".join(["%s"] * len(chunk))
+                    cur.execute(f"SELECT id, view_count FROM content WHERE id IN ({placeholders})", chunk)
+                    db_counts.update(dict(cur.fetchall()))
+        finally:
+            conn.close()
+        return redis_counts, db_counts
+
+    @staticmethod
+    def compare(before, after, ok_per_post):
+        (redis_before, db_before), (redis_after, db_after) = before, after
+        expected = sum(ok_per_post.values())
+        redis_delta = db_delta = drift = 0
+        drifted_posts = 0
+        for pid, r_after in redis_after.items():
+            r_before = redis_before.get(pid) or 0
+            redis_delta += (r_after or 0) - r_before
+            d_after = db_after.get(pid)
+            if d_after is not None:
+                db_delta += d_after - (db_before.get(pid) or 0)
+            if r_after is not None and d_after is not None and r_after != d_after:
+                drifted_posts += 1
+                drift += abs(r_after - d_after)
+        return {
+            "expected": expected,
+            "redis_delta": redis_delta,
+            "db_delta": db_delta,
+            "redis_loss_rate": round(1 - redis_delta / expected, 6) if expected else 0.0,
+            "db_loss_rate": round(1 - db_delta / expected, 6) if expected else 0.0,
+            "redis_db_drift": drift,
+            "drifted_posts": drifted_posts,
+        }
+
+
+# --------------------
+# 결과 저장 / 비교
+# --------------------
+def flatten(d, prefix=""):
+    out = {}
+    for k, v in d.items():
+        key = f"{prefix}{k}"
+        if isinstance(v, dict):
+            out.update(flatten(v, key + "."))
+        else:
+            out[key] = v
+    return out
+
+
+def write_csv(path, result):
+    row = flatten({k: v for k, v in result.items() if k != "status_counts"})
+    exists = os.path.exists(path)
+    fields = list(row)
+    if exists:
+        with open(path, newline="") as f:
+            header = next(csv.reader(f), None)
+        if header:
+            fields = header + [k for k in row if k not in header]
+    with open(path, "a" if exists else "w", newline="") as f:
+        writer = csv.DictWriter(f, fieldnames=fields, extrasaction="ignore")
+        if not exists:
+            writer.writeheader()
+        writer.writerow(row)
+
+
+COMPARE_KEYS = [
+    "summary.throughput_rps", "latency_ms.p50", "latency_ms.p90", "latency_ms.p99", "latency_ms.p999",
+    "latency_ms.max", "consistency.redis_loss_rate", "consistency.db_loss_rate", "consistency.redis_db_drift",
+]
+
+
+def print_compare(prev, cur):
+    prev, cur = flatten(prev), flatten(cur)
+    print(f"\n{'metric':<32}{'previous':>14}{'current':>14}{'change':>10}")
+    for key in COMPARE_KEYS:
+        if key not in prev and key not in cur:
+            continue
+        a, b = prev.get(key), cur.get(key)
+        change = ""
+        if isinstance(a, (int, float)) and isinstance(b, (int, float)) and a:
+            change = f"{(b - a) / a * 100:+.1f}%"
+        print(f"{key:<32}{str(a):>14}{str(b):>14}{change:>10}")
+
+
+# --------------------
+# 전략 스윕 (server.py 전용)
+# --------------------
+ALL_STRATEGIES = ["basic", "lock", "record_lock", "cas", "cas_lua", "incr",
+                  "write_through", "write_through_invalidate", "dcl"]
+
+
+def admin_request(args, method, path):
+    parts = urlsplit(args.url)
+    conn = http.client.HTTPConnection(parts.hostname, parts.port or 80, timeout=args.timeout)
+    try:
+        conn.request(method, path)
+        resp = conn.getresponse()
+        body = resp.read()
+        if resp.status != 200:
+            raise RuntimeError(f"{method} {path} failed: {resp.status} {body!r}")
+        return json.loads(body)
+    finally:
+        conn.close()
+
+
+def switch_strategy(args, name):
+    admin_request(args, "PUT", f"/admin/strategy/{name}")
+
+
+# --------------------
+# 로깅 비용 측정 (server.py 전용)
+# --------------------
+def run_logging_cost(args):
+    """
+    같은 부하를 요청 로그 켬(INFO) / 끔(WARNING) 으로 한 번씩 실행하여
+    지연·처리량 차이와 서버가 보고한 로그 적재 비용을 함께 출력합니다.
+    """
+    runs = {}
+    label = args.label
+    try:
+        for level in ("WARNING", "INFO"):
+            admin_request(args, "PUT", f"/admin/logging/{level}")
+            before = admin_request(args, "GET", "/api/logging/stats")
+            args.label = f"{label}[log={level}]"
+            runs[level] = run(args)
+            after = admin_request(args, "GET", "/api/logging/stats")
+            runs[level]["logging"] = {
+                "records": after.get("records", 0) - before.get("records", 0),
+                "dropped": after.get("dropped", 0) - before.get("dropped", 0),
+                "enqueue_us": after.get("enqueue_us"),
+            }
+    finally:
+        args.label = label
+        admin_request(args, "PUT", "/admin/logging/INFO")
+
+    off, on = runs["WARNING"], runs["INFO"]
+    print(f"\n[logging cost] {label or 'run'}: log off (WARNING) -> log on (INFO)")
+    print_compare(off, on)
+    records = on["logging"]["records"]
+    total = on["summary"]["total"]
+    print(f"log records per request: {records / total if total else 0:.2f}, dropped: {on['logging']['dropped']}")
+    return [off, on]
+
+
+# --------------------
+# 캐시 스탬피드 방지 효과 측정 (write_through_invalidate 전략)
+# --------------------
+def run_stampede_compare(args):
+    """
+    같은 읽기/쓰기 혼합 부하를 스탬피드 방지 끔 / 켬 으로 한 번씩 실행하여
+    읽기 한 번당 DB 로딩 횟수와 stale 응답 비율을 함께 출력합니다.
+    """
+    runs = {}
+    label = args.label
+    try:
+        for mode in ("off", "on"):
+            before = admin_request(args, "PUT", f"/admin/stampede/{mode}")
+            args.label = f"{label}[stampede={mode}]"
+            runs[mode] = run(args)
+            after = admin_request(args, "GET", "/api/stampede/stats")
+            delta = {k: after[k] - before.get(k, 0) for k in after
+                     if isinstance(after[k], int) and not isinstance(after[k], bool)}
+            delta["db_loads_per_read"] = round(delta["db_loads"] / delta["reads"], 4) if delta.get("reads") else 0.0
+            runs[mode]["stampede"] = delta
+    finally:
+        args.label = label
+        admin_request(args, "PUT", "/admin/stampede/on")
+
+    off, on = runs["off"], runs["on"]
+    print(f"\n[stampede] {label or 'run'}: protection off -> on")
+    print_compare(off, on)
+    for mode, r in runs.items():
+        st = r["stampede"]
+        print(f"protection {mode:>3}: reads {st['reads']}, db_loads {st['db_loads']} "
+              f"({st['db_loads_per_read']:.4f}/read), stale {st['stale_served']}, "
+              f"waited {st['waited']}, fallback {st['fallback_loads']}, early {st['early_refreshes']}")
+    return [off, on]
+
+
+def print_sweep_table(results):
+    """README 4.1 전략별 성능 비교 요약과 같은 형식의 표를 출력합니다."""
+    print("\n| 해결 전략 | 총 소요 시간(ms) | p50(ms) | p99(ms) | 처리량(req/s) | Redis 증가량 | 유실률 |")
+    print("| :---: | :---: | :---: | :---: | :---: | :---: | :---: |")
+    for r in results:
+        c = r.get("consistency", {})
+        loss = f"{c['redis_loss_rate'] * 100:.2f}%" if c else "-"
+        print(f"| **{r['meta']['label']}** | {r['summary']['elapsed_s'] * 1000:,.0f} | {r['latency_ms']['p50']} "
+              f"| {r['latency_ms']['p99']} | {r['summary']['throughput_rps']} | {c.get('redis_delta', '-')} | {loss} |")
+
+
+def parse_args(argv=None):
+    p = argparse.ArgumentParser(description="View count API benchmark")
+    p.add_argument("--url", default="http://127.0.0.1:5000", help="API 서버 주소")
+    p.add_argument("--path", default="/api/view/increment/{post_id}", help="요청 경로 ({post_id} 치환)")
+    p.add_argument("--method", default="POST")
+    p.add_argument("--label", default="", help="결과에 함께 기록할 전략 이름 등")
+    p.add_argument("--concurrency", type=int, default=50, help="동시 워커 스레드 수")
+    p.add_argument("--requests", type=int, default=0, help="총 요청 수 (0 이면 --duration 까지)")
+    p.add_argument("--duration", type=float, default=0, help="실행 시간(초)")
+    p.add_argument("--rate", type=float, default=0, help="open loop 도착률(req/s). 0 이면 closed loop")
+    p.add_argument("--poisson", action="store_true", help="open loop 도착 간격을 지수분포로")
+    p.add_argument("--posts", type=int, default=1, help="게시글 1..N 으로 부하 분산")
+    p.add_argument("--zipf", type=float, default=1.0, help="Zipf 지수 s")
+    p.add_argument("--timeout", type=float, default=30.0, help="요청 타임아웃(초)")
+    p.add_argument("--verify", action="store_true", help="실행 전후 Redis/DB 값을 읽어 유실률 계산")
+    p.add_argument("--key-encoding", default="string", choices=["string", "hash"])
+    p.add_argument("--redis-host", default=REDIS_CONFIG["host"])
+    p.add_argument("--redis-port", type=int, default=REDIS_CONFIG["port"])
+    p.add_argument("--db-host", default=DB_CONFIG["host"])
+    p.add_argument("--out", help="결과 JSON 파일 경로")
+    p.add_argument("--csv", help="결과를 한 줄 추가할 CSV 파일 경로")
+    p.add_argument("--compare", help="비교할 이전 결과 JSON 파일")
+    p.add_argument("--sweep", help="server.py 의 전략을 차례로 전환하며 측정 (쉼표 구분 목록 또는 all)")
+    p.add_argument("--logging-cost", action="store_true",
+                   help="server.py 의 로그 레벨을 WARNING / INFO 로 바꿔 가며 두 번 측정하고 차이를 출력")
+    p.add_argument("--read-path", help="읽기 요청 경로 ({post_id} 치환, GET). --read-ratio 와 함께 사용")
+    p.add_argument("--read-ratio", type=float, default=0.0, help="전체 요청 중 읽기 비율 (0~1)")
+    p.add_argument("--stampede", action="store_true",
+                   help="스탬피드 방지를 끔 / 켬 으로 바꿔 가며 두 번 측정하고 DB 로딩 횟수를 비교")
+    args = p.parse_args(argv)
+    if args.sweep:
+        args.sweep = ALL_STRATEGIES if args.sweep == "all" else [s.strip() for s in args.sweep.split(",")]
+    if not args.requests and not args.duration:
+        p.error("--requests 또는 --duration 중 하나는 지정해야 합니다")
+    if args.read_ratio and not args.read_path:
+        p.error("--read-ratio 에는 --read-path 가 필요합니다")
+    if args.rate and not args.requests and not args.duration:
+        p.error("open loop 에는 --requests 또는 --duration 이 필요합니다")
+    return args
+
+
+def run(args):
+    picker = ZipfPicker(args.posts, args.zipf)
+    workers = [Worker(args.url, args.path, args.method, args.timeout, args.read_path) for _ in range(args.concurrency)]
+
+    verifier = Verifier(args, list(range(1, args.posts + 1))) if args.verify else None
+    before = verifier.snapshot() if verifier else None
+
+    mode = "open" if args.rate else "closed"
+    started_at = time.strftime("%Y-%m-%dT%H:%M:%S")
+    elapsed = run_open_loop(args, picker, workers) if args.rate else run_closed_loop(args, picker, workers)
+
+    hist = LatencyHistogram()
+    read_hist = LatencyHistogram()
+    ok = errors = reads = 0
+    status_counts, ok_per_post = {}, {}
+    for w in workers:
+        hist.merge(w.hist)
+        read_hist.merge(w.read_hist)
+        reads += w.reads
+        ok += w.ok
+        errors += w.errors
+        for k, v in w.status_counts.items():
+            status_counts[k] = status_counts.get(k, 0) + v
+        for k, v in w.ok_per_post.items():
+            ok_per_post[k] = ok_per_post.get(k, 0) + v
+
+    result = {
+        "meta": {
+            "label": args.label, "url": args.url + args.path, "mode": mode, "started_at": started_at,
+            "concurrency": args.concurrency, "requests": args.requests, "duration": args.duration,
+            "rate": args.rate, "posts": args.posts, "zipf": args.zipf, "read_ratio": args.read_ratio,
+        },
+        "summary": {
+            "total": ok + errors, "ok": ok, "errors": errors,
+            "elapsed_s": round(elapsed, 3),
+            "throughput_rps": round((ok + errors) / elapsed, 2) if elapsed else 0.0,
+        },
+        "latency_ms": hist.summary(scale=0.001),
+        "status_counts": status_counts,
+    }
+    if reads:
+        result["summary"]["reads"] = reads
+        result["read_latency_ms"] = read_hist.summary(scale=0.001)
+    if verifier:
+        # 서버 쪽 비동기 반영(write-behind 등)을 위해 잠시 기다린 뒤 읽습니다.
+        time.sleep(1.0)
+        result["consistency"] = verifier.compare(before, verifier.snapshot(), ok_per_post)
+    return result
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    paired = args.logging_cost or args.stampede
+    if args.stampede:
+        measure = run_stampede_compare
+    elif args.logging_cost:
+        measure = run_logging_cost
+    else:
+        measure = lambda a: [run(a)]
+    if args.sweep:
+        results = []
+        for name in args.sweep:
+            switch_strategy(args, name)
+            args.label = name
+            results.extend(measure(args))
+            print(json.dumps(results[-1], ensure_ascii=False))
+        print_sweep_table(results)
+    else:
+        results = measure(args)
+        print(json.dumps(results if paired else results[0], indent=2, ensure_ascii=False))
+
+    if args.out:
+        os.makedirs(os.path.dirname(os.path.abspath(args.out)), exist_ok=True)
+        with open(args.out, "w") as f:
+            json.dump(results if args.sweep or paired else results[0], f, indent=2, ensure_ascii=False)
+    if args.csv:
+        for result in results:
+            write_csv(args.csv, result)
+    if args.compare:
+        with open(args.compare) as f:
+            previous = json.load(f)
+        # 스윕 결과끼리는 전략(label) 별로 비교
+        previous = previous if isinstance(previous, list) else [previous]
+        by_label = {r["meta"]["label"]: r for r in previous}
+        for result in results:
+            prev = by_label.get(result["meta"]["label"], previous[0] if len(previous) == 1 else None)
+            if prev is not None:
+                print(f"\n[{result['meta']['label'] or 'run'}]")
+                print_compare(prev, result)
+    return 0 if all(r["summary"]["errors"] == 0 for r in results) else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
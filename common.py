@@ -0,0 +1,110 @@
+import logging
+
+import redis
+
+from db_pool import ConnectionPool
+from distributed_lock import LeaseLockManager
+from logging_setup import setup_logging, LogSampler
+from post_keys import CounterKeySpace
+from hot_keys import ShardedCounters
+from unique_viewers import UniqueViewers
+from view_buckets import ViewBuckets
+from warmup import CacheWarmer
+
+# --------------------
+# 공통 설정 (모든 전략 서버가 공유)
+# --------------------
+DB_CONFIG = {
+    "user": "w11",
+    "password": "q1w2e3r4",
+    "host": "127.0.0.1",
+    "database": "w11_exam",
+    # PyMySQL 설정 추가: 커밋을 수동으로 제어
+    "autocommit": False
+}
+
+REDIS_CONFIG = {
+    "host": "127.0.0.1",
+    "port": 6379,
+    "decode_responses": True
+}
+
+KEY_ENCODING = "string"  # "string": post:<id>:view_count / "hash": 게시글 묶음 해시 (post_keys.py 참고)
+# 고의적인 지연 시간 (초 단위)
+# 불일치 유발의 핵심이며, 락 기반 전략에서는 이 시간이 누적되어 전체 성능 저하의 주범이 됨
+DELAY_SECONDS = 0.05  # 50ms
+
+POOL_MAX_SIZE = 20  # 동시에 열어둘 수 있는 최대 DB 연결 수
+
+LOCK_TTL_SECONDS = 5.0              # 분산 락 임대 시간 (보유 중에는 자동 연장, 프로세스가 죽으면 이 시간 뒤 해제)
+LOCK_ACQUIRE_TIMEOUT_SECONDS = 30.0  # 분산 락 획득 대기 한도 (넘으면 503)
+
+# True 면 락 계열 전략의 threading.Lock 을 lock_profiler.ProfiledLock 으로 바꾸고
+# 소유자/대기자 스택 샘플링을 켭니다 (/debug/locks, /debug/locks/folded). 측정할 때만 켜세요.
+LOCK_PROFILING = False
+LOCK_PROFILE_INTERVAL_SECONDS = 0.005
+
+# 시작 시 캐시 워밍업 (warmup.py): 조회수 상위 WARMUP_TOP_N 개를 MySQL 에서 읽어 SET NX
+WARMUP_TOP_N = 100000
+WARMUP_CHUNK_SIZE = 1000     # 서버 측 커서에서 한 번에 받아 파이프라인 하나로 넣을 행 수
+WARMUP_MIN_COVERAGE = 0.9    # server.py 의 /ready 가 200 을 돌려주기 시작하는 진행률 (증가 API 는 완료까지 대기)
+
+# 핫 게시글 카운터 분산 (hot_keys.py): 초당 증가가 HOT_KEY_THRESHOLD 를 넘는 게시글은
+# post:<id>:view_count:<k> 여러 키로 나눠 증가시키고, 읽을 때 합칩니다 (INCR 전략의 동기 경로와 조회 API)
+HOT_KEY_SHARDING = False
+HOT_KEY_THRESHOLD = 1000      # 키 하나가 감당할 초당 증가 수
+HOT_KEY_MAX_SHARDS = 16
+HOT_KEY_WINDOW_SECONDS = 1.0  # 증가율 측정 / 분산 상태 갱신 주기
+HOT_KEY_COOL_WINDOWS = 5      # 증가율이 threshold 의 절반 아래로 이만큼 연속 내려가면 다시 키 하나로 접음
+HOT_KEY_SHARD_CHOICE = "thread"  # thread: 스레드마다 고정된 분산 키 / random: 증가마다 무작위
+
+# 게시글별 순 방문자 수 (unique_viewers.py): 증가 요청의 viewer_id 를 HyperLogLog 에 PFADD
+UNIQUE_VIEWER_DAILY_TTL_DAYS = 35             # 일별 HLL 키를 Redis 에 두는 기간 (지나면 MySQL 사본에서 되살림)
+UNIQUE_VIEWER_PERSIST_INTERVAL_SECONDS = 60.0  # HLL 레지스터를 MySQL post_viewers 에 저장하는 주기
+
+# 시간대별 조회수 (view_buckets.py): 증가마다 분 단위 버킷(Redis) 에도 기록하고 MySQL view_rollup 으로 롤업
+TIME_BUCKETS = True
+TIME_BUCKET_RETENTION_HOURS = 48      # 분 단위 버킷을 Redis 에 두는 시간 (그 이전 구간은 MySQL 에서 읽음)
+TIME_BUCKET_ROLL_INTERVAL_SECONDS = 60.0
+
+# 로깅 설정
+# 요청 스레드는 큐에 넣기만 하고, 포맷팅/stderr 쓰기는 별도 스레드가 합니다. (False 면 기존 basicConfig)
+# 락 구간 안의 로그가 stderr 핸들러 락에서 줄 서는 일을 없앱니다.
+LOG_NON_BLOCKING = True
+LOG_QUEUE_SIZE = 10000  # 가득 차면 기다리지 않고 버림 (/api/logging/stats 의 dropped)
+# 이벤트별 1/N 샘플링 (예: CAS 충돌 로그는 100번에 한 번). 1 이면 모두 남김
+LOG_SAMPLE_EVERY = {
+    "request": 1,         # 요청마다 남기는 진행/결과 로그
+    "cas_conflict": 100,  # CAS 재시도
+}
+setup_logging(logging.INFO, non_blocking=LOG_NON_BLOCKING, queue_size=LOG_QUEUE_SIZE)
+log_sampler = LogSampler(LOG_SAMPLE_EVERY)
+
+# Redis 연결은 요청과 무관하게 미리 설정
+redis_client = redis.Redis(**REDIS_CONFIG)
+# HLL 레지스터처럼 원본 바이트를 다루는 용도 (응답을 문자열로 디코딩하지 않음)
+redis_raw = redis.Redis(**{**REDIS_CONFIG, "decode_responses": False})
+keyspace = CounterKeySpace(KEY_ENCODING)
+hot_keys = ShardedCounters(redis_client, keyspace, enabled=HOT_KEY_SHARDING, threshold=HOT_KEY_THRESHOLD,
+                           max_shards=HOT_KEY_MAX_SHARDS, window=HOT_KEY_WINDOW_SECONDS,
+                           cool_windows=HOT_KEY_COOL_WINDOWS, choice=HOT_KEY_SHARD_CHOICE)
+
+# DB 연결 풀 (요청마다 connect/close 하지 않고 재사용)
+# 한 프로세스 안의 모든 전략이 같은 풀을 공유합니다.
+# 50 스레드 부하 기준으로 /api/pool/stats 의 대기 시간·사용률을 보고 크기를 조정합니다.
+db_pool = ConnectionPool(DB_CONFIG, max_size=POOL_MAX_SIZE)
+
+# 여러 워커/호스트에 걸친 락 (app_lock.py / app_record_lock.py 의 DISTRIBUTED_LOCK = True 일 때 사용)
+lease_locks = LeaseLockManager(redis_client, ttl=LOCK_TTL_SECONDS, acquire_timeout=LOCK_ACQUIRE_TIMEOUT_SECONDS)
+
+# 각 서버의 __main__ 에서 캐시를 0 으로 초기화하던 대신 MySQL 값으로 채움
+cache_warmer = CacheWarmer(redis_client, db_pool, keyspace, top_n=WARMUP_TOP_N,
+                           chunk_size=WARMUP_CHUNK_SIZE, min_coverage=WARMUP_MIN_COVERAGE)
+
+# 순 방문자 HLL 과 MySQL 영속화 (INCR 전략 서버가 persister 를 시작)
+unique_viewers = UniqueViewers(redis_client, redis_raw, db_pool, daily_ttl_days=UNIQUE_VIEWER_DAILY_TTL_DAYS,
+                               persist_interval=UNIQUE_VIEWER_PERSIST_INTERVAL_SECONDS)
+
+# 시간대별 조회수 버킷과 MySQL 롤업 (INCR 전략 서버가 roller 를 시작)
+view_buckets = ViewBuckets(redis_client, db_pool, retention_hours=TIME_BUCKET_RETENTION_HOURS,
+                           roll_interval=TIME_BUCKET_ROLL_INTERVAL_SECONDS)
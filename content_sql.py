@@ -0,0 +1,16 @@
+# --------------------
+# content 테이블 공통 SQL
+# --------------------
+
+# UPDATE 와 동시에 증가 후 값을 돌려받는 MySQL 관용구.
+# LAST_INSERT_ID(expr) 는 expr 값을 이 연결의 LAST_INSERT_ID 로 저장하고, 서버가 UPDATE 의 OK 패킷에
+# 그 값을 실어 보내므로 PyMySQL 에서는 cursor.lastrowid 로 바로 읽을 수 있습니다 (SELECT 왕복 없음).
+# 같은 문장 안에서 잠근 행의 값이므로 다른 요청의 증가가 섞이지 않습니다.
+# (MariaDB 의 RETURNING 은 INSERT/DELETE 에만 있고 UPDATE 에는 없어서 이 방식을 사용합니다)
+INCREMENT_RETURNING_SQL = "UPDATE content SET view_count = LAST_INSERT_ID(view_count + %s) WHERE id = %s"
+
+
+def increment_returning(cursor, post_id, delta=1):
+    """view_count 를 delta 만큼 올리고 올린 뒤의 값을 반환합니다. 게시글이 없으면 None."""
+    cursor.execute(INCREMENT_RETURNING_SQL, (delta, post_id))
+    return cursor.lastrowid if cursor.rowcount else None
@@ -0,0 +1,248 @@
+import time
+import uuid
+import logging
+import threading
+import itertools
+
+logger = logging.getLogger(__name__)
+
+
+FLUSH_MARKER_PREFIX = "counter_buffer:flush:"
+FLUSH_MARKER_TTL_SECONDS = 3600  # 반영 여부를 확인할 수 있는 시간 (Redis 장애가 이보다 길면 재전송으로 간주)
+
+
+class _Stripe:
+    __slots__ = ("lock", "counts")
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.counts = {}
+
+
+class CounterBuffer:
+    """
+    프로세스 내 조회수 집계 버퍼 (Striped Counter).
+
+    요청마다 Redis 왕복을 하지 않고, 각 워커 스레드가 자기 전용 stripe 에만 +1 합니다.
+    stripe 는 스레드가 처음 들어올 때 라운드로빈으로 배정되므로 스레드 수가
+    stripe 수 이하이면 서로 락 경합이 없습니다.
+    백그라운드 스레드가 flush_interval 마다 stripe 를 비워, 게시글별 INCRBY 한 번씩을
+    하나의 파이프라인으로 Redis 에 보냅니다.
+
+    [응답 값의 정확도 (staleness bound)]
+    approximate() 는 "마지막 플러시에서 Redis 가 돌려준 값 + 전송 중인 증가분 + 호출한 스레드 stripe 의 미반영 증가분" 입니다.
+    요청 경로가 전역 락이나 다른 stripe 를 건드리지 않도록, 같은 프로세스의 다른 스레드 증가분은
+    최대 flush_interval 만큼, 다른 프로세스의 증가분은 최대
+    (그 프로세스의 flush_interval + 이 프로세스의 flush_interval + Redis 왕복 시간) 만큼 늦게 반영됩니다.
+    """
+
+    def __init__(self, redis_client, keyspace, stripes=16, flush_interval=0.005, on_flush=None, hot_keys=None):
+        self.redis = redis_client
+        self.keyspace = keyspace  # post_keys.CounterKeySpace
+        self.hot_keys = hot_keys  # hot_keys.ShardedCounters (없으면 기존 키만 증가 / 읽기)
+        self.flush_interval = flush_interval
+        # on_flush(pipe, post_id, n): 같은 파이프라인에 추가 명령을 붙이는 훅 (예: write-behind delta)
+        self.on_flush = on_flush
+
+        self._stripes = [_Stripe() for _ in range(stripes)]
+        self._next_stripe = itertools.count()
+        self._local = threading.local()
+
+        # 마지막 플러시 결과와 현재 전송 중인 증가분 (approximate() 계산용)
+        # 플러시 스레드만 값을 바꾸고 요청 경로는 락 없이 읽기만 합니다 (dict 단일 연산은 GIL 로 원자적).
+        self._known = {}
+        self._sending = {}
+
+        # 플러시마다 MULTI 안에서 표식 키(FLUSH_MARKER_PREFIX<id>) 를 같이 SET 합니다.
+        # 응답을 받기 전에 연결이 끊기면 EXEC 가 반영됐는지 알 수 없으므로, (표식 키, 증가분) 을 남겨 두고
+        # 다음 플러시 전에 표식 키가 있는지 보고 반영 여부를 확정합니다 (있으면 반영됨, 없으면 되돌려 재전송).
+        self._flush_prefix = f"{FLUSH_MARKER_PREFIX}{uuid.uuid4().hex}:"
+        self._flush_seq = itertools.count(1)
+        self._unconfirmed = None
+
+        self._stop = threading.Event()
+        self._thread = None
+
+        # 통계
+        self._flushes = 0
+        self._empty_flushes = 0
+        self._failed_flushes = 0
+        self._ambiguous_flushes = 0   # 응답 없이 끊겨 반영 여부를 표식 키로 확인해야 했던 플러시
+        self._ambiguous_applied = 0   # 그중 이미 반영되어 있던 것 (되돌렸다면 두 번 셀 뻔한 경우)
+        self._increments_flushed = 0
+        self._max_batch_posts = 0
+        # 플러시 1회당 게시글 수 분포 (2의 거듭제곱 버킷: 1, 2, 4, 8, ...)
+        self._batch_size_buckets = {}
+
+    # --------------------
+    # 요청 경로
+    # --------------------
+    def _my_stripe(self):
+        stripe = getattr(self._local, "stripe", None)
+        if stripe is None:
+            stripe = self._stripes[next(self._next_stripe) % len(self._stripes)]
+            self._local.stripe = stripe
+        return stripe
+
+    def add(self, post_id, n=1):
+        """로컬 stripe 에 증가분을 기록하고 근사 누적값을 반환합니다."""
+        stripe = self._my_stripe()
+        with stripe.lock:
+            pending = stripe.counts.get(post_id, 0) + n
+            stripe.counts[post_id] = pending
+        return self._base(post_id) + pending
+
+    def approximate(self, post_id):
+        stripe = self._my_stripe()
+        return self._base(post_id) + stripe.counts.get(post_id, 0)
+
+    def _base(self, post_id):
+        known = self._known.get(post_id)
+        if known is None:
+            # 처음 보는 게시글이면 한 번만 Redis 에서 현재 값을 읽어 기준값으로 사용
+            if self.hot_keys:
+                value = self.hot_keys.mget([post_id])[0]
+            else:
+                value = self.keyspace.get(self.redis, post_id)
+            known = self._known.setdefault(post_id, int(value) if value is not None else 0)
+        return known + self._sending.get(post_id, 0)
+
+    # --------------------
+    # 플러시
+    # --------------------
+    def _drain(self):
+        merged = {}
+        for stripe in self._stripes:
+            if not stripe.counts:
+                continue
+            with stripe.lock:
+                counts, stripe.counts = stripe.counts, {}
+            for post_id, n in counts.items():
+                merged[post_id] = merged.get(post_id, 0) + n
+        return merged
+
+    def flush_once(self):
+        # 지난 플러시가 응답 없이 끊겼으면 반영 여부부터 확정 (Redis 가 아직 죽어 있으면 여기서 다시 실패)
+        if self._unconfirmed is not None:
+            self._confirm()
+
+        # 플러시 스레드가 하나뿐이라는 전제에서 _sending 을 통째로 교체합니다.
+        merged = self._drain()
+        self._sending = merged
+        if not merged:
+            self._empty_flushes += 1
+            return 0
+
+        post_ids = list(merged)
+        marker = f"{self._flush_prefix}{next(self._flush_seq)}"
+        try:
+            # MULTI 안의 증가와 표식 키는 함께 반영되거나 함께 빠짐
+            pipe = self.redis.pipeline(transaction=True)
+            # 게시글마다 증가 명령 구간 (핫 게시글은 분산 키 증가 + 합계 읽기, on_flush 가 명령을 덧붙일 수도 있음)
+            spans = []
+            for post_id in post_ids:
+                start = len(pipe)
+                if self.hot_keys:
+                    n = self.hot_keys.queue_incr(pipe, post_id, merged[post_id])
+                else:
+                    n = 1
+                    self.keyspace.incr(pipe, post_id, merged[post_id])
+                spans.append((start, n))
+                if self.on_flush:
+                    self.on_flush(pipe, post_id, merged[post_id])
+            pipe.set(marker, 1, ex=FLUSH_MARKER_TTL_SECONDS)
+            results = pipe.execute(raise_on_error=False)
+        except Exception:
+            # EXEC 전에 끊겼는지 후에 끊겼는지 모름 → 전체를 되돌리면 두 번 셀 수 있으므로 표식 키로 확인
+            self._ambiguous_flushes += 1
+            self._failed_flushes += 1
+            self._unconfirmed = (marker, merged)
+            try:
+                self._confirm()
+            except Exception:
+                pass  # 다음 플러시 전에 다시 확인 (그동안 _sending 에 남아 approximate() 에 포함됨)
+            raise
+
+        # EXEC 안에서 개별 명령이 실패한 게시글(WRONGTYPE 등)만 되돌림 (나머지는 이미 반영됨)
+        failed = {}
+        for post_id, (start, n) in zip(post_ids, spans):
+            span = results[start:start + n]
+            if isinstance(span[0], Exception):
+                failed[post_id] = merged[post_id]
+            elif any(isinstance(result, Exception) for result in span):
+                continue  # 증가는 반영됨, 합계 읽기만 실패 → 기준값은 다음 플러시에 갱신
+            elif self.hot_keys:
+                self._known[post_id] = self.hot_keys.total(span)
+            else:
+                self._known[post_id] = int(span[0])
+        if failed:
+            self._requeue(failed)
+            raise next(r for r in results if isinstance(r, Exception))
+        self._sending = {}
+
+        batch = len(post_ids)
+        bucket = 1 << (batch - 1).bit_length()
+        self._batch_size_buckets[bucket] = self._batch_size_buckets.get(bucket, 0) + 1
+        self._flushes += 1
+        self._increments_flushed += sum(merged.values())
+        if batch > self._max_batch_posts:
+            self._max_batch_posts = batch
+        return batch
+
+    def _confirm(self):
+        marker, merged = self._unconfirmed
+        if self.redis.exists(marker):
+            # 반영됨: 결과 값은 받지 못했으므로 기준값에 증가분만 더해 둠 (다음 플러시가 정확한 값으로 갱신)
+            for post_id, n in merged.items():
+                if post_id in self._known:
+                    self._known[post_id] += n
+            self._ambiguous_applied += 1
+            self._sending = {}
+        else:
+            self._requeue(merged, failed=False)
+        self._unconfirmed = None
+
+    def _requeue(self, counts, failed=True):
+        """반영되지 않은 증가분을 첫 번째 stripe 로 되돌려 다음 주기에 재시도합니다."""
+        stripe = self._stripes[0]
+        with stripe.lock:
+            for post_id, n in counts.items():
+                stripe.counts[post_id] = stripe.counts.get(post_id, 0) + n
+        self._sending = {}
+        if failed:
+            self._failed_flushes += 1
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name="counter-buffer-flusher", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread:
+            self._thread.join()
+        self.flush_once()
+
+    def _run(self):
+        while not self._stop.wait(self.flush_interval):
+            try:
+                self.flush_once()
+            except Exception as e:
+                logger.error(f"Counter buffer flush failed: {e}", exc_info=True)
+                # Redis 장애 시 로그 폭주를 막기 위해 잠시 쉬어감
+                time.sleep(min(1.0, self.flush_interval * 100))
+
+    def stats(self):
+        flushes = self._flushes
+        return {
+            "stripes": len(self._stripes),
+            "flush_interval_ms": self.flush_interval * 1000,
+            "flushes": flushes,
+            "empty_flushes": self._empty_flushes,
+            "failed_flushes": self._failed_flushes,
+            "ambiguous_flushes": self._ambiguous_flushes,
+            "ambiguous_applied": self._ambiguous_applied,
+            "increments_flushed": self._increments_flushed,
+            "avg_increments_per_flush": round(self._increments_flushed / flushes, 2) if flushes else 0.0,
+            "max_batch_posts": self._max_batch_posts,
+            "batch_posts_histogram": {str(k): v for k, v in sorted(self._batch_size_buckets.items())},
+        }
@@ -0,0 +1,241 @@
+import time
+import logging
+import threading
+from collections import deque
+from contextlib import contextmanager
+
+import pymysql
+
+logger = logging.getLogger(__name__)
+
+
+class PoolTimeout(Exception):
+    """풀에서 정해진 시간 안에 연결을 얻지 못했을 때 발생합니다."""
+
+
+class ConnectionPool:
+    """
+    스레드 안전한 MySQL 연결 풀.
+
+    요청마다 pymysql.connect() 를 호출하면 TCP 핸드셰이크 + MySQL 인증 비용이
+    매번 발생합니다. 이 풀은 연결을 재사용하면서 다음을 보장합니다.
+
+    * max_size 를 넘는 연결은 만들지 않음 (초과 요청은 checkout_timeout 까지 대기)
+    * 체크아웃 시 일정 시간 이상 놀았던 연결은 ping 으로 상태 확인 (Health Check)
+    * max_idle_seconds 이상 사용되지 않은 연결은 정리 (Idle Eviction)
+    * 대기 시간 / 사용률 통계 (stats) 제공 → 50 스레드 부하에서 풀 크기 산정용
+    """
+
+    def __init__(self, db_config, max_size=20, checkout_timeout=5.0,
+                 max_idle_seconds=60.0, health_check_after=1.0, evict_interval=10.0):
+        self._db_config = dict(db_config)
+        self.max_size = max_size
+        self.checkout_timeout = checkout_timeout
+        self.max_idle_seconds = max_idle_seconds
+        self.health_check_after = health_check_after
+        self.evict_interval = evict_interval
+
+        # (conn, 마지막 반납 시각) - 오른쪽 끝이 가장 최근에 반납된 연결 (LIFO 재사용)
+        self._idle = deque()
+        self._cond = threading.Condition(threading.Lock())
+        self._open_count = 0  # 현재 열려있는 연결 수 (idle + in_use)
+        self._in_use = 0
+        self._evictor = None
+
+        # 통계
+        self._acquired = 0
+        self._waited = 0          # 즉시 얻지 못하고 대기한 횟수
+        self._wait_total = 0.0
+        self._wait_max = 0.0
+        self._timeouts = 0
+        self._created = 0
+        self._closed = 0
+        self._health_failures = 0
+        self._peak_in_use = 0
+
+    # --------------------
+    # 체크아웃 / 반납
+    # --------------------
+    def acquire(self, timeout=None):
+        timeout = self.checkout_timeout if timeout is None else timeout
+        self._ensure_evictor()
+        start = time.monotonic()
+        deadline = start + timeout
+        waited = False
+
+        while True:
+            conn, idle_since, create = None, None, False
+            with self._cond:
+                while not self._idle and self._open_count >= self.max_size:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        self._timeouts += 1
+                        raise PoolTimeout(
+                            f"No DB connection available within {timeout}s (max_size={self.max_size})")
+                    waited = True
+                    self._cond.wait(remaining)
+
+                if self._idle:
+                    conn, idle_since = self._idle.pop()
+                else:
+                    # 연결 생성은 락 밖에서 수행하되, 자리는 미리 예약해 둡니다.
+                    self._open_count += 1
+                    create = True
+                self._in_use += 1
+
+            try:
+                if create:
+                    conn = self._connect()
+                elif time.monotonic() - idle_since >= self.health_check_after:
+                    conn = self._health_check(conn)
+            except Exception:
+                with self._cond:
+                    self._in_use -= 1
+                    self._open_count -= 1
+                    self._cond.notify()
+                raise
+
+            if conn is None:
+                # 헬스 체크 실패로 버려진 연결 → 다시 시도
+                with self._cond:
+                    self._in_use -= 1
+                    self._open_count -= 1
+                    self._cond.notify()
+                continue
+
+            wait = time.monotonic() - start
+            with self._cond:
+                self._acquired += 1
+                self._wait_total += wait
+                if wait > self._wait_max:
+                    self._wait_max = wait
+                if waited:
+                    self._waited += 1
+                if self._in_use > self._peak_in_use:
+                    self._peak_in_use = self._in_use
+            return conn
+
+    def release(self, conn, discard=False):
+        if conn is None:
+            return
+        if not discard and not conn.open:
+            discard = True
+
+        if discard:
+            self._close(conn)
+            with self._cond:
+                self._in_use -= 1
+                self._open_count -= 1
+                self._cond.notify()
+            return
+
+        with self._cond:
+            self._in_use -= 1
+            self._idle.append((conn, time.monotonic()))
+            self._cond.notify()
+
+    @contextmanager
+    def connection(self):
+        conn = self.acquire()
+        try:
+            yield conn
+        except Exception:
+            try:
+                conn.rollback()
+            except Exception:
+                self.release(conn, discard=True)
+                conn = None
+            raise
+        finally:
+            self.release(conn)
+
+    # --------------------
+    # 내부 유틸
+    # --------------------
+    def _connect(self):
+        conn = pymysql.connect(**self._db_config)
+        with self._cond:
+            self._created += 1
+        return conn
+
+    def _close(self, conn):
+        try:
+            conn.close()
+        except Exception:
+            pass
+        with self._cond:
+            self._closed += 1
+
+    def _health_check(self, conn):
+        try:
+            conn.ping(reconnect=False)
+            return conn
+        except Exception as e:
+            logger.warning(f"Pooled connection failed health check, discarding: {e}")
+            with self._cond:
+                self._health_failures += 1
+            self._close(conn)
+            return None
+
+    def evict_idle(self):
+        """max_idle_seconds 이상 놀고 있는 연결을 닫습니다. 닫은 개수를 반환합니다."""
+        now = time.monotonic()
+        expired = []
+        with self._cond:
+            # 왼쪽 끝이 가장 오래 놀았던 연결
+            while self._idle and now - self._idle[0][1] >= self.max_idle_seconds:
+                expired.append(self._idle.popleft()[0])
+                self._open_count -= 1
+            if expired:
+                self._cond.notify_all()
+        for conn in expired:
+            self._close(conn)
+        return len(expired)
+
+    def _ensure_evictor(self):
+        if self._evictor is not None:
+            return
+        with self._cond:
+            if self._evictor is not None:
+                return
+            self._evictor = threading.Thread(target=self._evict_loop, name="db-pool-evictor", daemon=True)
+            self._evictor.start()
+
+    def _evict_loop(self):
+        while True:
+            time.sleep(self.evict_interval)
+            try:
+                self.evict_idle()
+            except Exception as e:
+                logger.error(f"Idle eviction failed: {e}")
+
+    def close_all(self):
+        with self._cond:
+            idle = [conn for conn, _ in self._idle]
+            self._idle.clear()
+            self._open_count -= len(idle)
+        for conn in idle:
+            self._close(conn)
+
+    # --------------------
+    # 통계
+    # --------------------
+    def stats(self):
+        with self._cond:
+            acquired = self._acquired
+            return {
+                "max_size": self.max_size,
+                "open": self._open_count,
+                "in_use": self._in_use,
+                "idle": len(self._idle),
+                "peak_in_use": self._peak_in_use,
+                "utilization": round(self._in_use / self.max_size, 4) if self.max_size else 0.0,
+                "acquired": acquired,
+                "waited": self._waited,
+                "timeouts": self._timeouts,
+                "avg_wait_ms": round(self._wait_total / acquired * 1000, 3) if acquired else 0.0,
+                "max_wait_ms": round(self._wait_max * 1000, 3),
+                "created": self._created,
+                "closed": self._closed,
+                "health_check_failures": self._health_failures,
+            }
@@ -0,0 +1,234 @@
+import time
+import uuid
+import logging
+import threading
+from contextlib import contextmanager
+
+from histogram import LatencyHistogram
+from retry_policy import RetryPolicy, RetryDeadlineExceeded
+from striped_lock import RefCountedLockMap
+
+logger = logging.getLogger(__name__)
+
+
+class LockTimeout(Exception):
+    """acquire_timeout 안에 락을 얻지 못했을 때 발생합니다. (HTTP 503 으로 응답)"""
+
+
+class FencingTokenRejected(Exception):
+    """더 새로운 토큰으로 이미 쓰기가 일어나 이 임대의 쓰기가 거부되었을 때 발생합니다. (HTTP 409 로 응답)"""
+
+
+# 획득: 비어 있으면 owner 로 SET NX PX 후 펜싱 토큰(단조 증가)을 발급, 이미 누가 잡고 있으면 0
+ACQUIRE_SCRIPT = """
+if redis.call('SET', KEYS[1], ARGV[1], 'NX', 'PX', ARGV[2]) then
+    return redis.call('INCR', KEYS[2])
+end
+return 0
+"""
+
+# 갱신 / 해제: 내가 owner 일 때만 TTL 연장 / 삭제
+RENEW_SCRIPT = """
+if redis.call('GET', KEYS[1]) == ARGV[1] then
+    return redis.call('PEXPIRE', KEYS[1], ARGV[2])
+end
+return 0
+"""
+
+RELEASE_SCRIPT = """
+if redis.call('GET', KEYS[1]) == ARGV[1] then
+    return redis.call('DEL', KEYS[1])
+end
+return 0
+"""
+
+# 캐시 펜싱: Redis 의 펜싱 토큰이 아직 내 토큰일 때만 값을 씀 (그 사이 다른 소유자가 잡았으면 0)
+# ARGV[3] 이 빈 문자열이면 string 키 SET, 아니면 해시 필드 HSET (post_keys.CounterKeySpace.location)
+FENCED_SET_SCRIPT = """
+if tonumber(redis.call('GET', KEYS[1]) or '0') ~= tonumber(ARGV[1]) then
+    return 0
+end
+if ARGV[3] == '' then
+    redis.call('SET', KEYS[2], ARGV[2])
+else
+    redis.call('HSET', KEYS[2], ARGV[3], ARGV[2])
+end
+return 1
+"""
+
+# MySQL 펜싱: 저장된 토큰보다 클 때만 갱신. 영향받은 행이 0 이면(= 더 새 토큰이 이미 씀) 거부.
+FENCE_SQL = (
+    "INSERT INTO lock_fence (resource, token) VALUES (%s, %s) "
+    "ON DUPLICATE KEY UPDATE token = IF(token < VALUES(token), VALUES(token), token)"
+)
+
+
+class Lease:
+    """획득한 락 하나. token 은 같은 자원에 대해 획득할 때마다 커지는 펜싱 토큰입니다."""
+
+    def __init__(self, resource, owner, token):
+        self.resource = resource
+        self.owner = owner
+        self.token = token
+        self.lost = False  # 갱신에 실패하면 True (TTL 이 지나 다른 프로세스가 잡았을 수 있음)
+        self.rejected = False
+
+    def fence(self, cursor):
+        """
+        같은 트랜잭션 안에서 DB 쓰기 전에 호출합니다.
+        TTL 만료 후 뒤늦게 깨어난 이전 소유자의 쓰기는 여기서 거부되고, 호출자가 롤백합니다.
+        """
+        cursor.execute(FENCE_SQL, (self.resource, self.token))
+        if cursor.rowcount == 0:
+            self.rejected = True
+            raise FencingTokenRejected(f"Stale fencing token {self.token} for {self.resource}")
+
+
+class LeaseLockManager:
+    """
+    Redis 임대(lease) 락. 여러 워커/호스트에 걸쳐 자원 하나를 직렬화합니다.
+
+    - 같은 프로세스의 대기자는 먼저 로컬 락(자원별)에서 줄을 서고, 맨 앞 하나만 Redis 에서 경쟁합니다.
+    - TTL 은 ttl 초이며, 백그라운드 스레드가 ttl/3 마다 보유 중인 락을 연장합니다.
+      프로세스가 죽으면 최대 ttl 초 뒤 락이 풀립니다.
+    - 획득할 때마다 펜싱 토큰을 받아 Lease.fence() 로 MySQL 쓰기에, fenced_set() 으로 캐시 쓰기에 검사합니다.
+    """
+
+    def __init__(self, redis_client, prefix="lock", ttl=5.0, acquire_timeout=30.0,
+                 retry_base=0.002, retry_cap=0.05):
+        self.redis = redis_client
+        self.prefix = prefix
+        self.ttl_ms = int(ttl * 1000)
+        self.renew_interval = ttl / 3
+        self.retry_policy = RetryPolicy(max_attempts=0, base=retry_base, cap=retry_cap, deadline=acquire_timeout)
+        self.local_locks = RefCountedLockMap()
+
+        self.acquire_script = redis_client.register_script(ACQUIRE_SCRIPT)
+        self.renew_script = redis_client.register_script(RENEW_SCRIPT)
+        self.release_script = redis_client.register_script(RELEASE_SCRIPT)
+        self.fenced_set_script = redis_client.register_script(FENCED_SET_SCRIPT)
+
+        self._held = {}  # owner -> Lease (갱신 대상)
+        self._held_lock = threading.Lock()
+        self._renewer = None
+        self._stop = threading.Event()
+
+        self._stats_lock = threading.Lock()
+        self.acquire_us = LatencyHistogram()     # 전체 획득 시간 (로컬 대기 + Redis 대기)
+        self.local_wait_us = LatencyHistogram()  # 같은 프로세스 대기자 뒤에서 기다린 시간
+        self.redis_wait_us = LatencyHistogram()  # 다른 프로세스가 놓기를 기다린 시간
+        self.hold_us = LatencyHistogram()
+        self.counters = {"acquired": 0, "timeouts": 0, "renewals": 0, "lost": 0, "fence_rejected": 0,
+                         "cache_fence_rejected": 0}
+
+    def _keys(self, resource):
+        key = f"{self.prefix}:{resource}"
+        return [key, f"{key}:fence"]
+
+    def _count(self, name, n=1):
+        with self._stats_lock:
+            self.counters[name] += n
+
+    def _acquire_redis(self, resource, owner):
+        keys = self._keys(resource)
+        started = time.monotonic()
+        attempt = 0
+        while True:
+            attempt += 1
+            token = self.acquire_script(keys=keys, args=[owner, self.ttl_ms])
+            if token:
+                return Lease(resource, owner, int(token))
+            try:
+                self.retry_policy.wait(attempt, started)
+            except RetryDeadlineExceeded:
+                self._count("timeouts")
+                raise LockTimeout(f"Could not acquire {resource} within {self.retry_policy.deadline}s")
+
+    def _release_redis(self, lease):
+        try:
+            self.release_script(keys=self._keys(lease.resource)[:1], args=[lease.owner])
+        except Exception as e:
+            # 해제에 실패해도 TTL 이 지나면 풀림
+            logger.error(f"Lease release failed for {lease.resource}: {e}")
+
+    def fenced_set(self, lease, key, field, value):
+        """
+        임대가 아직 유효할 때만 캐시 값을 씁니다. (key, field) 는 keyspace.location() 결과입니다.
+        지연 중에 TTL 이 지나 다른 소유자가 새 토큰을 받았으면 쓰지 않고 False 를 반환합니다.
+        """
+        fence_key = self._keys(lease.resource)[1]
+        if self.fenced_set_script(keys=[fence_key, key], args=[lease.token, value, field]):
+            return True
+        self._count("cache_fence_rejected")
+        return False
+
+    @contextmanager
+    def hold(self, resource):
+        started = time.perf_counter()
+        with self.local_locks.hold(resource):
+            local_acquired = time.perf_counter()
+            lease = self._acquire_redis(resource, uuid.uuid4().hex)
+            acquired = time.perf_counter()
+            self._track(lease)
+            with self._stats_lock:
+                self.counters["acquired"] += 1
+                self.acquire_us.record((acquired - started) * 1_000_000)
+                self.local_wait_us.record((local_acquired - started) * 1_000_000)
+                self.redis_wait_us.record((acquired - local_acquired) * 1_000_000)
+            try:
+                yield lease
+            finally:
+                self._untrack(lease)
+                self._release_redis(lease)
+                with self._stats_lock:
+                    if lease.rejected:
+                        self.counters["fence_rejected"] += 1
+                    self.hold_us.record((time.perf_counter() - acquired) * 1_000_000)
+
+    # --------------------
+    # 자동 갱신
+    # --------------------
+    def _track(self, lease):
+        with self._held_lock:
+            self._held[lease.owner] = lease
+            if self._renewer is None:
+                self._renewer = threading.Thread(target=self._renew_loop, name="lease-renewer", daemon=True)
+                self._renewer.start()
+
+    def _untrack(self, lease):
+        with self._held_lock:
+            self._held.pop(lease.owner, None)
+
+    def _renew_loop(self):
+        while not self._stop.wait(self.renew_interval):
+            with self._held_lock:
+                leases = list(self._held.values())
+            for lease in leases:
+                try:
+                    renewed = self.renew_script(keys=self._keys(lease.resource)[:1], args=[lease.owner, self.ttl_ms])
+                except Exception as e:
+                    logger.error(f"Lease renewal failed for {lease.resource}: {e}")
+                    continue
+                if renewed:
+                    self._count("renewals")
+                elif not lease.lost:
+                    lease.lost = True
+                    self._count("lost")
+                    logger.warning(f"Lease lost: {lease.resource} (token {lease.token})")
+
+    def stop(self):
+        self._stop.set()
+
+    def stats(self):
+        with self._held_lock:
+            held = len(self._held)
+        with self._stats_lock:
+            return {
+                "ttl_ms": self.ttl_ms,
+                "held": held,
+                **self.counters,
+                "acquire_ms": self.acquire_us.summary(0.001),
+                "local_wait_ms": self.local_wait_us.summary(0.001),
+                "redis_wait_ms": self.redis_wait_us.summary(0.001),
+                "hold_ms": self.hold_us.summary(0.001),
+            }
@@ -0,0 +1,97 @@
+import math
+
+
+class LatencyHistogram:
+    """
+    HDR Histogram 방식의 로그-선형 히스토그램.
+
+    값(정수, 예: 마이크로초)을 2의 거듭제곱 구간으로 나누고, 각 구간을 다시
+    sub_buckets/2 개로 균등 분할합니다. 상대 오차는 최대 2 / sub_buckets
+    (기본 128 → 약 1.6%) 이며, 버킷은 값이 들어온 것만 저장합니다.
+    스레드 안전하지 않으므로 스레드마다 하나씩 두고 merge() 로 합칩니다.
+    """
+
+    def __init__(self, sub_buckets=128):
+        self.sub_bits = int(math.log2(sub_buckets))
+        if 1 << self.sub_bits != sub_buckets:
+            raise ValueError("sub_buckets must be a power of two")
+        self.sub_buckets = sub_buckets
+        self.half = sub_buckets >> 1
+        self.counts = {}
+        self.count = 0
+        self.total = 0
+        self.min = None
+        self.max = None
+
+    def _index(self, value):
+        if value < self.sub_buckets:
+            return value
+        shift = value.bit_length() - self.sub_bits
+        mantissa = value >> shift
+        return self.sub_buckets + (shift - 1) * self.half + (mantissa - self.half)
+
+    def _value_at(self, index):
+        # 버킷의 대표값 (구간 중앙값)
+        if index < self.sub_buckets:
+            return index
+        shift = (index - self.sub_buckets) // self.half + 1
+        mantissa = (index - self.sub_buckets) % self.half + self.half
+        low = mantissa << shift
+        return low + ((1 << shift) >> 1)
+
+    def record(self, value, count=1):
+        value = max(0, int(value))
+        index = self._index(value)
+        self.counts[index] = self.counts.get(index, 0) + count
+        self.count += count
+        self.total += value * count
+        if self.min is None or value < self.min:
+            self.min = value
+        if self.max is None or value > self.max:
+            self.max = value
+
+    def merge(self, other):
+        if other.sub_buckets != self.sub_buckets:
+            raise ValueError("Cannot merge histograms with different precision")
+        for index, c in other.counts.items():
+            self.counts[index] = self.counts.get(index, 0) + c
+        self.count += other.count
+        self.total += other.total
+        if other.min is not None and (self.min is None or other.min < self.min):
+            self.min = other.min
+        if other.max is not None and (self.max is None or other.max > self.max):
+            self.max = other.max
+        return self
+
+    def percentile(self, p):
+        if not self.count:
+            return 0
+        target = max(1, math.ceil(self.count * p / 100.0))
+        seen = 0
+        for index in sorted(self.counts):
+            seen += self.counts[index]
+            if seen >= target:
+                return min(self._value_at(index), self.max)
+        return self.max
+
+    def buckets(self):
+        """(버킷 대표값, 개수) 목록 (값 오름차순)."""
+        return [(self._value_at(index), c) for index, c in sorted(self.counts.items())]
+
+    def mean(self):
+        return self.total / self.count if self.count else 0.0
+
+    def summary(self, scale=1.0):
+        """p50/p90/p99/p999 등 요약. scale 로 단위 변환 (예: us → ms 는 0.001)."""
+        def s(v):
+            return round(v * scale, 3)
+        return {
+            "count": self.count,
+            "min": s(self.min or 0),
+            "mean": s(self.mean()),
+            "p50": s(self.percentile(50)),
+            "p90": s(self.percentile(90)),
+            "p99": s(self.percentile(99)),
+            "p999": s(self.percentile(99.9)),
+            "max": s(self.max or 0),
+        }
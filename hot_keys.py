@@ -0,0 +1,370 @@
+import time
+import random
+import logging
+import itertools
+import threading
+
+from post_keys import shard_key
+
+logger = logging.getLogger(__name__)
+
+# --------------------
+# 핫 게시글 카운터 분산 (sharded counter)
+# --------------------
+# 모든 증가가 post:<id>:view_count 키 하나로 몰리면, 인기 게시글 하나가 Redis Cluster 의 한 샤드(CPU 코어 하나)를 독차지합니다.
+# 증가율이 threshold(초당 증가 수) 를 넘는 게시글은 증가를 post:<id>:view_count:<k> (k = 0..N-1) 로 나눠 보냅니다.
+# 키마다 슬롯이 다르므로 클러스터에서는 여러 샤드로 퍼집니다.
+# 조회수 = 기존 키 값 + 분산 키 합계이며, 분산 키들은 MGET 하나로 읽습니다 (같은 파이프라인에서).
+#
+# 게시글별 분산 상태는 Redis 해시 STATE_KEY 에 "쓰기 N:읽기 N:접기 시작 시각(ms)" 로 두고,
+# 각 프로세스는 window 마다 HGETALL 로 로컬 사본을 갱신합니다 (요청 경로에서는 Redis 를 더 읽지 않음).
+#  - 늘리기: 이 프로세스가 본 증가율이 threshold 를 넘으면 N=2 이상으로 시작하고,
+#            이후에는 합계 변화로 잰 전체 증가율이 키당 threshold 를 넘을 때마다 N 을 두 배로 (max_shards 까지)
+#  - 접기  : 전체 증가율이 threshold * cool_ratio 아래로 cool_windows 번 연속 내려가면 쓰기 N 을 1 로 (기존 키로) 돌리고,
+#            읽기 N 은 그대로 둡니다. 모든 프로세스가 새 상태를 읽었을 시간(drain_windows) 이 지나면
+#            분산 키 값을 기존 키로 합치고(FOLD_SCRIPT) 상태를 지웁니다.
+# 다른 프로세스는 최대 window 만큼 늦게 새 N 을 알게 되므로, 그동안 늘어난 분산 키는 읽기에서 잠깐 빠질 수 있습니다 (유실은 아님).
+STATE_KEY = "hotkeys:shards"
+SHARD_CHOICES = ("thread", "random")
+RECENT_EVENTS = 20  # stats 에 보여줄 최근 늘리기/접기 기록 수
+
+# KEYS[1] 상태 해시, ARGV[1] 게시글 ID, ARGV[2] 새 쓰기 N  → 늘렸으면 1
+GROW_SCRIPT = """
+local current = redis.call('HGET', KEYS[1], ARGV[1])
+local write_n, read_n = 1, 1
+if current then
+    local w, r = string.match(current, '^(%d+):(%d+)')
+    write_n, read_n = tonumber(w), tonumber(r)
+end
+local n = tonumber(ARGV[2])
+if n <= write_n then
+    return 0
+end
+redis.call('HSET', KEYS[1], ARGV[1], n .. ':' .. math.max(n, read_n) .. ':0')
+return 1
+"""
+
+# KEYS[1] 상태 해시, ARGV[1] 게시글 ID, ARGV[2] 읽었던 상태, ARGV[3] 현재 시각(ms)  → 접기 시작했으면 1
+COLLAPSE_SCRIPT = """
+local current = redis.call('HGET', KEYS[1], ARGV[1])
+if current ~= ARGV[2] then
+    return 0
+end
+local _, read_n = string.match(current, '^(%d+):(%d+)')
+redis.call('HSET', KEYS[1], ARGV[1], '1:' .. read_n .. ':' .. ARGV[3])
+return 1
+"""
+
+# KEYS[1] 상태 해시, KEYS[2] 기존 키, KEYS[3..] 분산 키
+# ARGV[1] 게시글 ID, ARGV[2] 읽었던 상태, ARGV[3] 기존 키의 해시 필드('' 이면 string)  → 합친 값 (상태가 바뀌었으면 -1)
+FOLD_SCRIPT = """
+if redis.call('HGET', KEYS[1], ARGV[1]) ~= ARGV[2] then
+    return -1
+end
+local total = 0
+for i = 3, #KEYS do
+    local value = redis.call('GET', KEYS[i])
+    if value then
+        total = total + tonumber(value)
+        redis.call('DEL', KEYS[i])
+    end
+end
+if total ~= 0 then
+    if ARGV[3] == '' then
+        redis.call('INCRBY', KEYS[2], total)
+    else
+        redis.call('HINCRBY', KEYS[2], ARGV[3], total)
+    end
+end
+redis.call('HDEL', KEYS[1], ARGV[1])
+return total
+"""
+
+
+def _parse_state(raw):
+    write_n, read_n, collapse_ms = raw.split(":")
+    return int(write_n), int(read_n), int(collapse_ms)
+
+
+class ShardedCounters:
+    """
+    keyspace.incr / keyspace.mget 대신 쓰면 핫 게시글만 분산 키로 나눕니다.
+    enabled 가 False 면 keyspace 에 그대로 위임합니다.
+    """
+
+    def __init__(self, redis_client, keyspace, enabled=False, threshold=1000, max_shards=16, window=1.0,
+                 cool_ratio=0.5, cool_windows=5, drain_windows=3, choice="thread"):
+        if choice not in SHARD_CHOICES:
+            raise ValueError(f"choice must be one of {SHARD_CHOICES}")
+        self.redis = redis_client
+        self.keyspace = keyspace  # post_keys.CounterKeySpace (기존 키)
+        self.enabled = enabled
+        self.threshold = threshold          # 키 하나가 감당할 초당 증가 수
+        self.max_shards = max_shards
+        self.window = window                # 증가율 측정 / 상태 갱신 주기
+        self.cool_ratio = cool_ratio
+        self.cool_windows = cool_windows
+        self.drain_windows = drain_windows  # 접기 시작 후 분산 키를 합치기까지 기다릴 window 수
+        self.choice = choice                # thread: 스레드마다 고정된 k / random: 증가마다 무작위 k
+
+        self._grow = redis_client.register_script(GROW_SCRIPT)
+        self._collapse = redis_client.register_script(COLLAPSE_SCRIPT)
+        self._fold = redis_client.register_script(FOLD_SCRIPT)
+
+        self._shards = {}   # post_id -> (쓰기 N, 읽기 N)  (STATE_KEY 의 로컬 사본, 통째로 교체)
+        self._states = {}   # post_id -> 상태 문자열 (Lua 스크립트의 비교 값)
+        # 이번 window 의 이 프로세스 증가 수. 요청 경로에서 락 없이 셈 (증가율 추정용이라 조금 빠져도 됨)
+        self._hits = {}
+        self._totals = {}   # post_id -> 지난 window 의 조회수 합계
+        self._cool = {}     # post_id -> 연속으로 식은 window 수
+        self._window_started = time.monotonic()
+        self._next_slot = itertools.count()
+        self._local = threading.local()
+
+        self._stop = threading.Event()
+        self._thread = None
+        self._stats_lock = threading.Lock()
+        self._sharded_increments = 0
+        self._grows = 0
+        self._collapses = 0
+        self._folds = 0
+        self._folded_total = 0
+        self._windows = 0
+        self._errors = 0
+        self._events = []
+
+    # --------------------
+    # 요청 경로
+    # --------------------
+    def _pick(self, write_n):
+        if self.choice == "random":
+            return random.randrange(write_n)
+        slot = getattr(self._local, "slot", None)
+        if slot is None:
+            slot = self._local.slot = next(self._next_slot)
+        return slot % write_n
+
+    def incr(self, post_id, amount=1, extra=None):
+        """
+        증가 후 조회수 합계를 반환합니다. 분산 중인 게시글도 왕복 한 번.
+        extra(pipe): 같은 파이프라인 끝에 붙일 명령 (예: unique_viewers.add 의 PFADD)
+        """
+        if extra is None and not self.sharded(post_id):
+            if self.enabled:
+                self._hits[post_id] = self._hits.get(post_id, 0) + amount
+            return self.keyspace.incr(self.redis, post_id, amount)
+        pipe = self.redis.pipeline(transaction=False)
+        n = self.queue_incr(pipe, post_id, amount)
+        if extra is not None:
+            extra(pipe)
+        return self.total(pipe.execute()[:n])
+
+    def queue_incr(self, pipe, post_id, amount=1):
+        """
+        이미 열린 파이프라인에 증가 명령을 붙이고, 붙인 명령 수를 반환합니다.
+        결과 목록의 그 구간을 total() 에 넘기면 증가 후 조회수 합계가 됩니다.
+        (배치 증가 / write-behind / 집계 버퍼 플러시처럼 다른 명령과 한 파이프라인으로 보내는 경로용)
+        """
+        shards = None
+        if self.enabled:
+            self._hits[post_id] = self._hits.get(post_id, 0) + amount
+            shards = self._shards.get(post_id)
+        if shards is None:
+            self.keyspace.incr(pipe, post_id, amount)
+            return 1
+
+        write_n, read_n = shards
+        if write_n > 1:
+            pipe.incrby(shard_key(post_id, self._pick(write_n)), amount)
+        else:
+            self.keyspace.incr(pipe, post_id, amount)  # 접는 중: 기존 키로
+        self.keyspace.get(pipe, post_id)
+        pipe.mget([shard_key(post_id, k) for k in range(read_n)])
+        self._sharded_increments += 1  # 통계용, 락 없이 셈
+        return 3
+
+    @staticmethod
+    def total(results):
+        """queue_incr 가 붙인 명령들의 결과 → 증가 후 조회수 합계."""
+        if len(results) == 1:
+            return int(results[0])
+        _, base, shard_values = results
+        return int(base or 0) + sum(int(value) for value in shard_values if value is not None)
+
+    def mget(self, post_ids):
+        """keyspace.mget 과 같지만 분산 중인 게시글은 분산 키 합계를 더한 값 (왕복 한 번)."""
+        shards = self._shards
+        if not self.enabled or not any(post_id in shards for post_id in post_ids):
+            return self.keyspace.mget(self.redis, post_ids)
+        pipe = self.redis.pipeline(transaction=False)
+        for post_id in post_ids:
+            self.keyspace.get(pipe, post_id)
+        sharded = [post_id for post_id in post_ids if post_id in shards]
+        for post_id in sharded:
+            pipe.mget([shard_key(post_id, k) for k in range(shards[post_id][1])])
+        raw = pipe.execute()
+        values = dict(zip(post_ids, raw))
+        for post_id, shard_values in zip(sharded, raw[len(post_ids):]):
+            values[post_id] = self._sum(values[post_id], shard_values)
+        return [values[post_id] for post_id in post_ids]
+
+    def add_shards(self, values):
+        """{post_id: 기존 키 값} 중 분산 중인 게시글에 분산 키 합계를 더합니다. (reconciler.py 의 hash SCAN 용)"""
+        shards = self._shards
+        sharded = [post_id for post_id in values if post_id in shards]
+        if not self.enabled or not sharded:
+            return values
+        pipe = self.redis.pipeline(transaction=False)
+        for post_id in sharded:
+            pipe.mget([shard_key(post_id, k) for k in range(shards[post_id][1])])
+        for post_id, shard_values in zip(sharded, pipe.execute()):
+            values[post_id] = self._sum(values[post_id], shard_values)
+        return values
+
+    @staticmethod
+    def _sum(base, shard_values):
+        present = [int(value) for value in shard_values if value is not None]
+        if base is None and not present:
+            return None
+        return str(int(base or 0) + sum(present))
+
+    def sharded(self, post_id):
+        return self.enabled and post_id in self._shards
+
+    # --------------------
+    # 핫 게시글 감지 (window 마다)
+    # --------------------
+    def _wanted_shards(self, rate):
+        n = 2
+        while n < self.max_shards and rate / n > self.threshold:
+            n *= 2
+        return min(n, self.max_shards)
+
+    def refresh(self):
+        """STATE_KEY 를 읽어 분산 상태의 로컬 사본을 갱신합니다 (감지 스레드가 window 마다, 외부 검증 도구는 읽기 전에)."""
+        raw = self.redis.hgetall(STATE_KEY)
+        self._states = {int(post_id): state for post_id, state in raw.items()}
+        self._shards = {post_id: _parse_state(state)[:2] for post_id, state in self._states.items()}
+
+    def _event(self, action, post_id, rate, shards):
+        logger.info("Hot key %s: post %s at %.0f incr/s -> %s shards", action, post_id, rate, shards)
+        with self._stats_lock:
+            self._events.append({"action": action, "post_id": post_id, "rate": round(rate, 1),
+                                 "shards": shards, "at": time.strftime("%Y-%m-%dT%H:%M:%S")})
+            del self._events[:-RECENT_EVENTS]
+
+    def _grow_to(self, post_id, n, rate):
+        if not self._grow(keys=[STATE_KEY], args=[post_id, n]):
+            return False
+        with self._stats_lock:
+            self._grows += 1
+        self._event("grow", post_id, rate, n)
+        return True
+
+    def run_window(self):
+        now = time.monotonic()
+        elapsed = max(now - self._window_started, 1e-6)
+        self._window_started = now
+        hits, self._hits = self._hits, {}
+        self.refresh()
+
+        # (1) 새로 뜨거워진 게시글: 이 프로세스가 본 증가율로 판단
+        grown = False
+        for post_id, count in hits.items():
+            rate = count / elapsed
+            if post_id not in self._shards and rate >= self.threshold:
+                grown = self._grow_to(post_id, self._wanted_shards(rate), rate) or grown
+        if grown:
+            self.refresh()  # 이 프로세스는 다음 window 를 기다리지 않고 바로 분산
+
+        # (2) 이미 분산 중인 게시글: 합계 변화로 잰 전체 증가율로 늘리거나 접음
+        post_ids = list(self._shards)
+        totals = dict(zip(post_ids, self.mget(post_ids))) if post_ids else {}
+        now_ms = int(time.time() * 1000)
+        for post_id in post_ids:
+            write_n, read_n, collapse_ms = _parse_state(self._states[post_id])
+            total = int(totals[post_id] or 0)
+            previous = self._totals.get(post_id)
+            self._totals[post_id] = total
+            if write_n == 1:
+                if now_ms - collapse_ms >= self.drain_windows * self.window * 1000:
+                    self._fold_shards(post_id, read_n)
+                continue
+            if previous is None:
+                continue
+            rate = (total - previous) / elapsed
+            wanted = self._wanted_shards(rate)
+            if wanted > write_n:
+                self._grow_to(post_id, wanted, rate)
+                self._cool.pop(post_id, None)
+            elif rate < self.threshold * self.cool_ratio:
+                self._cool[post_id] = self._cool.get(post_id, 0) + 1
+                if self._cool[post_id] >= self.cool_windows:
+                    if self._collapse(keys=[STATE_KEY], args=[post_id, self._states[post_id], now_ms]):
+                        with self._stats_lock:
+                            self._collapses += 1
+                        self._event("collapse", post_id, rate, 1)
+                    self._cool.pop(post_id, None)
+            else:
+                self._cool.pop(post_id, None)
+
+        for stale in set(self._totals) - set(post_ids):
+            del self._totals[stale]
+        for stale in set(self._cool) - set(post_ids):
+            del self._cool[stale]
+        with self._stats_lock:
+            self._windows += 1
+
+    def _fold_shards(self, post_id, read_n):
+        key, field = self.keyspace.location(post_id)
+        keys = [STATE_KEY, key] + [shard_key(post_id, k) for k in range(read_n)]
+        folded = self._fold(keys=keys, args=[post_id, self._states[post_id], field])
+        if folded == -1:
+            return  # 다른 프로세스가 먼저 합쳤거나 그 사이 다시 늘어남
+        with self._stats_lock:
+            self._folds += 1
+            self._folded_total += folded
+        logger.info("Hot key folded: post %s, %s increments moved back to the base key", post_id, folded)
+
+    # --------------------
+    # 백그라운드 스레드
+    # --------------------
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name="hot-key-detector", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread:
+            self._thread.join()
+
+    def _run(self):
+        while not self._stop.wait(self.window):
+            try:
+                self.run_window()
+            except Exception as e:
+                with self._stats_lock:
+                    self._errors += 1
+                logger.error(f"Hot key detection failed: {e}", exc_info=True)
+
+    def stats(self):
+        states = dict(self._states)
+        with self._stats_lock:
+            return {
+                "enabled": self.enabled,
+                "running": self._thread is not None and self._thread.is_alive(),
+                "threshold": self.threshold,
+                "max_shards": self.max_shards,
+                "choice": self.choice,
+                "sharded_posts": {str(post_id): dict(zip(("write_shards", "read_shards", "collapse_started_ms"),
+                                                         _parse_state(state)))
+                                  for post_id, state in states.items()},
+                "sharded_increments": self._sharded_increments,
+                "grows": self._grows,
+                "collapses": self._collapses,
+                "folds": self._folds,
+                "folded_total": self._folded_total,
+                "windows": self._windows,
+                "errors": self._errors,
+                "recent": list(self._events),
+            }
@@ -0,0 +1,482 @@
+import os
+import time
+import uuid
+import zlib
+import struct
+import logging
+import threading
+
+from histogram import LatencyHistogram
+
+logger = logging.getLogger(__name__)
+
+# --------------------
+# 로컬 append-only 증가분 저널 (장애 시 우회 경로)
+# --------------------
+# Redis 나 MySQL 이 느리거나 죽으면 요청은 증가분을 로컬 디스크 저널에 덧붙이고 바로 반환합니다.
+# JournalReplayer 가 백엔드 복구 후 저널을 읽어 Redis INCRBY / MySQL UPDATE 배치로 반영합니다.
+#
+# 파일 구성: <directory>/<첫 오프셋 20자리>.log 세그먼트들. 세그먼트가 segment_bytes 를 넘으면 새로 엽니다.
+#   <directory>/journal.id 는 저널을 처음 만들 때 정한 ID 로, 디렉터리가 지워져 오프셋이 1 부터 다시 시작해도
+#   이전 저널의 반영 오프셋과 섞이지 않게 합니다.
+# 레코드(고정 29바이트): offset(u64) post_id(i64) delta(i64) sinks(u8) crc32(u32)
+#   sinks: 아직 반영해야 할 곳 (SINK_REDIS | SINK_MYSQL). Redis INCR 은 성공하고 DB 만 실패했다면 SINK_MYSQL 만.
+# 오프셋은 1 부터 1씩 증가하며, 세그먼트 안에서는 연속이므로 (offset - base) * RECORD_SIZE 로 바로 찾아갑니다.
+#
+# fsync 정책
+#  - always  : 레코드마다 write + fsync 후 반환 (가장 느림, 유실 없음)
+#  - group   : 버퍼에 쓰고, 백그라운드가 group_commit_interval 마다 모아서 한 번 fsync 할 때까지 기다렸다 반환
+#  - interval: 버퍼에 쓰고 바로 반환, 백그라운드가 주기적으로 fsync (전원 장애 시 마지막 주기분 유실 가능)
+SINK_REDIS = 1
+SINK_MYSQL = 2
+SINK_ALL = SINK_REDIS | SINK_MYSQL
+FSYNC_POLICIES = ("always", "group", "interval")
+
+_HEADER = struct.Struct("<QqqB")
+_CRC = struct.Struct("<I")
+RECORD_SIZE = _HEADER.size + _CRC.size
+
+
+def _segment_name(base):
+    return f"{base:020d}.log"
+
+
+class Journal:
+    def __init__(self, directory, segment_bytes=64 * 1024 * 1024, fsync="interval", group_commit_interval=0.005):
+        if fsync not in FSYNC_POLICIES:
+            raise ValueError(f"fsync must be one of {FSYNC_POLICIES}")
+        self.directory = directory
+        self.segment_records = max(1, segment_bytes // RECORD_SIZE)
+        self.fsync_policy = fsync
+        self.group_commit_interval = group_commit_interval
+
+        self._lock = threading.Lock()
+        self._synced = threading.Condition(self._lock)
+        self._segments = []     # [(base offset, 경로)] 오래된 순
+        self._file = None       # 활성 세그먼트 (버퍼 쓰기)
+        self._active_records = 0
+        self.next_offset = 1
+        self.synced_offset = 0  # fsync 까지 끝난 마지막 오프셋
+        self._dirty = False
+
+        self.appends = 0
+        self.fsyncs = 0
+        self.truncated_bytes = 0  # 복구 시 잘라낸 찢어진 꼬리
+        self.fsync_us = LatencyHistogram()
+        self.degraded = False     # True 면 요청 경로가 백엔드를 건너뛰고 바로 저널에 씀
+        self.degraded_entered = 0
+
+        os.makedirs(directory, exist_ok=True)
+        self.journal_id = self._load_id()
+        self._recover()
+        self._stop = threading.Event()
+        self._syncer = None
+        if fsync != "always":
+            self._syncer = threading.Thread(target=self._sync_loop, name="journal-fsync", daemon=True)
+            self._syncer.start()
+
+    # --------------------
+    # 복구
+    # --------------------
+    def _load_id(self):
+        path = os.path.join(self.directory, "journal.id")
+        if not os.path.exists(path):
+            with open(path, "w") as f:
+                f.write(uuid.uuid4().hex[:12])
+                f.flush()
+                os.fsync(f.fileno())
+        with open(path) as f:
+            return f.read().strip()
+
+    def _recover(self):
+        names = sorted(name for name in os.listdir(self.directory) if name.endswith(".log"))
+        self._segments = [(int(name[:-4]), os.path.join(self.directory, name)) for name in names]
+        if not self._segments:
+            self._open_segment(1)
+            return
+        base, path = self._segments[-1]
+        # 마지막 세그먼트의 찢어진 꼬리(쓰다 만 레코드, CRC 불일치)를 잘라냄
+        good = 0
+        with open(path, "rb") as f:
+            while True:
+                raw = f.read(RECORD_SIZE)
+                if len(raw) < RECORD_SIZE or self._decode(raw) is None:
+                    break
+                good += 1
+        size = os.path.getsize(path)
+        if size != good * RECORD_SIZE:
+            self.truncated_bytes = size - good * RECORD_SIZE
+            with open(path, "r+b") as f:
+                f.truncate(good * RECORD_SIZE)
+            logger.warning(f"Journal: truncated {self.truncated_bytes} torn bytes from {path}")
+        self.next_offset = base + good
+        self.synced_offset = self.next_offset - 1
+        self._file = open(path, "ab")
+        self._active_records = good
+
+    def _open_segment(self, base):
+        if self._file:
+            self._file.flush()
+            os.fsync(self._file.fileno())
+            self._file.close()
+        path = os.path.join(self.directory, _segment_name(base))
+        self._file = open(path, "ab")
+        self._segments.append((base, path))
+        self._active_records = 0
+
+    @staticmethod
+    def _encode(offset, post_id, delta, sinks):
+        header = _HEADER.pack(offset, post_id, delta, sinks)
+        return header + _CRC.pack(zlib.crc32(header))
+
+    @staticmethod
+    def _decode(raw):
+        header = raw[:_HEADER.size]
+        if _CRC.unpack(raw[_HEADER.size:])[0] != zlib.crc32(header):
+            return None
+        return _HEADER.unpack(header)  # (offset, post_id, delta, sinks)
+
+    # --------------------
+    # 쓰기
+    # --------------------
+    def append(self, post_id, delta=1, sinks=SINK_ALL):
+        with self._lock:
+            if self._active_records >= self.segment_records:
+                self._open_segment(self.next_offset)
+            offset = self.next_offset
+            self._file.write(self._encode(offset, post_id, delta, sinks))
+            self.next_offset += 1
+            self._active_records += 1
+            self.appends += 1
+            self._dirty = True
+            if self.fsync_policy == "always":
+                self._fsync_locked()
+            elif self.fsync_policy == "group":
+                while self.synced_offset < offset:
+                    self._synced.wait()
+        return offset
+
+    def _fsync_locked(self):
+        started = time.perf_counter()
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        self.fsync_us.record((time.perf_counter() - started) * 1_000_000)
+        self.fsyncs += 1
+        self.synced_offset = self.next_offset - 1
+        self._dirty = False
+        self._synced.notify_all()
+
+    def _sync_loop(self):
+        while not self._stop.wait(self.group_commit_interval):
+            with self._lock:
+                if self._dirty:
+                    try:
+                        self._fsync_locked()
+                    except Exception as e:
+                        logger.error(f"Journal fsync failed: {e}", exc_info=True)
+
+    def close(self):
+        self._stop.set()
+        with self._lock:
+            if self._dirty:
+                self._fsync_locked()
+            self._file.close()
+
+    # --------------------
+    # 읽기 / 정리 (JournalReplayer 용)
+    # --------------------
+    @property
+    def last_offset(self):
+        return self.next_offset - 1
+
+    def read(self, from_offset, max_records):
+        """from_offset 부터 최대 max_records 개의 (offset, post_id, delta, sinks)."""
+        with self._lock:
+            self._file.flush()  # 버퍼에만 있는 레코드도 읽을 수 있게 (fsync 는 아님)
+            segments = list(self._segments)
+            last = self.last_offset
+        records = []
+        for i, (base, path) in enumerate(segments):
+            end = segments[i + 1][0] if i + 1 < len(segments) else last + 1
+            if end <= from_offset or base > last:
+                continue
+            start = max(from_offset, base)
+            count = min(end - start, max_records - len(records))
+            with open(path, "rb") as f:
+                f.seek((start - base) * RECORD_SIZE)
+                raw = f.read(count * RECORD_SIZE)
+            for pos in range(0, len(raw) - RECORD_SIZE + 1, RECORD_SIZE):
+                record = self._decode(raw[pos:pos + RECORD_SIZE])
+                if record is None:
+                    raise ValueError(f"Corrupt journal record in {path} at offset {start + pos // RECORD_SIZE}")
+                records.append(record)
+            if len(records) >= max_records:
+                break
+        return records
+
+    def release_through(self, offset):
+        """offset 까지 모두 반영되었으면, 그 안에 완전히 들어가는 (활성 아닌) 세그먼트 파일을 지웁니다."""
+        removed = 0
+        with self._lock:
+            while len(self._segments) > 1 and self._segments[1][0] - 1 <= offset:
+                _, path = self._segments.pop(0)
+                os.remove(path)
+                removed += 1
+        return removed
+
+    def enter_degraded(self):
+        if not self.degraded:
+            self.degraded = True
+            self.degraded_entered += 1
+
+    def stats(self):
+        with self._lock:
+            segments = list(self._segments)
+            size = sum(os.path.getsize(path) for _, path in segments if os.path.exists(path))
+            return {
+                "directory": self.directory,
+                "fsync_policy": self.fsync_policy,
+                "degraded": self.degraded,
+                "degraded_entered": self.degraded_entered,
+                "segments": len(segments),
+                "size_bytes": size,
+                "last_offset": self.last_offset,
+                "synced_offset": self.synced_offset,
+                "appends": self.appends,
+                "fsyncs": self.fsyncs,
+                "records_per_fsync": round(self.appends / self.fsyncs, 2) if self.fsyncs else 0.0,
+                "fsync_ms": self.fsync_us.summary(0.001),
+                "truncated_bytes": self.truncated_bytes,
+            }
+
+
+# --------------------
+# 재반영 (exactly-once)
+# --------------------
+# 각 반영 대상은 '어디까지 반영했는지' 오프셋을 반영 데이터와 같은 원자 단위로 저장합니다.
+#  - Redis: Lua 스크립트 하나에서 저장된 오프셋이 예상값과 같을 때만 INCRBY 들과 새 오프셋 SET
+#  - MySQL: 같은 트랜잭션에서 journal_offset 행을 FOR UPDATE 로 잡고 UPDATE 들과 새 오프셋 갱신
+# 그래서 반영 도중 프로세스가 죽어도, 재시작 후 같은 레코드가 두 번 반영되지 않습니다.
+
+# KEYS[1] 오프셋 키, KEYS[2..n+1] 조회수 키, KEYS[n+2..] 분 단위 버킷 키 (view_buckets.py, 없으면 생략)
+# ARGV[1] 예상 오프셋, ARGV[2] 새 오프셋, ARGV[3] 조회수 키 수 n, ARGV[4] 버킷의 분 필드, ARGV[5] 버킷 TTL(초),
+# 이후 조회수 키마다 (해시 필드('' 이면 string), 증가분), 버킷 키마다 증가분
+# 캐시에 없는 게시글은 건너뜀 (0 부터 세면 틀린 값이 되므로, 다음 미스 때 DB 에서 채워지게 둠)
+# 버킷은 캐시 여부와 관계없이 기록 (재반영 시각의 분으로, 오프셋과 같은 원자 단위라 두 번 세지 않음)
+REDIS_APPLY_SCRIPT = """
+local applied = tonumber(redis.call('GET', KEYS[1]) or '0')
+if applied ~= tonumber(ARGV[1]) then
+    return -1
+end
+local n = tonumber(ARGV[3])
+local pos = 6
+for i = 2, n + 1 do
+    local field = ARGV[pos]
+    local delta = ARGV[pos + 1]
+    pos = pos + 2
+    if field == '' then
+        if redis.call('EXISTS', KEYS[i]) == 1 then
+            redis.call('INCRBY', KEYS[i], delta)
+        end
+    elseif redis.call('HEXISTS', KEYS[i], field) == 1 then
+        redis.call('HINCRBY', KEYS[i], field, delta)
+    end
+end
+for i = n + 2, #KEYS do
+    redis.call('HINCRBY', KEYS[i], ARGV[4], ARGV[pos])
+    redis.call('EXPIRE', KEYS[i], ARGV[5])
+    pos = pos + 1
+end
+redis.call('SET', KEYS[1], ARGV[2])
+return 1
+"""
+
+
+class JournalReplayer:
+    def __init__(self, journal, redis_client, db_pool, keyspace, name, batch_size=1000, interval=0.5,
+                 view_buckets=None):
+        self.journal = journal
+        self.redis = redis_client
+        self.db_pool = db_pool
+        self.keyspace = keyspace  # post_keys.CounterKeySpace
+        self.view_buckets = view_buckets  # view_buckets.ViewBuckets (시간대별 조회수를 쓰지 않으면 None)
+        self.name = f"{name}:{journal.journal_id}"  # 반영 오프셋의 키 (호스트 이름 + 저널 ID)
+        self.batch_size = batch_size
+        self.interval = interval
+        self.offset_key = f"journal:{self.name}:applied"
+
+        self._apply = redis_client.register_script(REDIS_APPLY_SCRIPT)
+        self._stop = threading.Event()
+        self._thread = None
+        self._stats_lock = threading.Lock()
+        self.redis_applied = None  # None 이면 아직 읽지 못함 (해당 백엔드가 죽어 있음)
+        self.mysql_applied = None
+        self.batches = 0
+        self.records_replayed = 0
+        self.failures = 0
+        self.last_error = None
+        self.replay_seconds = 0.0
+
+    # --------------------
+    # 반영 대상별
+    # --------------------
+    def _apply_redis(self, records):
+        if self.redis_applied is None:
+            self.redis_applied = int(self.redis.get(self.offset_key) or 0)
+        pending = [r for r in records if r[0] > self.redis_applied]
+        if not pending:
+            return
+        totals = {}
+        for _, post_id, delta, sinks in pending:
+            if sinks & SINK_REDIS:
+                totals[post_id] = totals.get(post_id, 0) + delta
+        counter_keys, counter_args = [], []
+        for post_id, delta in totals.items():
+            key, field = self.keyspace.location(post_id)
+            counter_keys.append(key)
+            counter_args.extend([field, delta])
+        # Redis 에 닿지 못한 증가는 분 단위 버킷에도 없으므로 같은 스크립트에서 함께 기록
+        bucket_keys, minute, hour, ttl = [], "", 0, 0
+        if self.view_buckets:
+            now = int(time.time())
+            for post_id in totals:
+                key, minute, hour = self.view_buckets.slot(post_id, now)
+                bucket_keys.append(key)
+            ttl = self.view_buckets.retention_hours * 3600
+        keys = [self.offset_key] + counter_keys + bucket_keys
+        args = [self.redis_applied, pending[-1][0], len(counter_keys), minute, ttl] + counter_args
+        if bucket_keys:
+            args.extend(totals.values())
+        if self._apply(keys=keys, args=args) == -1:
+            # 다른 프로세스가 같은 이름으로 반영함 → 오프셋을 다시 읽고 다음 주기에 재시도
+            self.redis_applied = None
+            raise RuntimeError(f"Journal offset for {self.name!r} changed concurrently (redis)")
+        self.redis_applied = pending[-1][0]
+        for post_id in totals if bucket_keys else ():
+            self.view_buckets.touched(post_id, hour)
+
+    def _apply_mysql(self, records):
+        with self.db_pool.connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute("INSERT IGNORE INTO journal_offset (journal, applied_offset) VALUES (%s, 0)", (self.name,))
+            cursor.execute("SELECT applied_offset FROM journal_offset WHERE journal = %s FOR UPDATE", (self.name,))
+            applied = cursor.fetchone()[0]
+            pending = [r for r in records if r[0] > applied]
+            if pending:
+                totals = {}
+                for _, post_id, delta, sinks in pending:
+                    if sinks & SINK_MYSQL:
+                        totals[post_id] = totals.get(post_id, 0) + delta
+                if totals:
+                    cursor.executemany("UPDATE content SET view_count = view_count + %s WHERE id = %s",
+                                       [(delta, post_id) for post_id, delta in totals.items()])
+                cursor.execute("UPDATE journal_offset SET applied_offset = %s WHERE journal = %s",
+                               (pending[-1][0], self.name))
+                applied = pending[-1][0]
+            conn.commit()
+        self.mysql_applied = applied
+
+    # --------------------
+    # 재반영 루프
+    # --------------------
+    def applied_offset(self):
+        """두 반영 대상 모두 반영한 마지막 오프셋 (모르면 None)."""
+        if self.redis_applied is None or self.mysql_applied is None:
+            return None
+        return min(self.redis_applied, self.mysql_applied)
+
+    def backlog(self):
+        """degraded 이거나 아직 양쪽에 반영하지 못한 레코드가 있으면 True (DriftReconciler 가 점검을 미룰 기준)."""
+        if self.journal.degraded:
+            return True
+        applied = self.applied_offset()
+        if applied is None:
+            return self.journal.last_offset > 0
+        return applied < self.journal.last_offset
+
+    def replay_once(self):
+        """한 배치를 반영하고 반영한 레코드 수를 반환합니다. 저널을 다 비웠으면 degraded 를 해제합니다."""
+        started = time.perf_counter()
+        applied = self.applied_offset()
+        if applied is None:
+            # 시작 직후: 양쪽 오프셋을 읽어 옴 (빈 배치 반영)
+            self._apply_redis([])
+            self._apply_mysql([])
+            applied = self.applied_offset()
+        records = self.journal.read(applied + 1, self.batch_size)
+        if records:
+            # 한쪽이 먼저 앞서 있을 수 있으므로 각자 자기 오프셋 이후만 반영
+            self._apply_redis(records)
+            self._apply_mysql(records)
+        applied = self.applied_offset()
+        self.journal.release_through(applied)
+        with self._stats_lock:
+            self.batches += 1 if records else 0
+            self.records_replayed += len(records)
+            self.replay_seconds += time.perf_counter() - started if records else 0.0
+        if self.journal.degraded and applied >= self.journal.last_offset:
+            self.journal.degraded = False
+            logger.info(f"Journal drained through offset {applied}; leaving degraded mode")
+        return len(records)
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name="journal-replayer", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread:
+            self._thread.join()
+
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                # 밀린 레코드가 있으면 쉬지 않고 연속으로 반영
+                if self.replay_once() >= self.batch_size:
+                    continue
+            except Exception as e:
+                with self._stats_lock:
+                    self.failures += 1
+                    self.last_error = str(e)
+                logger.warning(f"Journal replay failed (will retry): {e}")
+            self._stop.wait(self.interval)
+
+    def stats(self):
+        applied = self.applied_offset()
+        with self._stats_lock:
+            return {
+                "name": self.name,
+                "redis_applied": self.redis_applied,
+                "mysql_applied": self.mysql_applied,
+                "lag_records": self.journal.last_offset - applied if applied is not None else None,
+                "batches": self.batches,
+                "records_replayed": self.records_replayed,
+                "records_per_second": round(self.records_replayed / self.replay_seconds, 1)
+                if self.replay_seconds else 0.0,
+                "failures": self.failures,
+                "last_error": self.last_error,
+            }
+
+
+def prometheus(journal, replayer):
+    """저널 크기 / fsync / 재반영 지표 (Prometheus 텍스트, /metrics 에 덧붙임)."""
+    j, r = journal.stats(), replayer.stats()
+    lines = [
+        "# TYPE view_journal_size_bytes gauge",
+        f"view_journal_size_bytes {j['size_bytes']}",
+        "# TYPE view_journal_segments gauge",
+        f"view_journal_segments {j['segments']}",
+        "# TYPE view_journal_degraded gauge",
+        f"view_journal_degraded {int(j['degraded'])}",
+        "# TYPE view_journal_appends_total counter",
+        f"view_journal_appends_total {j['appends']}",
+        "# TYPE view_journal_fsyncs_total counter",
+        f"view_journal_fsyncs_total {j['fsyncs']}",
+        "# TYPE view_journal_fsync_seconds_sum counter",
+        f"view_journal_fsync_seconds_sum {journal.fsync_us.total / 1_000_000:.6f}",
+        "# TYPE view_journal_replayed_records_total counter",
+        f"view_journal_replayed_records_total {r['records_replayed']}",
+        "# TYPE view_journal_replay_lag_records gauge",
+        f"view_journal_replay_lag_records {r['lag_records'] if r['lag_records'] is not None else 'NaN'}",
+    ]
+    return "\n".join(lines) + "\n"
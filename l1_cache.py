@@ -0,0 +1,148 @@
+import re
+import time
+import logging
+import threading
+from collections import OrderedDict
+
+logger = logging.getLogger(__name__)
+
+
+class L1Cache:
+    """
+    프로세스 내부 LRU + TTL 캐시 (Redis 앞단).
+
+    값은 최대 ttl 초까지 오래된 것일 수 있습니다 (= 배포별 staleness 예산).
+    무효화 구독(L1Invalidator)을 켜면 보통 그보다 훨씬 빨리 지워지고, TTL 은 메시지 유실 시의 상한이 됩니다.
+    maxsize 를 넘으면 가장 오래 쓰이지 않은 항목부터 버립니다.
+    """
+
+    def __init__(self, maxsize=10000, ttl=1.0):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._items = OrderedDict()  # key -> (value, expires_at)
+        self.counters = {"hits": 0, "misses": 0, "expired": 0, "evictions": 0, "invalidations": 0}
+
+    def get(self, key):
+        """(히트 여부, 값) 을 반환합니다."""
+        now = time.monotonic()
+        with self._lock:
+            item = self._items.get(key)
+            if item is None:
+                self.counters["misses"] += 1
+                return False, None
+            value, expires_at = item
+            if expires_at <= now:
+                del self._items[key]
+                self.counters["expired"] += 1
+                self.counters["misses"] += 1
+                return False, None
+            self._items.move_to_end(key)
+            self.counters["hits"] += 1
+            return True, value
+
+    def put(self, key, value):
+        expires_at = time.monotonic() + self.ttl
+        with self._lock:
+            self._items[key] = (value, expires_at)
+            self._items.move_to_end(key)
+            while len(self._items) > self.maxsize:
+                self._items.popitem(last=False)
+                self.counters["evictions"] += 1
+
+    def invalidate(self, key):
+        with self._lock:
+            if self._items.pop(key, None) is not None:
+                self.counters["invalidations"] += 1
+
+    def clear(self):
+        with self._lock:
+            self._items.clear()
+
+    def stats(self):
+        with self._lock:
+            hits, misses = self.counters["hits"], self.counters["misses"]
+            return {
+                **self.counters,
+                "size": len(self._items),
+                "maxsize": self.maxsize,
+                "staleness_budget_ms": int(self.ttl * 1000),
+                "hit_ratio": round(hits / (hits + misses), 4) if hits + misses else 0.0,
+            }
+
+
+class L1Invalidator:
+    """
+    Redis keyspace notification 을 구독하여 조회수 키가 바뀌면 L1 항목을 지웁니다.
+
+    모든 쓰기 전략(INCR, SET, Lua 스크립트 ...)을 고치지 않고도 무효화할 수 있도록,
+    발행 대신 Redis 서버의 notify-keyspace-events 를 사용합니다. (K: keyspace 채널, $: 문자열, h: 해시, g: DEL 등)
+    hash 인코딩이면 버킷 키 하나가 바뀔 때 그 버킷의 게시글을 모두 지웁니다.
+    핫 게시글의 분산 카운터 키(post:<id>:view_count:<k>, 인코딩과 무관하게 string)도 함께 구독합니다.
+    """
+
+    NOTIFY_FLAGS = "K$hg"
+    STRING_KEY = re.compile(r"^post:(\d+):view_count$")
+    SHARD_KEY = re.compile(r"^post:(\d+):view_count:\d+$")
+    BUCKET_KEY = re.compile(r"^post:b:(\d+)$")
+
+    def __init__(self, redis_client, cache, keyspace, db=0):
+        self.redis = redis_client
+        self.cache = cache
+        self.keyspace = keyspace
+        self.prefix = f"__keyspace@{db}__:"
+        self._thread = None
+        self._pubsub = None
+        self.messages = 0
+
+    def post_ids(self, key):
+        # 바뀐 Redis 키 → 영향받는 게시글 ID 목록
+        match = self.SHARD_KEY.match(key)
+        if match:
+            return (int(match.group(1)),)
+        if self.keyspace.hashed:
+            match = self.BUCKET_KEY.match(key)
+            if match:
+                start = int(match.group(1)) * self.keyspace.bucket_size
+                return range(start, start + self.keyspace.bucket_size)
+            return ()
+        match = self.STRING_KEY.match(key)
+        return (int(match.group(1)),) if match else ()
+
+    def _handle(self, message):
+        self.messages += 1
+        channel = message["channel"]
+        if isinstance(channel, bytes):
+            channel = channel.decode()
+        for post_id in self.post_ids(channel[len(self.prefix):]):
+            self.cache.invalidate(post_id)
+
+    def _enable_notifications(self):
+        # 서버에 이미 켜진 플래그(다른 구독자용)를 덮어쓰지 않도록 합집합으로 설정
+        current = self.redis.config_get("notify-keyspace-events").get("notify-keyspace-events", "")
+        if isinstance(current, bytes):
+            current = current.decode()
+        missing = "".join(flag for flag in self.NOTIFY_FLAGS if flag not in current)
+        # 'A' 는 '$' 'h' 'g' 를 포함하는 별칭
+        if "A" in current:
+            missing = missing.replace("$", "").replace("h", "").replace("g", "")
+        if missing:
+            self.redis.config_set("notify-keyspace-events", current + missing)
+
+    def start(self):
+        try:
+            self._enable_notifications()
+        except Exception as e:
+            # 관리형 Redis 등 CONFIG 가 막혀 있으면 서버 설정에 맡김 (없으면 TTL 로만 만료)
+            logger.warning(f"Could not enable keyspace notifications: {e}")
+        patterns = [self.prefix + ("post:b:*" if self.keyspace.hashed else "post:*:view_count"),
+                    self.prefix + "post:*:view_count:*"]
+        self._pubsub = self.redis.pubsub(ignore_subscribe_messages=True)
+        self._pubsub.psubscribe(**{pattern: self._handle for pattern in patterns})
+        self._thread = self._pubsub.run_in_thread(sleep_time=1.0, daemon=True)
+        logger.info(f"L1 invalidation subscribed to {patterns}")
+
+    def stop(self):
+        if self._thread:
+            self._thread.stop()
+            self._thread = None
@@ -0,0 +1,179 @@
+import os
+import sys
+import time
+import threading
+
+from histogram import LatencyHistogram
+
+# --------------------
+# 락 경합 프로파일러
+# --------------------
+# ProfiledLock 은 threading.Lock 대신 그대로 쓸 수 있는 래퍼로, 획득 대기 시간 / 보유 시간 /
+# 최대 대기자 수 / 현재 소유 스레드를 기록합니다.
+# LockProfiler.start() 로 샘플러를 켜면 일정 간격으로 소유자·대기자 스레드의 스택을 떠서
+# flamegraph.pl / speedscope 가 읽는 folded 형식("프레임;프레임;... 횟수")으로 모읍니다.
+# 소유자 스택을 보면 임계 구역 안에서 어느 줄(DB 쓰기? sleep? Redis?)이 시간을 쓰는지 알 수 있습니다.
+
+
+class ProfiledLock:
+    def __init__(self, name, profiler=None):
+        self.name = name
+        self._lock = threading.Lock()
+        self._meta = threading.Lock()  # 아래 통계 전용 (짧게만 잡음)
+        self.owner = None              # (스레드 ident, 스레드 이름)
+        self._acquired_at = 0.0
+        self._waiters = {}             # 스레드 ident -> 대기 시작 시각
+        self.max_waiters = 0
+        self.acquisitions = 0
+        self.contended = 0
+        self.wait_us = LatencyHistogram()
+        self.hold_us = LatencyHistogram()
+        (profiler or lock_profiler).register(self)
+
+    def acquire(self, blocking=True, timeout=-1):
+        if self._lock.acquire(False):
+            self._on_acquired(0.0, contended=False)
+            return True
+        if not blocking:
+            return False
+
+        ident = threading.get_ident()
+        started = time.perf_counter()
+        with self._meta:
+            self._waiters[ident] = started
+            self.max_waiters = max(self.max_waiters, len(self._waiters))
+        try:
+            acquired = self._lock.acquire(True, timeout)
+        finally:
+            with self._meta:
+                del self._waiters[ident]
+        if acquired:
+            self._on_acquired(time.perf_counter() - started, contended=True)
+        return acquired
+
+    def _on_acquired(self, wait_seconds, contended):
+        thread = threading.current_thread()
+        with self._meta:
+            self.owner = (thread.ident, thread.name)
+            self._acquired_at = time.perf_counter()
+            self.acquisitions += 1
+            if contended:
+                self.contended += 1
+            self.wait_us.record(wait_seconds * 1_000_000)
+
+    def release(self):
+        with self._meta:
+            self.hold_us.record((time.perf_counter() - self._acquired_at) * 1_000_000)
+            self.owner = None
+        self._lock.release()
+
+    def locked(self):
+        return self._lock.locked()
+
+    __enter__ = acquire
+
+    def __exit__(self, *exc):
+        self.release()
+
+    def threads(self):
+        """(소유자 ident 또는 None, 대기자 ident 목록)"""
+        with self._meta:
+            owner = self.owner[0] if self.owner else None
+            return owner, list(self._waiters)
+
+    def stats(self):
+        with self._meta:
+            now = time.perf_counter()
+            return {
+                "acquisitions": self.acquisitions,
+                "contended": self.contended,
+                "waiters": len(self._waiters),
+                "max_waiters": self.max_waiters,
+                "owner": self.owner[1] if self.owner else None,
+                "held_for_ms": round((now - self._acquired_at) * 1000, 3) if self.owner else 0.0,
+                "wait_ms": self.wait_us.summary(0.001),
+                "hold_ms": self.hold_us.summary(0.001),
+            }
+
+
+def _frame_label(frame):
+    code = frame.f_code
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{frame.f_lineno})"
+
+
+class LockProfiler:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._locks = []
+        self._folded = {}  # "락;held|waiting;프레임;..." -> 샘플 수
+        self.samples = 0
+        self._thread = None
+        self._stop = threading.Event()
+
+    def register(self, lock):
+        with self._lock:
+            self._locks.append(lock)
+
+    def stats(self):
+        with self._lock:
+            locks = list(self._locks)
+        return {
+            "sampling": self._thread is not None,
+            "samples": self.samples,
+            # 한 번도 잡히지 않은 락(쓰이지 않은 스트라이프 등)은 생략
+            "locks": {lock.name: lock.stats() for lock in locks if lock.acquisitions},
+        }
+
+    # --------------------
+    # 스택 샘플링
+    # --------------------
+    def start(self, interval=0.005):
+        if self._thread is not None:
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, args=(interval,), name="lock-profiler", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread = None
+
+    def _run(self, interval):
+        while not self._stop.wait(interval):
+            self.sample()
+
+    def sample(self):
+        with self._lock:
+            locks = list(self._locks)
+        frames = sys._current_frames()
+        folded = []
+        for lock in locks:
+            owner, waiters = lock.threads()
+            for state, idents in (("held", [owner] if owner else []), ("waiting", waiters)):
+                for ident in idents:
+                    frame = frames.get(ident)
+                    if frame is None:
+                        continue
+                    stack = []
+                    while frame is not None:
+                        stack.append(_frame_label(frame))
+                        frame = frame.f_back
+                    folded.append(";".join([lock.name, state] + stack[::-1]))
+        with self._lock:
+            self.samples += 1
+            for line in folded:
+                self._folded[line] = self._folded.get(line, 0) + 1
+
+    def folded(self):
+        """flamegraph.pl / speedscope 로 읽을 수 있는 folded stack 텍스트."""
+        with self._lock:
+            return "".join(f"{line} {count}\n" for line, count in sorted(self._folded.items()))
+
+    def reset(self):
+        with self._lock:
+            self._folded.clear()
+            self.samples = 0
+
+
+# 프로세스 전체가 공유하는 레지스트리
+lock_profiler = LockProfiler()
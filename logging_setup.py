@@ -0,0 +1,168 @@
+import time
+import queue
+import atexit
+import logging
+import threading
+from logging.handlers import QueueHandler, QueueListener
+
+from histogram import LatencyHistogram
+from metrics import PRUNE_EVERY, _copy
+
+LOG_FORMAT = '%(asctime)s - (%(threadName)s) - %(message)s'
+
+
+class NonBlockingQueueHandler(QueueHandler):
+    """
+    요청 스레드에서는 레코드를 큐에 넣기만 하는 핸들러.
+
+    포맷팅과 stderr 쓰기(핸들러 락 포함)는 QueueListener 스레드가 합니다.
+    큐가 가득 차면 기다리지 않고 버린 뒤 개수만 셉니다.
+    넣는 데 걸린 시간을 기록하여 요청 지연 중 로깅이 차지하는 비용을 보여줍니다.
+    통계는 metrics.StageMetrics 처럼 스레드별로 모으므로 emit 에는 락이 없습니다 (처음 들어온 스레드 등록 시에만).
+    """
+
+    def __init__(self, log_queue):
+        super().__init__(log_queue)
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._threads = []  # (thread, _EmitStats)
+        self._retired = _EmitStats()
+
+    def _my_stats(self):
+        stats = getattr(self._local, "stats", None)
+        if stats is None:
+            stats = self._local.stats = _EmitStats()
+            with self._lock:
+                self._threads.append((threading.current_thread(), stats))
+                if len(self._threads) % PRUNE_EVERY == 0:
+                    self._prune()
+        return stats
+
+    def _prune(self):
+        # self._lock 을 잡은 상태에서 호출. 끝난 스레드의 값은 retired 로 접음
+        alive = []
+        for thread, stats in self._threads:
+            if thread.is_alive():
+                alive.append((thread, stats))
+            else:
+                self._retired.enqueue_ns.merge(stats.enqueue_ns)
+                self._retired.dropped += stats.dropped
+        self._threads = alive
+
+    def prepare(self, record):
+        # 같은 프로세스 안의 큐이므로 메시지 병합(msg % args)을 리스너 스레드로 미룹니다.
+        return record
+
+    def emit(self, record):
+        started = time.perf_counter_ns()
+        try:
+            self.queue.put_nowait(self.prepare(record))
+            dropped = False
+        except queue.Full:
+            dropped = True
+        elapsed = time.perf_counter_ns() - started
+        stats = self._my_stats()
+        stats.enqueue_ns.record(elapsed)
+        if dropped:
+            stats.dropped += 1
+
+    def stats(self):
+        with self._lock:
+            self._prune()
+            enqueue_ns = _copy(self._retired.enqueue_ns)
+            dropped = self._retired.dropped
+            threads = list(self._threads)
+        for _, stats in threads:
+            enqueue_ns.merge(_copy(stats.enqueue_ns))
+            dropped += stats.dropped
+        return {
+            "records": enqueue_ns.count,
+            "dropped": dropped,
+            "queue_depth": self.queue.qsize(),
+            "enqueue_us": enqueue_ns.summary(0.001),
+        }
+
+
+class _EmitStats:
+    __slots__ = ("enqueue_ns", "dropped")
+
+    def __init__(self):
+        self.enqueue_ns = LatencyHistogram()
+        self.dropped = 0
+
+
+class LogSampler:
+    """
+    이벤트별 1/N 샘플링. every = {"cas_conflict": 100} 이면 CAS 충돌 로그는 100번에 한 번만 남깁니다.
+    목록에 없는 이벤트는 모두 남기며 세지도 않습니다.
+
+    Flask threaded 서버는 요청마다 스레드를 만들므로 스레드별로 세면 샘플링이 되지 않습니다.
+    대신 counter_buffer 의 통계처럼 락 없이 공유 dict 를 갱신합니다. 경합 중에는 몇 번이 유실될 수 있어
+    샘플 간격과 seen / suppressed 는 근사값입니다.
+    """
+
+    def __init__(self, every=None):
+        self.every = dict(every or {})
+        self.seen = {}
+        self.suppressed = {}
+
+    def sample(self, event):
+        n = self.every.get(event, 1)
+        if n <= 1:
+            return True
+        seen = self.seen.get(event, 0)
+        self.seen[event] = seen + 1
+        if seen % n:
+            self.suppressed[event] = self.suppressed.get(event, 0) + 1
+            return False
+        return True
+
+    def logger(self, logger, event):
+        """이번 호출이 샘플에 들면 logger, 아니면 아무것도 하지 않는 로거를 반환합니다."""
+        return logger if self.sample(event) else NULL_LOGGER
+
+    def stats(self):
+        return {"every": dict(self.every), "seen": dict(self.seen), "suppressed": dict(self.suppressed)}
+
+
+NULL_LOGGER = logging.getLogger("sampled-out")
+NULL_LOGGER.disabled = True
+
+queue_handler = None
+listener = None
+
+
+def setup_logging(level=logging.INFO, non_blocking=True, queue_size=10000):
+    """
+    루트 로거 설정. non_blocking 이면 QueueHandler → (별도 스레드) QueueListener → stderr,
+    아니면 기존과 같은 logging.basicConfig (요청 스레드에서 바로 stderr 에 씀).
+    """
+    global queue_handler, listener
+    if not non_blocking:
+        logging.basicConfig(level=level, format=LOG_FORMAT)
+        return
+
+    stream_handler = logging.StreamHandler()
+    stream_handler.setFormatter(logging.Formatter(LOG_FORMAT))
+    log_queue = queue.Queue(maxsize=queue_size)
+    queue_handler = NonBlockingQueueHandler(log_queue)
+
+    root = logging.getLogger()
+    root.setLevel(level)
+    root.addHandler(queue_handler)
+    listener = QueueListener(log_queue, stream_handler, respect_handler_level=True)
+    listener.start()
+    # 종료 시 큐에 남은 로그를 모두 쓰고 끝냄
+    atexit.register(listener.stop)
+
+
+def logging_stats(sampler=None):
+    stats = {
+        "level": logging.getLevelName(logging.getLogger().level),
+        "non_blocking": queue_handler is not None,
+    }
+    if queue_handler is not None:
+        stats.update(queue_handler.stats())
+    if sampler is not None:
+        stats["sampling"] = sampler.stats()
+    return stats
@@ -0,0 +1,125 @@
+import time
+import threading
+from contextlib import contextmanager
+
+from histogram import LatencyHistogram
+
+# --------------------
+# 전략별 / 단계별 지연 히스토그램 + Prometheus 텍스트 출력
+# --------------------
+# 요청 스레드는 자기 스레드 전용 히스토그램에만 기록하므로 핫 경로에 락이 없습니다.
+# /metrics 수집 시에만 모든 스레드의 히스토그램을 복사해 합칩니다.
+# (Flask threaded 서버는 요청마다 스레드를 만들므로, 끝난 스레드의 값은 retired 로 접어 둡니다.)
+
+# Prometheus histogram 버킷 경계 (초)
+BUCKETS_SECONDS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025,
+                   0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"  # Prometheus 텍스트 형식
+PRUNE_EVERY = 256  # 새 스레드가 이만큼 등록될 때마다 끝난 스레드를 정리
+
+
+def _copy(hist):
+    # 다른 스레드가 기록 중일 수 있으므로 dict(...) 한 번으로 복사 (GIL 아래에서 원자적)
+    copied = LatencyHistogram(hist.sub_buckets)
+    copied.counts = dict(hist.counts)
+    copied.count = sum(copied.counts.values())
+    copied.total = hist.total
+    copied.min, copied.max = hist.min, hist.max
+    return copied
+
+
+class StageMetrics:
+    def __init__(self):
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._threads = []  # (thread, {(strategy, stage): LatencyHistogram})
+        self._retired = {}
+
+    def _hists(self):
+        hists = getattr(self._local, "hists", None)
+        if hists is None:
+            hists = self._local.hists = {}
+            with self._lock:
+                self._threads.append((threading.current_thread(), hists))
+                if len(self._threads) % PRUNE_EVERY == 0:
+                    self._prune()
+        return hists
+
+    def _prune(self):
+        # self._lock 을 잡은 상태에서 호출. 끝난 스레드는 더 기록하지 않으므로 그대로 합쳐도 안전
+        alive = []
+        for thread, hists in self._threads:
+            if thread.is_alive():
+                alive.append((thread, hists))
+                continue
+            for key, hist in hists.items():
+                self._retired.setdefault(key, LatencyHistogram()).merge(hist)
+        self._threads = alive
+
+    def record(self, strategy, stage, seconds):
+        hists = self._hists()
+        hist = hists.get((strategy, stage))
+        if hist is None:
+            hist = hists[(strategy, stage)] = LatencyHistogram()
+        hist.record(seconds * 1_000_000)
+
+    @contextmanager
+    def time(self, strategy, stage):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(strategy, stage, time.perf_counter() - started)
+
+    def recorder(self, strategy):
+        return StageRecorder(self, strategy)
+
+    def snapshot(self):
+        """{(strategy, stage): LatencyHistogram(마이크로초)} — 모든 스레드 합계."""
+        with self._lock:
+            self._prune()
+            merged = {key: _copy(hist) for key, hist in self._retired.items()}
+            threads = list(self._threads)
+        for _, hists in threads:
+            for key, hist in list(hists.items()):
+                merged.setdefault(key, LatencyHistogram()).merge(_copy(hist))
+        return merged
+
+    def prometheus(self, name="view_stage_duration_seconds"):
+        lines = [
+            f"# HELP {name} Time spent in each stage of a view-count request.",
+            f"# TYPE {name} histogram",
+        ]
+        for (strategy, stage), hist in sorted(self.snapshot().items()):
+            labels = f'strategy="{strategy}",stage="{stage}"'
+            buckets = hist.buckets()
+            i = cumulative = 0
+            for le in BUCKETS_SECONDS:
+                limit = le * 1_000_000
+                while i < len(buckets) and buckets[i][0] <= limit:
+                    cumulative += buckets[i][1]
+                    i += 1
+                lines.append(f'{name}_bucket{{{labels},le="{le}"}} {cumulative}')
+            lines.append(f'{name}_bucket{{{labels},le="+Inf"}} {hist.count}')
+            lines.append(f"{name}_sum{{{labels}}} {hist.total / 1_000_000:.6f}")
+            lines.append(f"{name}_count{{{labels}}} {hist.count}")
+        return "\n".join(lines) + "\n"
+
+
+class StageRecorder:
+    """전략 이름을 고정한 기록기. 각 app_*.py 모듈에 하나씩 둡니다."""
+
+    def __init__(self, metrics, strategy):
+        self.metrics = metrics
+        self.strategy = strategy
+
+    def time(self, stage):
+        return self.metrics.time(self.strategy, stage)
+
+    def since(self, stage, started):
+        # started = time.perf_counter() 로 잰 시작 시각 (with 로 감싸기 어려운 락 대기 등)
+        self.metrics.record(self.strategy, stage, time.perf_counter() - started)
+
+
+# 프로세스 전체가 공유하는 레지스트리
+stage_metrics = StageMetrics()
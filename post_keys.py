@@ -0,0 +1,110 @@
+from functools import lru_cache
+
+# --------------------
+# 게시글별 조회수 Redis 키 공간
+# --------------------
+# 두 가지 인코딩을 지원합니다.
+#
+#  - "string": 게시글마다 문자열 키 하나  → post:<id>:view_count = N
+#              기존 코드/README 의 확인 방법(GET post:1:view_count)과 동일합니다.
+#  - "hash"  : 게시글 BUCKET_SIZE 개를 해시 하나에 묶음 → HSET post:b:<id // BUCKET_SIZE> <id % BUCKET_SIZE> N
+#              작은 해시는 Redis 가 listpack 으로 압축 저장하므로 키 수백만 개일 때 메모리가 크게 줄어듭니다.
+#              BUCKET_SIZE 는 redis.conf 의 hash-max-listpack-entries(기본 128) 이하로 유지해야 압축이 유지됩니다.
+#
+# 키 문자열은 lru_cache 로 캐싱하여, 핫 경로에서는 매 요청 f-string 포맷팅 없이 사전 조회만 합니다.
+
+KEY_CACHE_SIZE = 1 << 16
+DEFAULT_BUCKET_SIZE = 100
+ENCODINGS = ("string", "hash")
+
+
+@lru_cache(maxsize=KEY_CACHE_SIZE)
+def view_count_key(post_id):
+    return f"post:{post_id}:view_count"
+
+
+@lru_cache(maxsize=KEY_CACHE_SIZE)
+def shard_key(post_id, shard):
+    """핫 게시글의 분산 카운터 키 (hot_keys.py). 인코딩과 무관하게 string 키입니다."""
+    return f"post:{post_id}:view_count:{shard}"
+
+
+@lru_cache(maxsize=KEY_CACHE_SIZE)
+def read_cache_key(post_id):
+    """읽기 전용 캐시 복사본 (stampede.py). 카운터 키와 달리 TTL 을 걸 수 있는 string 키입니다."""
+    return f"post:{post_id}:view_cache"
+
+
+@lru_cache(maxsize=KEY_CACHE_SIZE)
+def _bucket_location(post_id, bucket_size):
+    bucket, field = divmod(post_id, bucket_size)
+    return f"post:b:{bucket}", str(field)
+
+
+class CounterKeySpace:
+    """
+    게시글 ID → Redis 조회수 저장 위치 변환 및 기본 연산.
+
+    client 자리에는 redis.Redis 와 파이프라인 모두 올 수 있습니다.
+    """
+
+    def __init__(self, encoding="string", bucket_size=DEFAULT_BUCKET_SIZE):
+        if encoding not in ENCODINGS:
+            raise ValueError(f"encoding must be one of {ENCODINGS}")
+        self.encoding = encoding
+        self.bucket_size = bucket_size
+        self.hashed = encoding == "hash"
+
+    def key(self, post_id):
+        """값이 저장된 Redis 키 (WATCH 대상). hash 인코딩이면 버킷 키입니다."""
+        if self.hashed:
+            return _bucket_location(post_id, self.bucket_size)[0]
+        return view_count_key(post_id)
+
+    def location(self, post_id):
+        """(키, 해시 필드) 쌍. string 인코딩이면 필드는 빈 문자열입니다. (Lua 스크립트 인자용)"""
+        if self.hashed:
+            return _bucket_location(post_id, self.bucket_size)
+        return view_count_key(post_id), ""
+
+    def get(self, client, post_id):
+        if self.hashed:
+            return client.hget(*_bucket_location(post_id, self.bucket_size))
+        return client.get(view_count_key(post_id))
+
+    def set(self, client, post_id, value):
+        if self.hashed:
+            key, field = _bucket_location(post_id, self.bucket_size)
+            return client.hset(key, field, value)
+        return client.set(view_count_key(post_id), value)
+
+    def set_nx(self, client, post_id, value):
+        if self.hashed:
+            key, field = _bucket_location(post_id, self.bucket_size)
+            return client.hsetnx(key, field, value)
+        return client.set(view_count_key(post_id), value, nx=True)
+
+    def incr(self, client, post_id, amount=1):
+        if self.hashed:
+            key, field = _bucket_location(post_id, self.bucket_size)
+            return client.hincrby(key, field, amount)
+        return client.incrby(view_count_key(post_id), amount)
+
+    def exists(self, client, post_id):
+        if self.hashed:
+            return client.hexists(*_bucket_location(post_id, self.bucket_size))
+        return client.exists(view_count_key(post_id))
+
+    def delete(self, client, post_id):
+        if self.hashed:
+            return client.hdel(*_bucket_location(post_id, self.bucket_size))
+        return client.delete(view_count_key(post_id))
+
+    def mget(self, client, post_ids):
+        """여러 게시글 값을 한 번의 왕복으로 읽습니다. 반환 순서는 post_ids 와 같습니다."""
+        if not self.hashed:
+            return client.mget([view_count_key(pid) for pid in post_ids])
+        pipe = client.pipeline(transaction=False)
+        for pid in post_ids:
+            pipe.hget(*_bucket_location(pid, self.bucket_size))
+        return pipe.execute()
@@ -0,0 +1,292 @@
+import time
+import logging
+import threading
+from collections import deque
+
+from write_behind import delta_key, inflight_key
+
+logger = logging.getLogger(__name__)
+
+# --------------------
+# Redis ↔ MySQL 조회수 불일치(drift) 점검기
+# --------------------
+# 테스트 후 GET post:1:view_count 와 SELECT view_count 를 손으로 비교하던 작업을 백그라운드로 옮긴 것입니다.
+# SCAN 으로 캐시 키를 batch_size 개씩 훑고, 같은 묶음의 DB 행은 IN (...) 쿼리 한 번으로 읽습니다.
+# SCAN 커서는 Redis 에 저장하므로 재시작해도 이어서 점검합니다.
+#
+# 기대값 = DB 값 + 아직 DB 에 반영되지 않은 write-behind 증가분 (post:<id>:view_delta, inflight)
+# 요청이 처리 중인 게시글은 잠깐 어긋나 보일 수 있으므로, 어긋난 항목은 한 번 더 읽어
+# 차이가 그대로일 때만 drift 로 확정합니다.
+# hot_keys(hot_keys.ShardedCounters) 를 주면 분산 중인 게시글은 분산 키 합계까지 더해 비교합니다.
+# journal_replayer(journal.JournalReplayer) 를 주면 저널이 degraded 이거나 아직 재반영하지 못한 레코드가 남아 있는 동안은
+# 점검을 미룹니다. 저널에만 있는 증가분은 Redis 와 MySQL 중 한쪽에만 빠져 있을 수 있어 drift 로 오인되기 때문입니다.
+# (저널은 호스트마다 로컬이므로, 여러 호스트로 돌릴 때는 각 호스트의 점검기가 자기 저널만 봅니다)
+#
+# 정책
+#  - report      : 세고 기록만 함
+#  - repair_cache: MySQL 을 원본으로 보고 Redis 값을 기대값으로 덮어씀 (읽은 뒤 값이 바뀌었으면 건너뜀, 분산 중인 게시글도 건너뜀)
+#  - repair_db   : Redis 를 원본으로 보고 MySQL 값을 맞춤 (읽은 뒤 값이 바뀌었으면 건너뜀)
+POLICIES = ("report", "repair_cache", "repair_db")
+CURSOR_KEY = "reconcile:cursor"
+RECENT_DRIFTS = 20  # stats 에 보여줄 최근 drift 항목 수
+
+# KEYS[1] 캐시 키, ARGV[1] 해시 필드('' 이면 string), ARGV[2] 읽었던 값, ARGV[3] 새 값
+REPAIR_SCRIPT = """
+local current
+if ARGV[1] == '' then
+    current = redis.call('GET', KEYS[1])
+else
+    current = redis.call('HGET', KEYS[1], ARGV[1])
+end
+if current ~= ARGV[2] then
+    return 0
+end
+if ARGV[1] == '' then
+    redis.call('SET', KEYS[1], ARGV[3], 'KEEPTTL')
+else
+    redis.call('HSET', KEYS[1], ARGV[1], ARGV[3])
+end
+return 1
+"""
+
+
+class DriftReconciler:
+    def __init__(self, redis_client, db_pool, keyspace, policy="report", batch_size=200,
+                 max_keys_per_second=2000, pass_interval=60.0, max_pool_utilization=0.5, tolerance=0,
+                 confirm_delay=0.2, hot_keys=None, journal_replayer=None):
+        if policy not in POLICIES:
+            raise ValueError(f"policy must be one of {POLICIES}")
+        self.redis = redis_client
+        self.db_pool = db_pool
+        self.keyspace = keyspace  # post_keys.CounterKeySpace
+        self.hot_keys = hot_keys  # hot_keys.ShardedCounters (없으면 기존 키만 읽음)
+        self.journal_replayer = journal_replayer  # journal.JournalReplayer (저널을 쓰지 않으면 None)
+        self.policy = policy
+        self.batch_size = batch_size
+        # 실시간 요청과 경쟁하지 않도록: 초당 점검 키 수 상한 + DB 풀이 바쁘면 양보
+        self.max_keys_per_second = max_keys_per_second
+        self.max_pool_utilization = max_pool_utilization
+        self.pass_interval = pass_interval  # 한 바퀴(SCAN 커서가 0 으로 돌아옴)를 마친 뒤 쉬는 시간
+        self.tolerance = tolerance          # 이 이하의 차이는 무시
+        self.confirm_delay = confirm_delay  # 어긋난 항목을 다시 읽기 전 대기 (요청 하나가 끝날 만한 시간)
+
+        self._repair = redis_client.register_script(REPAIR_SCRIPT)
+        self._stop = threading.Event()
+        self._thread = None
+        self._stats_lock = threading.Lock()
+
+        self._passes = 0
+        self._batches = 0
+        self._keys_checked = 0
+        self._pass_keys = 0
+        self._pass_started = time.monotonic()
+        self._last_pass_seconds = 0.0
+        self._last_pass_drifts = 0
+        self._pass_drifts = 0
+        self._drifts = 0
+        self._drift_total = 0  # 확정된 차이의 절대값 합
+        self._transient = 0    # 다시 읽었더니 사라진 차이
+        self._orphans = 0      # Redis 에만 있고 DB 에 행이 없는 게시글
+        self._repaired = 0
+        self._repair_skipped = 0
+        self._yielded = 0      # DB 풀이 바빠서 건너뛴 횟수
+        self._journal_waits = 0  # 저널 재반영이 끝나지 않아 건너뛴 횟수
+        self._errors = 0
+        self._recent = deque(maxlen=RECENT_DRIFTS)
+
+    # --------------------
+    # 캐시 키 훑기
+    # --------------------
+    def _scan(self, cursor):
+        """(다음 커서, {post_id: 캐시 값 문자열})"""
+        values = {}
+        if not self.keyspace.hashed:
+            cursor, keys = self.redis.scan(cursor, match="post:*:view_count", count=self.batch_size)
+            post_ids = [int(key.split(":")[1]) for key in keys if key.split(":")[1].isdigit()]
+            if post_ids:
+                values = dict(zip(post_ids, self._mget(post_ids)))
+        else:
+            # hash 인코딩은 버킷 하나에 게시글 bucket_size 개
+            count = max(1, self.batch_size // self.keyspace.bucket_size)
+            cursor, keys = self.redis.scan(cursor, match="post:b:*", count=count)
+            keys = [key for key in keys if key.split(":")[2].isdigit()]
+            pipe = self.redis.pipeline(transaction=False)
+            for key in keys:
+                pipe.hgetall(key)
+            for key, fields in zip(keys, pipe.execute()):
+                base = int(key.split(":")[2]) * self.keyspace.bucket_size
+                values.update({base + int(field): value for field, value in fields.items()})
+            if self.hot_keys:
+                values = self.hot_keys.add_shards(values)
+        return cursor, {post_id: value for post_id, value in values.items() if value is not None}
+
+    def _mget(self, post_ids):
+        if self.hot_keys:
+            return self.hot_keys.mget(post_ids)
+        return self.keyspace.mget(self.redis, post_ids)
+
+    def _pending(self, post_ids):
+        """아직 DB 에 반영되지 않은 write-behind 증가분."""
+        pipe = self.redis.pipeline(transaction=False)
+        for post_id in post_ids:
+            pipe.get(delta_key(post_id))
+            pipe.hget(inflight_key(post_id), "delta")
+        raw = pipe.execute()
+        return {post_id: int(raw[2 * i] or 0) + int(raw[2 * i + 1] or 0) for i, post_id in enumerate(post_ids)}
+
+    def _db_counts(self, post_ids):
+        with self.db_pool.connection() as conn:
+            cursor = conn.cursor()
+            placeholders = ", ".join(["%s"] * len(post_ids))
+            cursor.execute(f"SELECT id, view_count FROM content WHERE id IN ({placeholders})", list(post_ids))
+            rows = cursor.fetchall()
+            conn.commit()  # 다시 읽을 때 REPEATABLE READ 스냅샷이 재사용되지 않도록 트랜잭션을 끝냄
+        return dict(rows)
+
+    def _diff(self, cached, pending, db_counts):
+        """{post_id: (캐시 값, DB 값, 미반영 증가분, 차이)} — 차이가 tolerance 를 넘는 것만."""
+        drifted = {}
+        for post_id, value in cached.items():
+            db_value = db_counts.get(post_id)
+            if db_value is None:
+                continue
+            diff = int(value) - (db_value + pending[post_id])
+            if abs(diff) > self.tolerance:
+                drifted[post_id] = (value, db_value, pending[post_id], diff)
+        return drifted
+
+    # --------------------
+    # 한 묶음 점검
+    # --------------------
+    def run_batch(self):
+        """SCAN 한 번 분량을 점검하고, 점검한 키 수를 반환합니다. (DB 풀이 바쁘면 0)"""
+        if self.db_pool.stats()["utilization"] >= self.max_pool_utilization:
+            with self._stats_lock:
+                self._yielded += 1
+            return 0
+        if self.journal_replayer and self.journal_replayer.backlog():
+            with self._stats_lock:
+                self._journal_waits += 1
+            return 0
+
+        cursor = int(self.redis.get(CURSOR_KEY) or 0)
+        next_cursor, cached = self._scan(cursor)
+        suspects, drifted = {}, {}
+        orphans = 0
+        if cached:
+            db_counts = self._db_counts(cached)
+            orphans = sum(1 for post_id in cached if post_id not in db_counts)
+            suspects = self._diff(cached, self._pending(list(cached)), db_counts)
+        if suspects:
+            # 처리 중이던 요청(DB 반영 ~ 캐시 반영 사이) 때문에 잠깐 어긋난 것인지 잠시 뒤 다시 읽어 확인
+            time.sleep(self.confirm_delay)
+            recached = dict(zip(suspects, self._mget(list(suspects))))
+            recached = {post_id: value for post_id, value in recached.items() if value is not None}
+            if recached:
+                rechecked = self._diff(recached, self._pending(list(recached)), self._db_counts(recached))
+                drifted = {post_id: entry for post_id, entry in rechecked.items()
+                           if entry[3] == suspects[post_id][3]}
+        repaired, skipped = self._apply_policy(drifted)
+        self.redis.set(CURSOR_KEY, next_cursor)
+
+        with self._stats_lock:
+            self._batches += 1
+            self._keys_checked += len(cached)
+            self._pass_keys += len(cached)
+            self._orphans += orphans
+            self._transient += len(suspects) - len(drifted)
+            self._drifts += len(drifted)
+            self._pass_drifts += len(drifted)
+            self._drift_total += sum(abs(entry[3]) for entry in drifted.values())
+            self._repaired += repaired
+            self._repair_skipped += skipped
+            for post_id, (value, db_value, pending, diff) in drifted.items():
+                self._recent.append({"post_id": post_id, "redis": int(value), "db": db_value,
+                                     "pending": pending, "diff": diff, "at": time.strftime("%Y-%m-%dT%H:%M:%S")})
+            if next_cursor == 0:
+                self._passes += 1
+                self._last_pass_seconds = time.monotonic() - self._pass_started
+                self._last_pass_drifts = self._pass_drifts
+                self._pass_started = time.monotonic()
+                self._pass_drifts = self._pass_keys = 0
+        if drifted:
+            logger.warning(f"View count drift on {len(drifted)} posts (policy={self.policy}, repaired={repaired})")
+        return len(cached)
+
+    def _apply_policy(self, drifted):
+        """(고친 수, 값이 바뀌어 건너뛴 수)"""
+        if not drifted or self.policy == "report":
+            return 0, 0
+        if self.policy == "repair_cache":
+            repaired = 0
+            for post_id, (value, db_value, pending, _) in drifted.items():
+                if self.hot_keys and self.hot_keys.sharded(post_id):
+                    continue  # 값이 여러 키에 나뉘어 있어 한 키만 덮어쓸 수 없음
+                key, field = self.keyspace.location(post_id)
+                repaired += self._repair(keys=[key], args=[field, value, db_value + pending])
+            return repaired, len(drifted) - repaired
+
+        # repair_db: 읽은 DB 값 그대로일 때만 덮어씀 (그 사이 증가가 있었으면 rowcount 0)
+        repaired = 0
+        with self.db_pool.connection() as conn:
+            cursor = conn.cursor()
+            for post_id, (value, db_value, pending, _) in drifted.items():
+                repaired += cursor.execute(
+                    "UPDATE content SET view_count = %s WHERE id = %s AND view_count = %s",
+                    (int(value) - pending, post_id, db_value))
+            conn.commit()
+        return repaired, len(drifted) - repaired
+
+    # --------------------
+    # 백그라운드 스레드
+    # --------------------
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name="drift-reconciler", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread:
+            self._thread.join()
+
+    def _run(self):
+        while not self._stop.is_set():
+            started = time.monotonic()
+            passes = self._passes
+            try:
+                checked = self.run_batch()
+            except Exception as e:
+                checked = 0
+                with self._stats_lock:
+                    self._errors += 1
+                logger.error(f"Drift reconcile batch failed: {e}", exc_info=True)
+            # 초당 max_keys_per_second 를 넘지 않도록 쉬고, 한 바퀴를 마쳤으면 pass_interval 만큼 쉼
+            pause = max(checked, self.batch_size) / self.max_keys_per_second - (time.monotonic() - started)
+            if self._passes != passes:
+                pause = self.pass_interval
+            self._stop.wait(max(pause, 0.0))
+
+    def stats(self):
+        with self._stats_lock:
+            return {
+                "policy": self.policy,
+                "running": self._thread is not None and self._thread.is_alive(),
+                "batch_size": self.batch_size,
+                "max_keys_per_second": self.max_keys_per_second,
+                "passes": self._passes,
+                "batches": self._batches,
+                "keys_checked": self._keys_checked,
+                "current_pass_keys": self._pass_keys,
+                "last_pass_seconds": round(self._last_pass_seconds, 3),
+                "last_pass_drifts": self._last_pass_drifts,
+                "drifts": self._drifts,
+                "drift_total": self._drift_total,
+                "transient": self._transient,
+                "orphans": self._orphans,
+                "repaired": self._repaired,
+                "repair_skipped": self._repair_skipped,
+                "yielded_to_traffic": self._yielded,
+                "waited_for_journal": self._journal_waits,
+                "errors": self._errors,
+                "recent": list(self._recent),
+            }
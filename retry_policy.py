@@ -0,0 +1,72 @@
+import time
+import random
+import threading
+
+from histogram import LatencyHistogram
+
+
+class RetryExhausted(Exception):
+    """최대 재시도 횟수를 넘겼을 때 발생합니다. (HTTP 409 로 응답)"""
+
+
+class RetryDeadlineExceeded(Exception):
+    """요청 전체 마감 시간을 넘겼을 때 발생합니다. (HTTP 503 으로 응답)"""
+
+
+class RetryPolicy:
+    """
+    충돌 재시도 정책: 최대 시도 횟수 + 지수 백오프(Full Jitter) + 전체 마감 시간.
+
+    n 번째 실패 후에는 0 ~ min(cap, base * 2^(n-1)) 사이에서 무작위로 쉬므로,
+    같은 순간에 충돌한 스레드들이 다시 같은 순간에 몰려들지 않습니다.
+    max_attempts 나 deadline 이 0 이면 해당 제한을 두지 않습니다.
+    """
+
+    def __init__(self, max_attempts=20, base=0.005, cap=0.5, deadline=10.0):
+        self.max_attempts = max_attempts
+        self.base = base
+        self.cap = cap
+        self.deadline = deadline
+
+    def backoff(self, attempt):
+        return random.uniform(0, min(self.cap, self.base * (2 ** (attempt - 1))))
+
+    def next_delay(self, attempt, started):
+        """attempt 번째 시도가 실패한 뒤 호출. 재시도가 가능하면 쉴 시간을 반환, 아니면 예외를 던집니다. (직접 쉬지는 않음, asyncio 용)"""
+        if self.max_attempts and attempt >= self.max_attempts:
+            raise RetryExhausted(f"Gave up after {attempt} attempts")
+        delay = self.backoff(attempt)
+        if self.deadline and time.monotonic() - started + delay > self.deadline:
+            raise RetryDeadlineExceeded(f"Deadline of {self.deadline}s exceeded after {attempt} attempts")
+        return delay
+
+    def wait(self, attempt, started):
+        """attempt 번째 시도가 실패한 뒤 호출. 재시도가 가능하면 백오프만큼 쉬고 그 시간을 반환, 아니면 예외를 던집니다."""
+        delay = self.next_delay(attempt, started)
+        time.sleep(delay)
+        return delay
+
+
+class RetryStats:
+    """요청별 재시도 횟수 분포와 결과(성공 / 횟수 초과 / 마감 초과)를 모읍니다."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.retries = LatencyHistogram()   # 요청 하나가 겪은 재시도 횟수 (= 시도 횟수 - 1)
+        self.backoff_ms = LatencyHistogram()  # 요청 하나가 백오프로 쉰 총 시간
+        self.outcomes = {"success": 0, "exhausted": 0, "deadline": 0}
+
+    def record(self, outcome, attempts, backoff_seconds=0.0):
+        with self._lock:
+            self.outcomes[outcome] = self.outcomes.get(outcome, 0) + 1
+            self.retries.record(attempts - 1)
+            self.backoff_ms.record(backoff_seconds * 1000)
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                "outcomes": dict(self.outcomes),
+                "retries_per_request": self.retries.summary(),
+                "retries_per_request_buckets": {str(v): c for v, c in self.retries.buckets()},
+                "backoff_ms_per_request": self.backoff_ms.summary(),
+            }
@@ -0,0 +1,45 @@
+-- 추가 테이블 스키마 (w11_exam)
+-- content(id, view_count) 테이블은 기존 것을 그대로 사용합니다.
+
+-- Write-Behind 플러시 기록 (write_behind.py, inflight_policy = "exactly_once")
+-- 게시글별로 마지막으로 DB에 반영한 배치 번호를 저장하여, 크래시 후 재반영 시 중복을 막습니다.
+CREATE TABLE IF NOT EXISTS view_flush_log (
+    post_id  BIGINT NOT NULL PRIMARY KEY,
+    last_seq BIGINT NOT NULL
+);
+
+-- 분산 락 펜싱 토큰 (distributed_lock.py, app_lock.py / app_record_lock.py 의 DISTRIBUTED_LOCK = True)
+-- 자원별로 마지막으로 DB에 쓴 토큰을 저장하여, 임대가 만료된 뒤 늦게 도착한 이전 소유자의 쓰기를 거부합니다.
+CREATE TABLE IF NOT EXISTS lock_fence (
+    resource VARCHAR(191) NOT NULL PRIMARY KEY,
+    token    BIGINT NOT NULL
+);
+
+-- 로컬 저널 재반영 오프셋 (journal.py, app_incr.py 의 JOURNAL = True)
+-- 저널별로 MySQL 에 마지막으로 반영한 레코드 오프셋을 반영 UPDATE 와 같은 트랜잭션에 저장하여 중복 반영을 막습니다.
+CREATE TABLE IF NOT EXISTS journal_offset (
+    journal        VARCHAR(191) NOT NULL PRIMARY KEY,
+    applied_offset BIGINT NOT NULL
+);
+
+-- 게시글별 순 방문자 HyperLogLog 레지스터 (unique_viewers.py)
+-- Redis 의 post:<id>:viewers(:<YYYYMMDD>) 키 원본 바이트를 주기적으로 저장하여, 키가 밀려나도 방문자 집계를 되살립니다.
+-- period: 'all'(전체 기간) 또는 'YYYYMMDD'(UTC 일별)
+CREATE TABLE IF NOT EXISTS post_viewers (
+    post_id    BIGINT NOT NULL,
+    period     VARCHAR(8) NOT NULL,
+    registers  BLOB NOT NULL,
+    updated_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
+    PRIMARY KEY (post_id, period)
+);
+
+-- 시간대별 조회수 롤업 (view_buckets.py)
+-- Redis 의 분 단위 버킷(post:<id>:views:<YYYYMMDDHH>) 을 시간 행으로, 시간 행을 일 행으로 합친 값입니다. bucket_start 는 UTC.
+-- 롤러가 합계로 덮어쓰므로(upsert) 같은 시간을 여러 번 롤업해도 값은 같습니다.
+CREATE TABLE IF NOT EXISTS view_rollup (
+    post_id      BIGINT NOT NULL,
+    granularity  ENUM('hour', 'day') NOT NULL,
+    bucket_start DATETIME NOT NULL,
+    views        BIGINT NOT NULL,
+    PRIMARY KEY (post_id, granularity, bucket_start)
+);
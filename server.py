@@ -0,0 +1,251 @@
+from flask import Flask, jsonify, Response, request
+import logging
+from threading import Lock
+
+import app as app_basic
+import app_lock
+import app_record_lock
+import app_cas
+import app_incr
+import app_write_through
+import app_write_through2
+import app_double_checked_locking
+import app_read
+from common import redis_client, keyspace, db_pool, lease_locks, log_sampler, cache_warmer, hot_keys, unique_viewers
+from common import view_buckets, TIME_BUCKETS
+from common import LOCK_PROFILING, LOCK_PROFILE_INTERVAL_SECONDS
+from logging_setup import logging_stats
+from metrics import stage_metrics, CONTENT_TYPE
+import journal as journal_metrics
+from lock_profiler import lock_profiler
+from distributed_lock import LockTimeout
+from reconciler import DriftReconciler, POLICIES as RECONCILE_POLICIES
+
+# --------------------
+# 1. 전략 레지스트리
+# --------------------
+# 각 app_*.py 의 increment_view_count 를 그대로 가져와 한 프로세스에서 실행합니다.
+# DB 연결 풀 / Redis 클라이언트는 common.py 의 것을 모두 공유하므로,
+# 전략을 바꿔가며 같은 (워밍업된) 프로세스 상태에서 비교할 수 있습니다.
+STRATEGIES = {
+    "basic": app_basic.increment_view_count,                          # 제어 없음
+    "lock": app_lock.increment_view_count,                            # 글로벌 락
+    "record_lock": app_record_lock.increment_view_count,              # 게시글별 락
+    "cas": app_cas.increment_view_count,                              # WATCH/MULTI CAS (CAS_MODE 에 따름)
+    "cas_lua": app_cas.increment_view_count_lua,                      # Lua 스크립트 CAS (EVALSHA)
+    "incr": app_incr.increment_view_count,                            # Redis INCR
+    "write_through": app_write_through.increment_view_count,          # DB 갱신 후 캐시 SET
+    "write_through_invalidate": app_write_through2.increment_view_count,  # DB 갱신 후 캐시 DELETE
+    "dcl": app_double_checked_locking.increment_view_count,           # Double-Checked Locking + INCR
+}
+
+DEFAULT_STRATEGY = "incr"
+
+# 핫 게시글 분산(HOT_KEY_SHARDING, common.py) 을 켜면 분산 키를 아는 INCR 전략만 받습니다.
+# 나머지 전략은 기존 키 하나만 읽고 SET 하거나(basic/lock/record_lock/CAS/write_through) 미스 때 DB 값으로 채우므로,
+# 분산 키에 남아 있는 증가분과 합치면 두 번 세게 됩니다.
+SHARDING_STRATEGIES = ("incr",)
+
+def conflicts_with_sharding(name):
+    return hot_keys.enabled and name not in SHARDING_STRATEGIES
+
+app = Flask(__name__)
+logger = logging.getLogger(__name__)
+
+# 현재 기본 경로(/api/view/increment/<id>)가 사용하는 전략
+active_strategy = DEFAULT_STRATEGY
+strategy_lock = Lock()
+
+# 시작 시 캐시 워밍업을 백그라운드로 돌리고, 끝나기 전에는 증가 API 를 503 으로 거절
+# (워밍업의 SET NX 보다 INCR 이 먼저 키를 만들면 MySQL 값을 잃음. 조회/모니터링 API 는 막지 않음)
+# 로드밸런서는 GET /ready 로 판단 (진행률 WARMUP_MIN_COVERAGE(common.py) 이상이면 200)
+WARMUP_GATE = True
+GATED_ENDPOINTS = ('increment_view_count', 'increment_view_count_with', 'increment_view_count_batch')
+
+# Redis ↔ MySQL 불일치 점검기 (reconciler.py). 어느 전략이든 쌓인 drift 를 백그라운드에서 찾아 세거나 고침
+RECONCILER = False
+RECONCILE_POLICY = "report"          # report / repair_cache / repair_db
+RECONCILE_BATCH_SIZE = 200           # SCAN 한 번에 훑을 키 수 (= DB IN 쿼리 크기)
+RECONCILE_MAX_KEYS_PER_SECOND = 2000
+RECONCILE_PASS_INTERVAL_SECONDS = 60.0
+RECONCILE_MAX_POOL_UTILIZATION = 0.5  # DB 풀 사용률이 이 이상이면 이번 묶음은 건너뜀
+
+reconciler = DriftReconciler(
+    redis_client, db_pool, keyspace, policy=RECONCILE_POLICY, batch_size=RECONCILE_BATCH_SIZE,
+    max_keys_per_second=RECONCILE_MAX_KEYS_PER_SECOND, pass_interval=RECONCILE_PASS_INTERVAL_SECONDS,
+    max_pool_utilization=RECONCILE_MAX_POOL_UTILIZATION, hot_keys=hot_keys,
+    journal_replayer=app_incr.journal_replayer)
+
+# --------------------
+# 2. 조회수 증가 API
+# --------------------
+@app.before_request
+def reject_until_warm():
+    if WARMUP_GATE and request.endpoint in GATED_ENDPOINTS and not cache_warmer.complete():
+        return jsonify({"error": "Cache warm-up in progress", "coverage": round(cache_warmer.coverage(), 4)}), 503
+
+@app.route('/ready', methods=['GET'])
+def readiness():
+    # 워밍업 진행률이 기준을 넘으면 200, 아니면 503
+    stats = cache_warmer.stats()
+    return jsonify(stats), 200 if stats["ready"] else 503
+
+@app.route('/api/view/increment/<int:post_id>', methods=['POST'])
+def increment_view_count(post_id):
+    # 관리자 API 로 선택된 전략으로 처리
+    return run_timed(active_strategy, post_id)
+
+@app.route('/api/strategy/<name>/view/increment/<int:post_id>', methods=['POST'])
+def increment_view_count_with(name, post_id):
+    # 경로에 전략을 지정하여 처리 (전략 전환 없이 여러 전략을 동시에 호출 가능)
+    handler = STRATEGIES.get(name)
+    if handler is None:
+        return jsonify({"error": f"Unknown strategy: {name}"}), 404
+    if conflicts_with_sharding(name):
+        return jsonify({"error": f"Strategy {name} cannot run with hot key sharding",
+                        "available": list(SHARDING_STRATEGIES)}), 409
+    return run_timed(name, post_id)
+
+def run_timed(name, post_id):
+    # 서버 안에서 잰 요청 전체 시간 (stage="total") → 단계별 합과 비교하면 나머지(Flask/직렬화 등)가 보임
+    with stage_metrics.time(name, "total"):
+        return STRATEGIES[name](post_id)
+
+# 배치 증가 API 는 INCR 전략 전용
+app.add_url_rule('/api/view/increment:batch', view_func=app_incr.increment_view_count_batch, methods=['POST'])
+
+# 조회 API (전략과 무관, L1 캐시 → Redis → DB)
+app.add_url_rule('/api/view/<int:post_id>', view_func=app_read.get_view_count, methods=['GET'])
+app.add_url_rule('/api/view', view_func=app_read.get_view_counts, methods=['GET'])
+app.add_url_rule('/api/view/cache/stats', view_func=app_read.read_cache_stats, methods=['GET'])
+app.add_url_rule('/api/view/<int:post_id>/unique-viewers', view_func=app_read.get_unique_viewers, methods=['GET'])
+app.add_url_rule('/api/view/unique-viewers', view_func=app_read.get_unique_viewers_rollup, methods=['GET'])
+app.add_url_rule('/api/view/<int:post_id>/range', view_func=app_read.get_view_range, methods=['GET'])
+
+# Write-Through(무효화) 전략의 읽기 경로 (스탬피드 방지 on/off 비교용)
+app.add_url_rule('/api/strategy/write_through_invalidate/view/<int:post_id>', endpoint='write_through_invalidate_view',
+                 view_func=app_write_through2.get_view_count, methods=['GET'])
+
+# --------------------
+# 3. 관리자 API
+# --------------------
+@app.route('/admin/strategy', methods=['GET'])
+def get_strategy():
+    return jsonify({"active": active_strategy, "available": list(STRATEGIES)})
+
+@app.route('/admin/strategy/<name>', methods=['PUT', 'POST'])
+def set_strategy(name):
+    global active_strategy
+    if name not in STRATEGIES:
+        return jsonify({"error": f"Unknown strategy: {name}", "available": list(STRATEGIES)}), 404
+    if conflicts_with_sharding(name):
+        return jsonify({"error": f"Strategy {name} cannot run with hot key sharding",
+                        "available": list(SHARDING_STRATEGIES)}), 409
+    with strategy_lock:
+        previous, active_strategy = active_strategy, name
+    logger.info(f"Strategy switched: {previous} -> {name}")
+    return jsonify({"previous": previous, "active": name})
+
+@app.route('/admin/logging/<level>', methods=['PUT', 'POST'])
+def set_log_level(level):
+    # 로깅 비용 측정용: 실행 중에 루트 로그 레벨 변경 (예: INFO ↔ WARNING)
+    level = level.upper()
+    if level not in ("DEBUG", "INFO", "WARNING", "ERROR", "CRITICAL"):
+        return jsonify({"error": f"Unknown log level: {level}"}), 404
+    root = logging.getLogger()
+    previous = logging.getLevelName(root.level)
+    root.setLevel(level)
+    return jsonify({"previous": previous, "level": level})
+
+@app.route('/admin/reconciler/policy/<policy>', methods=['PUT', 'POST'])
+def set_reconcile_policy(policy):
+    # 예: report 로 drift 규모를 먼저 본 뒤 repair_cache 로 전환
+    if policy not in RECONCILE_POLICIES:
+        return jsonify({"error": f"Unknown policy: {policy}", "available": list(RECONCILE_POLICIES)}), 404
+    previous, reconciler.policy = reconciler.policy, policy
+    logger.info(f"Reconcile policy switched: {previous} -> {policy}")
+    return jsonify({"previous": previous, "policy": policy})
+
+@app.route('/api/reconciler/stats', methods=['GET'])
+def reconciler_stats():
+    # 점검 진행(바퀴 수, 점검한 키 수), 확정된 drift / 일시적 차이 / 수리 횟수, 최근 drift 항목
+    return jsonify(reconciler.stats())
+
+@app.route('/api/warmup/stats', methods=['GET'])
+def warmup_stats():
+    # 워밍업 진행(읽은 행 / 새로 넣은 키 / 이미 있던 키), 처리 속도
+    return jsonify(cache_warmer.stats())
+
+@app.route('/api/logging/stats', methods=['GET'])
+def get_logging_stats():
+    # 로그 큐 적재 비용(요청 스레드가 쓴 시간), 버린 레코드, 이벤트별 샘플링 현황
+    return jsonify(logging_stats(log_sampler))
+
+@app.route('/metrics', methods=['GET'])
+def metrics():
+    # Prometheus 텍스트 형식: 전략별/단계별 지연 히스토그램
+    # INCR 전략의 저널을 켠 경우 저널 크기 / fsync / 재반영 지표도 함께
+    text = stage_metrics.prometheus()
+    if app_incr.JOURNAL:
+        text += journal_metrics.prometheus(app_incr.journal, app_incr.journal_replayer)
+    return Response(text, content_type=CONTENT_TYPE)
+
+@app.route('/api/pool/stats', methods=['GET'])
+def pool_stats():
+    # DB 연결 풀 대기 시간 / 사용률 (모든 전략 공유)
+    return jsonify(db_pool.stats())
+
+@app.route('/api/lease-lock/stats', methods=['GET'])
+def lease_lock_stats():
+    # 분산 락 (lock / record_lock 전략의 DISTRIBUTED_LOCK = True 일 때)
+    return jsonify(lease_locks.stats())
+
+@app.errorhandler(LockTimeout)
+def lock_timeout(e):
+    return jsonify({"error": str(e)}), 503
+
+app.add_url_rule('/api/write-behind/stats', view_func=app_incr.write_behind_stats, methods=['GET'])
+app.add_url_rule('/api/counter-buffer/stats', view_func=app_incr.counter_buffer_stats, methods=['GET'])
+app.add_url_rule('/api/journal/stats', view_func=app_incr.journal_stats, methods=['GET'])
+app.add_url_rule('/api/hot-keys/stats', view_func=app_incr.hot_key_stats, methods=['GET'])
+app.add_url_rule('/api/unique-viewers/stats', view_func=app_incr.unique_viewer_stats, methods=['GET'])
+app.add_url_rule('/api/view-buckets/stats', view_func=app_incr.view_bucket_stats, methods=['GET'])
+app.add_url_rule('/api/record-lock/stats', view_func=app_record_lock.record_lock_stats, methods=['GET'])
+app.add_url_rule('/api/dcl/stats', view_func=app_double_checked_locking.dcl_stats, methods=['GET'])
+app.add_url_rule('/debug/locks', view_func=app_lock.debug_locks, methods=['GET'])
+app.add_url_rule('/debug/locks/folded', view_func=app_lock.debug_locks_folded, methods=['GET'])
+app.add_url_rule('/debug/locks/reset', view_func=app_lock.debug_locks_reset, methods=['POST'])
+app.add_url_rule('/api/cas/stats', view_func=app_cas.cas_stats, methods=['GET'])
+app.add_url_rule('/api/stampede/stats', view_func=app_write_through2.stampede_stats, methods=['GET'])
+app.add_url_rule('/admin/stampede/<mode>', view_func=app_write_through2.set_stampede_protection, methods=['PUT'])
+
+if __name__ == '__main__':
+    logger.info(f"Starting unified API Server (strategies: {', '.join(STRATEGIES)}, active: {active_strategy})...")
+
+    # 캐시 워밍업 (WARMUP_GATE 면 /ready 가 200 이 될 때까지 조회수 API 는 503)
+    if WARMUP_GATE:
+        cache_warmer.start()
+    else:
+        cache_warmer.run()
+
+    # INCR 전략의 백그라운드 작업 (설정된 경우에만)
+    if app_incr.COUNTER_BUFFER:
+        app_incr.counter_buffer.start()
+    if app_incr.WRITE_BEHIND:
+        app_incr.write_behind.start()
+    if app_incr.JOURNAL:
+        app_incr.journal_replayer.start()
+    if hot_keys.enabled:
+        hot_keys.start()
+    unique_viewers.start()
+    if TIME_BUCKETS:
+        view_buckets.start()
+    if LOCK_PROFILING:
+        lock_profiler.start(LOCK_PROFILE_INTERVAL_SECONDS)
+    if app_read.L1_INVALIDATION:
+        app_read.l1_invalidator.start()
+    if RECONCILER:
+        reconciler.start()
+        logger.info(f"Drift reconciler started (policy={RECONCILE_POLICY}, {RECONCILE_MAX_KEYS_PER_SECOND} keys/s)")
+
+    app.run(host='0.0.0.0', port=5000, threaded=True, debug=False)
@@ -0,0 +1,52 @@
+import threading
+from concurrent.futures import Future
+
+
+class SingleFlight:
+    """
+    키별 중복 호출 합치기 (single-flight).
+
+    같은 키로 동시에 do() 를 호출하면 첫 호출(리더)만 fn 을 실행하고, 나머지는
+    리더의 Future 를 기다렸다가 같은 결과(또는 같은 예외)를 받습니다.
+    키가 다르면 서로 기다리지 않습니다. 결과는 캐싱하지 않으며, 리더가 끝나면 항목을 지웁니다.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls = {}  # key -> Future
+        self.counters = {"loads": 0, "coalesced": 0, "errors": 0}
+
+    def do(self, key, fn):
+        with self._lock:
+            future = self._calls.get(key)
+            leader = future is None
+            if leader:
+                future = self._calls[key] = Future()
+                self.counters["loads"] += 1
+            else:
+                self.counters["coalesced"] += 1
+
+        if not leader:
+            return future.result()
+
+        try:
+            result = fn()
+        except BaseException as e:
+            with self._lock:
+                self.counters["errors"] += 1
+                del self._calls[key]
+            future.set_exception(e)
+            raise
+        with self._lock:
+            del self._calls[key]
+        future.set_result(result)
+        return result
+
+    def stats(self):
+        with self._lock:
+            loads, coalesced = self.counters["loads"], self.counters["coalesced"]
+            return {
+                **self.counters,
+                "in_flight": len(self._calls),
+                "coalesced_ratio": round(coalesced / (loads + coalesced), 4) if loads + coalesced else 0.0,
+            }
@@ -0,0 +1,194 @@
+import math
+import time
+import uuid
+import random
+import threading
+
+from post_keys import view_count_key, read_cache_key
+
+# --------------------
+# 캐시 스탬피드 방지 (Write-Through + 무효화 전략의 읽기 경로)
+# --------------------
+# 쓰기마다 캐시를 지우면, 그 직후 읽기들이 모두 미스가 나서 한꺼번에 MySQL 로 몰립니다.
+#  1. 임대(lease) 토큰: 미스가 나면 SET NX 로 임대를 잡은 한 명만 DB 를 읽어 채웁니다.
+#     채우는 사이 쓰기가 일어나면 쓰기 쪽이 임대를 지우므로, 오래된 값으로 채우는 일이 없습니다.
+#  2. stale-while-revalidate: 임대를 못 잡은 읽기는 무효화 직전 값(stale 복사본)을 바로 돌려받습니다.
+#  3. 확률적 조기 만료(XFetch): 만료가 가까워질수록 높은 확률로 한 명이 미리 다시 채웁니다.
+#
+# 읽기 캐시는 다른 전략이 INCR 하는 공용 카운터 키와 따로 둡니다 (post:<id>:view_cache, 항상 string).
+# 공용 카운터 키에 TTL 을 걸면 만료 뒤 INCR 이 0 부터 다시 세기 때문입니다.
+# 덕분에 hash 인코딩에서도 TTL(과 조기 만료)이 동작합니다.
+
+# KEYS[1] 읽기 캐시 키, KEYS[2] 임대 키, KEYS[3] stale 키
+# ARGV[1] 값, ARGV[2] 임대 토큰, ARGV[3] TTL(ms, 0 이면 없음), ARGV[4] stale TTL(ms)
+FILL_SCRIPT = """
+if redis.call('GET', KEYS[2]) ~= ARGV[2] then
+    return 0
+end
+if tonumber(ARGV[3]) > 0 then
+    redis.call('SET', KEYS[1], ARGV[1], 'PX', ARGV[3])
+else
+    redis.call('SET', KEYS[1], ARGV[1])
+end
+redis.call('SET', KEYS[3], ARGV[1], 'PX', ARGV[4])
+redis.call('DEL', KEYS[2])
+return 1
+"""
+
+# 무효화: 읽기 캐시 값을 stale 복사본으로 옮기고 읽기 캐시와 진행 중인 임대를 지움.
+# 공용 카운터도 DB 보다 뒤처졌으므로 지워서 다음 미스 때 DB 값으로 다시 채워지게 함.
+# KEYS[1..3] 은 FILL_SCRIPT 와 같음, KEYS[4] 공용 카운터 키
+# ARGV[1] 공용 카운터의 해시 필드('' 이면 string), ARGV[2] stale TTL(ms)
+INVALIDATE_SCRIPT = """
+local value = redis.call('GET', KEYS[1])
+redis.call('DEL', KEYS[1])
+if value then
+    redis.call('SET', KEYS[3], value, 'PX', ARGV[2])
+end
+redis.call('DEL', KEYS[2])
+if ARGV[1] == '' then
+    redis.call('DEL', KEYS[4])
+else
+    redis.call('HDEL', KEYS[4], ARGV[1])
+end
+return 1
+"""
+
+
+class StampedeGuard:
+    """
+    load(post_id) 로 DB 값을 읽는 캐시 채우기를 스탬피드로부터 보호합니다.
+    enabled 가 False 면 보호 없이 '미스 → DB 읽기 → SET' 을 그대로 수행합니다 (비교용).
+    """
+
+    def __init__(self, redis_client, keyspace, load, ttl=30.0, lease_ttl=2.0, stale_ttl=60.0,
+                 beta=1.0, wait_timeout=0.5, poll_interval=0.01, enabled=True, early_expiration=True):
+        self.redis = redis_client
+        self.keyspace = keyspace
+        self.load = load
+        self.ttl_ms = int(ttl * 1000)
+        self.lease_ttl_ms = int(lease_ttl * 1000)
+        self.stale_ttl_ms = int(stale_ttl * 1000)
+        self.beta = beta
+        self.wait_timeout = wait_timeout
+        self.poll_interval = poll_interval
+        self.enabled = enabled
+        self.early_expiration = early_expiration
+
+        self.fill_script = redis_client.register_script(FILL_SCRIPT)
+        self.invalidate_script = redis_client.register_script(INVALIDATE_SCRIPT)
+
+        self._lock = threading.Lock()
+        self.load_seconds = 0.0  # DB 로딩 시간 이동 평균 (XFetch 의 delta)
+        self.counters = {
+            "reads": 0, "hits": 0, "db_loads": 0, "fills": 0, "fills_rejected": 0,
+            "stale_served": 0, "waited": 0, "fallback_loads": 0, "early_refreshes": 0,
+        }
+
+    def _count(self, name):
+        with self._lock:
+            self.counters[name] += 1
+
+    def _keys(self, post_id):
+        base = view_count_key(post_id)
+        return [read_cache_key(post_id), f"{base}:lease", f"{base}:stale"]
+
+    def _load(self, post_id):
+        started = time.perf_counter()
+        value = self.load(post_id)
+        elapsed = time.perf_counter() - started
+        with self._lock:
+            self.counters["db_loads"] += 1
+            self.load_seconds = elapsed if not self.load_seconds else 0.8 * self.load_seconds + 0.2 * elapsed
+        return value
+
+    def _refill(self, post_id, keys):
+        """(임대 획득 여부, 값). 임대를 잡으면 DB 에서 읽어 채웁니다. DB 에 없는 게시글이면 값은 None."""
+        token = uuid.uuid4().hex
+        if not self.redis.set(keys[1], token, nx=True, px=self.lease_ttl_ms):
+            return False, None
+        value = self._load(post_id)
+        if value is None:
+            self.redis.delete(keys[1])
+            return True, None
+        filled = self.fill_script(keys=keys, args=[value, token, self.ttl_ms, self.stale_ttl_ms])
+        # 채우는 사이 쓰기가 임대를 지웠다면 캐시에는 넣지 않음 (값 자체는 방금 읽은 것이라 응답에는 사용)
+        self._count("fills" if filled else "fills_rejected")
+        return True, value
+
+    def _expiring_soon(self, pttl_ms):
+        # XFetch: -delta * beta * ln(rand) 가 남은 TTL 이상이면 미리 갱신
+        if not self.early_expiration or pttl_ms is None or pttl_ms <= 0 or not self.load_seconds:
+            return False
+        return -self.load_seconds * self.beta * math.log(1.0 - random.random()) * 1000 >= pttl_ms
+
+    def get(self, post_id):
+        """(조회수, 출처) 를 반환합니다. 출처: cache / db / stale / waited / fallback (게시글이 없으면 조회수 None)"""
+        self._count("reads")
+        keys = self._keys(post_id)
+        if not self.enabled:
+            value = self.redis.get(keys[0])
+            if value is not None:
+                self._count("hits")
+                return int(value), "cache"
+            value = self._load(post_id)
+            if value is not None:
+                self.redis.set(keys[0], value, px=self.ttl_ms or None)
+            return value, "db"
+
+        # 캐시 값, 남은 TTL, stale 복사본을 한 번의 왕복으로 읽음
+        pipe = self.redis.pipeline(transaction=False)
+        pipe.get(keys[0])
+        pipe.pttl(keys[0])
+        pipe.get(keys[2])
+        value, pttl_ms, stale = pipe.execute()
+
+        if value is not None:
+            self._count("hits")
+            if self._expiring_soon(pttl_ms):
+                leased, refreshed = self._refill(post_id, keys)
+                if leased:
+                    self._count("early_refreshes")
+                    return refreshed, "db"
+            return int(value), "cache"
+
+        # 미스: 임대를 잡은 한 명만 DB 로
+        leased, loaded = self._refill(post_id, keys)
+        if leased:
+            return loaded, "db"
+        if stale is not None:
+            self._count("stale_served")
+            return int(stale), "stale"
+
+        # stale 복사본도 없으면(첫 로딩) 채우는 쪽을 잠시 기다림
+        deadline = time.monotonic() + self.wait_timeout
+        while time.monotonic() < deadline:
+            time.sleep(self.poll_interval)
+            value = self.redis.get(keys[0])
+            if value is not None:
+                self._count("waited")
+                return int(value), "waited"
+        self._count("fallback_loads")
+        return self._load(post_id), "fallback"
+
+    def invalidate(self, post_id):
+        """쓰기 후 호출: 캐시 삭제 + 진행 중인 임대 취소 (보호를 끄면 DEL 만)"""
+        keys = self._keys(post_id)
+        if not self.enabled:
+            pipe = self.redis.pipeline(transaction=False)
+            pipe.delete(keys[0])
+            self.keyspace.delete(pipe, post_id)
+            return pipe.execute()
+        key, field = self.keyspace.location(post_id)
+        return self.invalidate_script(keys=keys + [key], args=[field, self.stale_ttl_ms])
+
+    def stats(self):
+        with self._lock:
+            reads = self.counters["reads"]
+            return {
+                "enabled": self.enabled,
+                "early_expiration": self.early_expiration,
+                **self.counters,
+                "db_loads_per_read": round(self.counters["db_loads"] / reads, 4) if reads else 0.0,
+                "avg_load_ms": round(self.load_seconds * 1000, 3),
+            }
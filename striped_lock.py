@@ -0,0 +1,136 @@
+import time
+import threading
+from contextlib import contextmanager
+
+from histogram import LatencyHistogram
+
+
+class _LockStats:
+    """락 하나(또는 스트라이프 하나)의 대기/보유 시간 분포 (마이크로초)."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.wait_us = LatencyHistogram()
+        self.hold_us = LatencyHistogram()
+        self.contended = 0  # 바로 잡지 못하고 기다린 횟수
+
+    def record(self, wait_seconds, hold_seconds, contended):
+        with self.lock:
+            self.wait_us.record(wait_seconds * 1_000_000)
+            self.hold_us.record(hold_seconds * 1_000_000)
+            if contended:
+                self.contended += 1
+
+    def snapshot(self):
+        with self.lock:
+            return {
+                "acquisitions": self.hold_us.count,
+                "contended": self.contended,
+                "wait_ms": self.wait_us.summary(0.001),
+                "hold_ms": self.hold_us.summary(0.001),
+            }
+
+
+def _timed(lock, stats):
+    # 공통: 대기 시간 측정 → 보유 → 해제 후 기록
+    started = time.perf_counter()
+    contended = not lock.acquire(blocking=False)
+    if contended:
+        lock.acquire()
+    acquired = time.perf_counter()
+    try:
+        yield
+    finally:
+        lock.release()
+        released = time.perf_counter()
+        stats.record(acquired - started, released - acquired, contended)
+
+
+class StripedLock:
+    """
+    고정 크기 락 배열. 게시글 ID 를 stripes 개의 락 중 하나로 해싱합니다.
+
+    메모리는 게시글 수와 무관하게 stripes 개로 고정되고 락 테이블 자체에 대한 경합도 없습니다.
+    대신 서로 다른 게시글이 같은 스트라이프에 걸리면 불필요하게 기다리게 되므로(false sharing),
+    스트라이프별 대기/보유 시간을 보고 stripes 를 조정합니다.
+    """
+
+    def __init__(self, stripes=64, lock_factory=None):
+        if stripes < 1:
+            raise ValueError("stripes must be >= 1")
+        self.stripes = stripes
+        # lock_factory(i) 로 스트라이프 락을 바꿔 끼울 수 있음 (예: lock_profiler.ProfiledLock)
+        self._locks = [lock_factory(i) if lock_factory else threading.Lock() for i in range(stripes)]
+        self._stats = [_LockStats() for _ in range(stripes)]
+
+    def stripe_of(self, key):
+        return hash(key) % self.stripes
+
+    @contextmanager
+    def hold(self, key):
+        index = self.stripe_of(key)
+        yield from _timed(self._locks[index], self._stats[index])
+
+    def stats(self):
+        per_stripe = {}
+        for index, stats in enumerate(self._stats):
+            snapshot = stats.snapshot()
+            if snapshot["acquisitions"]:
+                per_stripe[str(index)] = snapshot
+        return {
+            "mode": "striped",
+            "stripes": self.stripes,
+            "stripes_used": len(per_stripe),
+            "contended": sum(s["contended"] for s in per_stripe.values()),
+            "per_stripe": per_stripe,
+        }
+
+
+class RefCountedLockMap:
+    """
+    키별 전용 락을 쓰되, 사용 중인(대기자 포함) 키의 락만 보관하는 맵.
+
+    참조 카운트가 0 이 되면 항목을 지우므로 메모리는 동시에 처리 중인 키 수에 비례합니다.
+    false sharing 은 없지만 획득/해제마다 맵 뮤텍스를 한 번씩 더 잡습니다.
+    """
+
+    def __init__(self):
+        self._mutex = threading.Lock()
+        self._entries = {}  # key -> [lock, refcount]
+        self._stats = _LockStats()
+        self.peak_keys = 0
+
+    @contextmanager
+    def hold(self, key):
+        with self._mutex:
+            entry = self._entries.get(key)
+            if entry is None:
+                entry = self._entries[key] = [threading.Lock(), 0]
+                self.peak_keys = max(self.peak_keys, len(self._entries))
+            entry[1] += 1
+        try:
+            yield from _timed(entry[0], self._stats)
+        finally:
+            with self._mutex:
+                entry[1] -= 1
+                if entry[1] == 0:
+                    del self._entries[key]
+
+    def stats(self):
+        with self._mutex:
+            live_keys = len(self._entries)
+        snapshot = self._stats.snapshot()
+        return {
+            "mode": "refcount",
+            "live_keys": live_keys,
+            "peak_keys": self.peak_keys,
+            **snapshot,
+        }
+
+
+def make_keyed_lock(mode="striped", stripes=64, lock_factory=None):
+    if mode == "striped":
+        return StripedLock(stripes, lock_factory)
+    if mode == "refcount":
+        return RefCountedLockMap()
+    raise ValueError("mode must be 'striped' or 'refcount'")
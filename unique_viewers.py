@@ -0,0 +1,245 @@
+import time
+import hashlib
+import logging
+import threading
+from functools import lru_cache
+
+from l1_cache import L1Cache
+
+logger = logging.getLogger(__name__)
+
+# --------------------
+# 게시글별 순 방문자 수 (HyperLogLog)
+# --------------------
+# 방문자 집합을 그대로 저장하면 게시글 수 × 방문자 수만큼 메모리가 듭니다.
+# HyperLogLog 는 게시글당 최대 12KB 로 고정이고 오차는 약 0.81% 입니다.
+#
+# 키
+#  - post:<id>:viewers            : 전체 기간
+#  - post:<id>:viewers:<YYYYMMDD> : 일별 (UTC). 여러 날 / 여러 게시글 합계는 PFCOUNT 여러 키(크면 PFMERGE) 로 셉니다.
+# 증가 요청에 viewer_id 가 오면 INCR 과 같은 파이프라인에 PFADD 를 붙입니다 (add).
+#
+# 영속화: HLL 레지스터(키의 원본 바이트)를 persist_interval 마다 MySQL post_viewers 에 저장합니다.
+# Redis 에서 키가 밀려났다가 새로 만들어졌을 수 있으므로, 저장 전에 MySQL 사본을 PFMERGE 로 합친 뒤 저장합니다.
+# 읽을 때 키가 없으면 MySQL 사본을 되살립니다.
+# 한 번도 만들어지지 않은 일별 키는 항상 없어 보이므로, MySQL 에도 없던 (게시글, 기간) 은 잠시 기억해 두고 다시 묻지 않습니다.
+ALL_TIME = "all"
+ROLLUP_TTL_SECONDS = 60  # PFMERGE 로 만든 합계 키를 재사용하는 시간
+# 이 이하의 키는 PFCOUNT k1 k2 ... 한 번으로 바로 셈 (저장하는 합계 키 없음 → 방금 PFADD 한 방문자도 보임)
+# 게시글 하나의 최대 기간(app_read.MAX_UNIQUE_VIEWER_DAYS) 을 덮도록 잡음
+DIRECT_COUNT_MAX_KEYS = 400
+NOT_STORED_MAX_ENTRIES = 100000  # MySQL 에 사본이 없다고 확인한 (게시글, 기간) 을 기억하는 개수
+
+
+@lru_cache(maxsize=1 << 16)
+def viewers_key(post_id, period=ALL_TIME):
+    if period == ALL_TIME:
+        return f"post:{post_id}:viewers"
+    return f"post:{post_id}:viewers:{period}"
+
+
+def today():
+    return time.strftime("%Y%m%d", time.gmtime())
+
+
+def recent_days(days):
+    """오늘부터 거슬러 올라간 days 일의 YYYYMMDD (UTC)."""
+    now = time.time()
+    return [time.strftime("%Y%m%d", time.gmtime(now - 86400 * i)) for i in range(days)]
+
+
+class UniqueViewers:
+    def __init__(self, redis_client, raw_redis, db_pool, daily_ttl_days=35, persist_interval=60.0, batch_size=500,
+                 not_stored_ttl=None):
+        self.redis = redis_client
+        self.raw_redis = raw_redis  # decode_responses=False 연결 (HLL 원본 바이트를 읽고 쓰기 위함)
+        self.db_pool = db_pool
+        self.daily_ttl = int(daily_ttl_days * 86400)
+        self.persist_interval = persist_interval
+        self.batch_size = batch_size
+
+        # 이 프로세스가 PFADD 한 (post_id, 기간). 요청 경로에서는 set.add 만 함
+        # (영속화가 집합을 바꾸는 순간 놓친 표시는 그 게시글의 다음 PFADD 때 다시 잡힘)
+        self._dirty = set()
+        # MySQL 에 사본이 없던 (post_id, 기간). 다른 프로세스가 그 사이 저장했을 수 있으므로
+        # 기본 TTL 은 영속화 주기 (그보다 오래 기억하면 밀려난 키를 늦게 되살림). 이 프로세스가 저장하면 바로 지움
+        self._not_stored = L1Cache(maxsize=NOT_STORED_MAX_ENTRIES,
+                                   ttl=persist_interval if not_stored_ttl is None else not_stored_ttl)
+        self._stop = threading.Event()
+        self._thread = None
+        self._stats_lock = threading.Lock()
+        self._adds = 0
+        self._persisted = 0
+        self._persist_runs = 0
+        self._restored = 0
+        self._restore_lookups = 0  # MySQL 사본 조회 횟수
+        self._rollups = 0
+        self._errors = 0
+        self._last_persist_seconds = 0.0
+
+    # --------------------
+    # 쓰기 (요청 경로)
+    # --------------------
+    def add(self, pipe, post_id, viewer_id):
+        """이미 열린 파이프라인에 PFADD 명령을 붙입니다 (전체 기간 + 오늘)."""
+        day = today()
+        pipe.pfadd(viewers_key(post_id), viewer_id)
+        pipe.pfadd(viewers_key(post_id, day), viewer_id)
+        pipe.expire(viewers_key(post_id, day), self.daily_ttl)
+        self._dirty.add((post_id, ALL_TIME))
+        self._dirty.add((post_id, day))
+        self._adds += 1  # 통계용, 락 없이 셈
+
+    # --------------------
+    # 읽기
+    # --------------------
+    def _restore_missing(self, targets):
+        """[(post_id, 기간)] 중 Redis 에 없는 키를 MySQL 사본으로 되살립니다."""
+        pipe = self.redis.pipeline(transaction=False)
+        for post_id, period in targets:
+            pipe.exists(viewers_key(post_id, period))
+        missing = [target for target, exists in zip(targets, pipe.execute())
+                   if not exists and not self._not_stored.get(target)[0]]
+        if not missing:
+            return
+        stored = self._load(missing)
+        for target in missing:
+            if target not in stored:
+                self._not_stored.put(target, True)
+        with self._stats_lock:
+            self._restore_lookups += 1
+        if not stored:
+            return
+        pipe = self.raw_redis.pipeline(transaction=False)
+        for (post_id, period), registers in stored.items():
+            key = viewers_key(post_id, period)
+            # NX: 그 사이 새 PFADD 가 키를 만들었으면 덮어쓰지 않음 (다음 영속화 때 합쳐짐)
+            pipe.set(key, registers, nx=True, ex=None if period == ALL_TIME else self.daily_ttl)
+        restored = sum(1 for created in pipe.execute() if created)
+        with self._stats_lock:
+            self._restored += restored
+
+    def count(self, post_ids, days=None):
+        """post_ids 의 순 방문자 수 합집합. days 가 있으면 최근 days 일, 없으면 전체 기간."""
+        post_ids = sorted(set(post_ids))
+        periods = recent_days(days) if days else [ALL_TIME]
+        targets = [(post_id, period) for post_id in post_ids for period in periods]
+        self._restore_missing(targets)
+        keys = [viewers_key(post_id, period) for post_id, period in targets]
+        if len(keys) <= DIRECT_COUNT_MAX_KEYS:
+            return self.redis.pfcount(*keys)
+
+        # 큰 합집합: PFMERGE 로 합계 키를 만들어 잠시 재사용
+        # 키 이름은 정렬한 ID 의 해시 (순서가 달라도 같은 키, ID 가 많아도 길이 고정)
+        digest = hashlib.sha1(",".join(map(str, post_ids)).encode()).hexdigest()
+        rollup = f"viewers:rollup:{digest}:{days or ALL_TIME}"
+        if not self.redis.exists(rollup):
+            pipe = self.redis.pipeline(transaction=False)
+            pipe.pfmerge(rollup, *keys)
+            pipe.expire(rollup, ROLLUP_TTL_SECONDS)
+            pipe.execute()
+            with self._stats_lock:
+                self._rollups += 1
+        return self.redis.pfcount(rollup)
+
+    # --------------------
+    # MySQL 영속화
+    # --------------------
+    def _load(self, targets):
+        """{(post_id, 기간): 레지스터 바이트} (MySQL 에 있는 것만)."""
+        with self.db_pool.connection() as conn:
+            cursor = conn.cursor()
+            placeholders = ", ".join(["(%s, %s)"] * len(targets))
+            cursor.execute(f"SELECT post_id, period, registers FROM post_viewers WHERE (post_id, period) IN ({placeholders})",
+                           [value for target in targets for value in target])
+            rows = cursor.fetchall()
+            conn.commit()
+        return {(post_id, period): bytes(registers) for post_id, period, registers in rows}
+
+    def persist_once(self):
+        """이 프로세스가 건드린 HLL 을 MySQL 에 저장하고, 저장한 키 수를 반환합니다."""
+        dirty, self._dirty = self._dirty, set()
+        dirty = list(dirty)
+        started = time.perf_counter()
+        saved = 0
+        try:
+            for i in range(0, len(dirty), self.batch_size):
+                saved += self._persist_batch(dirty[i:i + self.batch_size])
+        except Exception:
+            self._dirty.update(dirty)  # 다음 주기에 다시 시도
+            raise
+        with self._stats_lock:
+            self._persist_runs += 1
+            self._persisted += saved
+            self._last_persist_seconds = time.perf_counter() - started
+        return saved
+
+    def _persist_batch(self, targets):
+        stored = self._load(targets)
+        # MySQL 사본을 먼저 합침: 밀려났다가 다시 만들어진 키도 이전 방문자를 잃지 않음
+        pipe = self.raw_redis.pipeline(transaction=False)
+        get_positions = []
+        for post_id, period in targets:
+            key = viewers_key(post_id, period)
+            if (post_id, period) in stored:
+                merge_key = f"{key}:restore"
+                pipe.set(merge_key, stored[(post_id, period)], ex=ROLLUP_TTL_SECONDS)
+                pipe.pfmerge(key, key, merge_key)
+                pipe.delete(merge_key)
+                if period != ALL_TIME:
+                    pipe.expire(key, self.daily_ttl)  # 밀려났던 일별 키는 PFMERGE 로 새로 생겨 TTL 이 없음
+            get_positions.append(len(pipe))
+            pipe.get(key)
+        results = pipe.execute()
+        registers = [results[pos] for pos in get_positions]
+
+        rows = [(post_id, period, value) for (post_id, period), value in zip(targets, registers) if value is not None]
+        if rows:
+            with self.db_pool.connection() as conn:
+                cursor = conn.cursor()
+                cursor.executemany(
+                    "INSERT INTO post_viewers (post_id, period, registers) VALUES (%s, %s, %s) "
+                    "ON DUPLICATE KEY UPDATE registers = VALUES(registers)", rows)
+                conn.commit()
+            for post_id, period, _ in rows:
+                self._not_stored.invalidate((post_id, period))
+        return len(rows)
+
+    # --------------------
+    # 백그라운드 스레드
+    # --------------------
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name="viewer-persister", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread:
+            self._thread.join()
+        self.persist_once()  # 종료 전 마지막 저장
+
+    def _run(self):
+        while not self._stop.wait(self.persist_interval):
+            try:
+                self.persist_once()
+            except Exception as e:
+                with self._stats_lock:
+                    self._errors += 1
+                logger.error(f"Unique viewer persist failed: {e}", exc_info=True)
+
+    def stats(self):
+        with self._stats_lock:
+            return {
+                "running": self._thread is not None and self._thread.is_alive(),
+                "persist_interval": self.persist_interval,
+                "adds": self._adds,
+                "dirty": len(self._dirty),
+                "persist_runs": self._persist_runs,
+                "persisted": self._persisted,
+                "last_persist_seconds": round(self._last_persist_seconds, 3),
+                "restored": self._restored,
+                "restore_lookups": self._restore_lookups,
+                "not_stored_cached": self._not_stored.stats()["size"],
+                "rollups": self._rollups,
+                "errors": self._errors,
+            }
@@ -0,0 +1,279 @@
+import time
+import calendar
+import logging
+import threading
+from datetime import datetime, timezone
+
+logger = logging.getLogger(__name__)
+
+# --------------------
+# 시간대별 조회수 (분 단위 버킷 + MySQL 시간/일 롤업)
+# --------------------
+# content.view_count 는 누적값 하나뿐이라 "최근 1시간 조회수" 같은 질문에 답할 수 없습니다.
+# 증가마다 INCR 과 같은 파이프라인에 분 단위 버킷 증가를 붙입니다.
+#   post:<id>:views:<YYYYMMDDHH>  (해시, 필드 = 분 0..59, UTC)  → HINCRBY + EXPIRE(retention)
+# 게시글·시간마다 해시 하나라 키 수가 분 단위 키의 1/60 이고, 한 시간 구간을 HGETALL 한 번으로 읽습니다.
+#
+# 롤러(roll_once) 는 roll_interval 마다 이 프로세스가 건드린 (게시글, 시간) 해시를 읽어
+# MySQL view_rollup 의 시간 행을 합계로 덮어쓰고(배치 upsert), 그 날의 일 행을 시간 행 합으로 다시 계산합니다.
+# 값을 더하지 않고 덮어쓰므로 여러 프로세스가 같은 시간을 롤업해도 결과는 같습니다.
+# 건드린 시간 목록은 메모리에만 있으므로, 시작할 때 Redis 에 남은 버킷 해시(post:*:views:*)를 SCAN 으로 모두 찾아
+# 다시 롤업합니다. 크래시 직전에 증가했지만 롤업하지 못한 시간도 이렇게 MySQL 에 반영됩니다.
+#
+# 구간 조회(series): retention 안의 시간은 Redis 에서, 그보다 오래된 시간/일(또는 Redis 에서 밀려난 시간)은 MySQL 에서 읽습니다.
+MINUTE, HOUR, DAY = 60, 3600, 86400
+STEPS = {"minute": MINUTE, "hour": HOUR, "day": DAY}
+
+
+def bucket_key(post_id, hour_start):
+    return f"post:{post_id}:views:{time.strftime('%Y%m%d%H', time.gmtime(hour_start))}"
+
+
+def _parse_bucket_key(key):
+    """bucket_key 의 역 → (post_id, 시간 시작). 형식이 다르면 None."""
+    parts = key.split(":")
+    if len(parts) != 4 or not parts[1].isdigit() or len(parts[3]) != 10 or not parts[3].isdigit():
+        return None
+    return int(parts[1]), calendar.timegm(time.strptime(parts[3], "%Y%m%d%H"))
+
+
+def _to_datetime(ts):
+    return datetime.fromtimestamp(ts, timezone.utc).replace(tzinfo=None)  # DATETIME 컬럼은 UTC 기준
+
+
+def _to_ts(dt):
+    return calendar.timegm(dt.timetuple())
+
+
+class ViewBuckets:
+    def __init__(self, redis_client, db_pool, retention_hours=48, roll_interval=60.0, batch_size=500,
+                 max_range_buckets=2000, scan_count=1000):
+        self.redis = redis_client
+        self.db_pool = db_pool
+        self.retention_hours = retention_hours  # 분 단위 버킷을 Redis 에 두는 시간
+        self.roll_interval = roll_interval
+        self.batch_size = batch_size
+        self.max_range_buckets = max_range_buckets
+        self.scan_count = scan_count  # 시작 시 버킷 해시를 찾는 SCAN 한 번의 COUNT
+
+        # 이 프로세스가 증가시킨 (post_id, 시간 시작). 요청 경로에서는 set.add 만 함
+        # (롤러가 집합을 바꾸는 순간 놓친 표시는 그 시간의 다음 증가 때 다시 잡힘)
+        self._dirty = set()
+        self._stop = threading.Event()
+        self._thread = None
+        self._stats_lock = threading.Lock()
+        self._rolls = 0
+        self._hours_rolled = 0
+        self._days_rolled = 0
+        self._recovered_hours = 0
+        self._errors = 0
+        self._last_roll_seconds = 0.0
+        self._redis_reads = 0
+        self._db_reads = 0
+
+    # --------------------
+    # 쓰기 (요청 경로)
+    # --------------------
+    def slot(self, post_id, now=None):
+        """(버킷 키, 분 필드, 시간 시작): now(기본 현재 시각) 가 속한 분 버킷."""
+        now = int(now if now is not None else time.time())
+        hour = now - now % HOUR
+        return bucket_key(post_id, hour), (now - hour) // MINUTE, hour
+
+    def add(self, pipe, post_id, amount=1):
+        """이미 열린 파이프라인에 이번 분 버킷 증가 명령을 붙입니다."""
+        key, minute, hour = self.slot(post_id)
+        pipe.hincrby(key, minute, amount)
+        pipe.expire(key, self.retention_hours * HOUR)
+        self._dirty.add((post_id, hour))
+
+    def touched(self, post_id, hour):
+        """다른 경로(예: 저널 재반영의 Lua 스크립트)가 버킷을 증가시켰을 때 롤업 대상으로 표시합니다."""
+        self._dirty.add((post_id, hour))
+
+    # --------------------
+    # MySQL 롤업
+    # --------------------
+    def roll_once(self):
+        """건드린 시간 버킷을 MySQL 에 반영하고, 반영한 시간 행 수를 반환합니다."""
+        dirty, self._dirty = self._dirty, set()
+        dirty = sorted(dirty)
+        started = time.perf_counter()
+        hours = days = 0
+        try:
+            for i in range(0, len(dirty), self.batch_size):
+                rolled_hours, rolled_days = self._roll_batch(dirty[i:i + self.batch_size])
+                hours += rolled_hours
+                days += rolled_days
+        except Exception:
+            self._dirty.update(dirty)  # 다음 주기에 다시 시도 (덮어쓰기라 중복 반영 걱정 없음)
+            raise
+        with self._stats_lock:
+            self._rolls += 1
+            self._hours_rolled += hours
+            self._days_rolled += days
+            self._last_roll_seconds = time.perf_counter() - started
+        return hours
+
+    def recover(self):
+        """Redis 에 남은 버킷 해시를 모두 롤업 대상으로 표시하고, 표시한 시간 수를 반환합니다 (시작 시 한 번)."""
+        found = 0
+        for key in self.redis.scan_iter(match="post:*:views:*", count=self.scan_count):
+            target = _parse_bucket_key(key)
+            if target is not None:
+                self._dirty.add(target)
+                found += 1
+        with self._stats_lock:
+            self._recovered_hours += found
+        if found:
+            logger.info(f"Re-rolling {found} hour buckets left in Redis")
+        return found
+
+    def _roll_batch(self, targets):
+        pipe = self.redis.pipeline(transaction=False)
+        for post_id, hour in targets:
+            pipe.hgetall(bucket_key(post_id, hour))
+        rows = [(post_id, _to_datetime(hour), sum(int(v) for v in minutes.values()))
+                for (post_id, hour), minutes in zip(targets, pipe.execute()) if minutes]
+        if not rows:
+            return 0, 0
+
+        posts_by_day = {}
+        for post_id, hour in targets:
+            posts_by_day.setdefault(hour - hour % DAY, set()).add(post_id)
+        with self.db_pool.connection() as conn:
+            cursor = conn.cursor()
+            cursor.executemany(
+                "INSERT INTO view_rollup (post_id, granularity, bucket_start, views) VALUES (%s, 'hour', %s, %s) "
+                "ON DUPLICATE KEY UPDATE views = VALUES(views)", rows)
+            # 일 행 = 그 날 시간 행의 합 (날짜마다 게시글 여러 개를 한 문장으로)
+            for day, post_ids in posts_by_day.items():
+                placeholders = ", ".join(["%s"] * len(post_ids))
+                cursor.execute(
+                    "INSERT INTO view_rollup (post_id, granularity, bucket_start, views) "
+                    "SELECT t.post_id, 'day', %s, t.total FROM ("
+                    "  SELECT post_id, SUM(views) AS total FROM view_rollup"
+                    "  WHERE granularity = 'hour' AND bucket_start >= %s AND bucket_start < %s"
+                    f"  AND post_id IN ({placeholders}) GROUP BY post_id"
+                    ") AS t ON DUPLICATE KEY UPDATE views = t.total",
+                    [_to_datetime(day), _to_datetime(day), _to_datetime(day + DAY)] + sorted(post_ids))
+            conn.commit()
+        return len(rows), sum(len(post_ids) for post_ids in posts_by_day.values())
+
+    # --------------------
+    # 구간 조회
+    # --------------------
+    def redis_cutoff(self, now=None):
+        """이 시각 이후 시작한 시간 버킷은 Redis 에 남아 있습니다."""
+        now = int(now if now is not None else time.time())
+        return now - now % HOUR - (self.retention_hours - 1) * HOUR
+
+    def _redis_hours(self, post_id, hours):
+        """{시간 시작: {분: 조회수}} (Redis 에 해시가 없으면 None)."""
+        if not hours:
+            return {}
+        pipe = self.redis.pipeline(transaction=False)
+        for hour in hours:
+            pipe.hgetall(bucket_key(post_id, hour))
+        with self._stats_lock:
+            self._redis_reads += 1
+        return {hour: {int(minute): int(v) for minute, v in minutes.items()} if minutes else None
+                for hour, minutes in zip(hours, pipe.execute())}
+
+    def _db_rows(self, post_id, granularity, starts):
+        """{버킷 시작: 조회수} (MySQL 에 있는 것만)."""
+        if not starts:
+            return {}
+        with self.db_pool.connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute(
+                "SELECT bucket_start, views FROM view_rollup "
+                "WHERE post_id = %s AND granularity = %s AND bucket_start >= %s AND bucket_start <= %s",
+                (post_id, granularity, _to_datetime(min(starts)), _to_datetime(max(starts))))
+            rows = cursor.fetchall()
+            conn.commit()
+        with self._stats_lock:
+            self._db_reads += 1
+        return {_to_ts(bucket_start): views for bucket_start, views in rows}
+
+    def _hourly(self, post_id, hours, cutoff):
+        """{시간 시작: 조회수}. 최근 시간은 Redis, 오래되었거나 Redis 에 없는 시간은 MySQL."""
+        recent = self._redis_hours(post_id, [hour for hour in hours if hour >= cutoff])
+        from_db = self._db_rows(post_id, "hour", [hour for hour in hours if recent.get(hour) is None])
+        return {hour: sum(recent[hour].values()) if recent.get(hour) else from_db.get(hour, 0) for hour in hours}
+
+    def series(self, post_id, start, end, step="hour"):
+        """[start, end) (epoch 초, UTC) 를 step 단위로 나눈 [(버킷 시작, 조회수)]."""
+        if step not in STEPS:
+            raise ValueError(f"step must be one of {tuple(STEPS)}")
+        size = STEPS[step]
+        start -= start % size
+        if end <= start:
+            raise ValueError("end must be after start")
+        if (end - start) / size > self.max_range_buckets:
+            raise ValueError(f"Too many {step} buckets (max {self.max_range_buckets})")
+        cutoff = self.redis_cutoff()
+        buckets = list(range(start, end, size))
+
+        if step == "minute":
+            if start < cutoff:
+                raise ValueError(f"Minute buckets are kept for {self.retention_hours}h only; use step=hour")
+            hours = self._redis_hours(post_id, sorted({t - t % HOUR for t in buckets}))
+            return [(t, (hours[t - t % HOUR] or {}).get((t % HOUR) // MINUTE, 0)) for t in buckets]
+
+        if step == "hour":
+            hourly = self._hourly(post_id, buckets, cutoff)
+            return [(hour, hourly[hour]) for hour in buckets]
+
+        # 일: 통째로 cutoff 이전인 날은 MySQL 일 행, 나머지는 시간 값의 합
+        old_days = [day for day in buckets if day + DAY <= cutoff]
+        from_db = self._db_rows(post_id, "day", old_days)
+        recent_hours = [hour for day in buckets if day + DAY > cutoff for hour in range(day, day + DAY, HOUR)]
+        hourly = self._hourly(post_id, recent_hours, cutoff)
+        return [(day, from_db.get(day, 0) if day + DAY <= cutoff
+                 else sum(hourly[hour] for hour in range(day, day + DAY, HOUR))) for day in buckets]
+
+    # --------------------
+    # 백그라운드 스레드
+    # --------------------
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name="view-bucket-roller", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread:
+            self._thread.join()
+        self.roll_once()  # 종료 전 마지막 롤업
+
+    def _run(self):
+        try:
+            self.recover()
+        except Exception as e:
+            with self._stats_lock:
+                self._errors += 1
+            logger.error(f"View bucket recovery scan failed: {e}", exc_info=True)
+        while not self._stop.wait(self.roll_interval):
+            try:
+                self.roll_once()
+            except Exception as e:
+                with self._stats_lock:
+                    self._errors += 1
+                logger.error(f"View bucket rollup failed: {e}", exc_info=True)
+
+    def stats(self):
+        with self._stats_lock:
+            return {
+                "running": self._thread is not None and self._thread.is_alive(),
+                "retention_hours": self.retention_hours,
+                "roll_interval": self.roll_interval,
+                "dirty_hours": len(self._dirty),
+                "rolls": self._rolls,
+                "hours_rolled": self._hours_rolled,
+                "days_rolled": self._days_rolled,
+                "recovered_hours": self._recovered_hours,
+                "last_roll_seconds": round(self._last_roll_seconds, 3),
+                "range_redis_reads": self._redis_reads,
+                "range_db_reads": self._db_reads,
+                "errors": self._errors,
+            }
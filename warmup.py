@@ -0,0 +1,145 @@
+import time
+import logging
+import threading
+
+from pymysql.cursors import SSCursor
+
+logger = logging.getLogger(__name__)
+
+# --------------------
+# 시작 시 캐시 워밍업
+# --------------------
+# 기존 __main__ 은 캐시를 0 으로 덮어쓰거나(DCL 은 삭제) MySQL 값을 무시했기 때문에,
+# 재시작 직후 첫 트래픽이 미스를 내거나 실제 조회수를 덮어썼습니다.
+# 대신 조회수가 높은 상위 top_n 개 행을 서버 측 커서(SSCursor)로 chunk_size 개씩 흘려 읽고,
+# 파이프라인 SET NX 로 Redis 에 넣습니다. 이미 키가 있으면(그 사이 실시간 쓰기가 먼저 만들었으면) 건드리지 않습니다.
+# MSETNX 는 키 하나만 있어도 묶음 전체를 거부하므로 쓰지 않습니다.
+#
+# ready() 는 진행률이 min_coverage 이상이 되면 True 가 되며, server.py 는 그때부터 조회수 읽기 요청을 받습니다.
+# 아직 채워지지 않은 게시글은 각 전략의 기존 미스 처리로 넘어갑니다.
+# 증가 요청은 complete() 까지 기다립니다: 아직 SET NX 가 닿지 않은 게시글을 INCR 하면 키가 1 부터 생기고,
+# 뒤이은 SET NX 가 건너뛰어 MySQL 값을 잃기 때문입니다.
+STATES = ("pending", "running", "done", "failed")
+
+
+class CacheWarmer:
+    def __init__(self, redis_client, db_pool, keyspace, top_n=100000, chunk_size=1000, min_coverage=0.9):
+        self.redis = redis_client
+        self.db_pool = db_pool
+        self.keyspace = keyspace  # post_keys.CounterKeySpace
+        self.top_n = top_n
+        self.chunk_size = chunk_size
+        self.min_coverage = min_coverage
+
+        self._lock = threading.Lock()
+        self._thread = None
+        self.state = "pending"
+        self.error = None
+        self.target = 0     # 읽을 행 수 = min(top_n, content 행 수)
+        self.streamed = 0   # DB 에서 읽은 행 수
+        self.loaded = 0     # SET NX 로 새로 넣은 키 수
+        self.skipped = 0    # 이미 키가 있어 건너뛴 수
+        self.chunks = 0
+        self._started = None
+        self._finished = None
+
+    # --------------------
+    # 워밍업
+    # --------------------
+    def run(self):
+        with self._lock:
+            self.state = "running"
+            self._started = time.monotonic()
+        conn = None
+        try:
+            conn = self.db_pool.acquire()
+            cursor = conn.cursor()
+            cursor.execute("SELECT COUNT(*) FROM content")
+            total_rows = cursor.fetchone()[0]
+            with self._lock:
+                self.target = min(self.top_n, total_rows)
+
+            # SSCursor 는 결과를 클라이언트 메모리에 한꺼번에 올리지 않고 fetchmany 할 때마다 받아옴
+            cursor = conn.cursor(SSCursor)
+            cursor.execute("SELECT id, view_count FROM content ORDER BY view_count DESC LIMIT %s", (self.top_n,))
+            try:
+                while True:
+                    rows = cursor.fetchmany(self.chunk_size)
+                    if not rows:
+                        break
+                    self._load_chunk(rows)
+            finally:
+                cursor.close()
+            conn.commit()
+        except Exception as e:
+            with self._lock:
+                self.state, self.error = "failed", str(e)
+                self._finished = time.monotonic()
+            logger.error(f"Cache warm-up failed after {self.streamed} rows: {e}", exc_info=True)
+            if conn:
+                self.db_pool.release(conn, discard=True)
+            return self.stats()
+
+        self.db_pool.release(conn)
+        with self._lock:
+            self.state = "done"
+            self._finished = time.monotonic()
+        logger.info(f"Cache warm-up done: {self.loaded} loaded, {self.skipped} already cached "
+                    f"({self.streamed}/{self.target} rows in {self._finished - self._started:.2f}s)")
+        return self.stats()
+
+    def _load_chunk(self, rows):
+        pipe = self.redis.pipeline(transaction=False)
+        for post_id, view_count in rows:
+            self.keyspace.set_nx(pipe, post_id, view_count)
+        loaded = sum(1 for created in pipe.execute() if created)
+        with self._lock:
+            self.chunks += 1
+            self.streamed += len(rows)
+            self.loaded += loaded
+            self.skipped += len(rows) - loaded
+        logger.info("Cache warm-up: %s/%s rows (%.1f%%)", self.streamed, self.target, self.coverage() * 100)
+
+    def start(self):
+        """백그라운드에서 워밍업 (server.py: 그동안 /ready 는 503)."""
+        self.state = "running"  # 스레드가 뜨기 전에 들어온 요청도 막히도록 미리 표시
+        self._thread = threading.Thread(target=self.run, name="cache-warmer", daemon=True)
+        self._thread.start()
+
+    # --------------------
+    # 준비 상태
+    # --------------------
+    def coverage(self):
+        if self.state == "done":
+            return 1.0
+        return self.streamed / self.target if self.target else 0.0
+
+    def ready(self):
+        # 진행 중일 때만 막음. 실패해도 요청은 받으며(채우지 못한 게시글은 각 전략의 미스 처리로),
+        # 워밍업을 시작하지 않은 프로세스(예: 테스트에서 import 만 한 경우)도 막지 않음
+        return self.state != "running" or self.coverage() >= self.min_coverage
+
+    def complete(self):
+        # 워밍업이 끝났거나(실패 포함) 시작하지 않았으면 True: 이후로는 SET NX 가 실시간 INCR 과 겹치지 않음
+        return self.state != "running"
+
+    def stats(self):
+        with self._lock:
+            end = self._finished or time.monotonic()
+            elapsed = end - self._started if self._started else 0.0
+            return {
+                "state": self.state,
+                "ready": self.ready(),
+                "complete": self.complete(),
+                "coverage": round(self.coverage(), 4),
+                "min_coverage": self.min_coverage,
+                "top_n": self.top_n,
+                "target": self.target,
+                "streamed": self.streamed,
+                "loaded": self.loaded,
+                "skipped_existing": self.skipped,
+                "chunks": self.chunks,
+                "elapsed_s": round(elapsed, 3),
+                "rows_per_second": round(self.streamed / elapsed, 1) if elapsed else 0.0,
+                "error": self.error,
+            }
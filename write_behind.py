@@ -0,0 +1,233 @@
+import time
+import logging
+import threading
+from functools import lru_cache
+
+logger = logging.getLogger(__name__)
+
+# --------------------
+# Redis 키 구성
+# --------------------
+# post:<id>:view_delta           : 아직 DB에 반영되지 않은 증가분 (요청 경로에서 INCR)
+# post:<id>:view_delta:inflight  : 플러셔가 가져가서 DB에 반영 중인 증가분 (HASH: delta, seq)
+# view_delta:dirty               : 증가분이 쌓인 게시글 ID 집합
+# view_delta:inflight            : 반영 중인 게시글 ID 집합 (크래시 복구용)
+# view_delta:seq                 : 배치 일련번호 (exactly_once 모드의 중복 반영 방지용)
+DIRTY_SET = "view_delta:dirty"
+INFLIGHT_SET = "view_delta:inflight"
+SEQ_KEY = "view_delta:seq"
+
+# 크래시 등으로 남아있는 inflight 증가분 처리 정책
+#  - exactly_once : view_flush_log 테이블에 배치 번호를 같이 커밋하여 재반영 시 중복을 건너뜀
+#  - at_least_once: 남은 증가분을 그대로 다시 반영 (커밋 직후 크래시라면 중복 가능)
+#  - discard      : 시작 시 남은 증가분을 버림 (유실 가능)
+INFLIGHT_POLICIES = ("exactly_once", "at_least_once", "discard")
+
+# delta 키를 inflight 로 원자적으로 옮기는 스크립트 (GETSET/RENAME 을 한 번에)
+# 이전에 처리하지 못한 inflight 가 남아 있으면 그것부터 다시 반환합니다.
+CLAIM_SCRIPT = """
+if redis.call('EXISTS', KEYS[2]) == 1 then
+  return redis.call('HMGET', KEYS[2], 'delta', 'seq')
+end
+redis.call('SREM', KEYS[3], ARGV[1])
+local d = redis.call('GET', KEYS[1])
+if not d then
+  return false
+end
+local seq = redis.call('INCR', KEYS[5])
+redis.call('DEL', KEYS[1])
+redis.call('HSET', KEYS[2], 'delta', d, 'seq', seq)
+redis.call('SADD', KEYS[4], ARGV[1])
+return {d, tostring(seq)}
+"""
+
+
+@lru_cache(maxsize=1 << 16)
+def delta_key(post_id):
+    return f"post:{post_id}:view_delta"
+
+
+@lru_cache(maxsize=1 << 16)
+def inflight_key(post_id):
+    return f"post:{post_id}:view_delta:inflight"
+
+
+class WriteBehindFlusher:
+    """
+    Write-Behind 카운터.
+
+    요청 경로에서는 Redis INCR 만 수행하고(DB 접근 없음), 백그라운드 스레드가
+    flush_interval 마다 게시글별 누적 증가분을 가져와
+    'UPDATE content SET view_count = view_count + N' 한 번으로 DB에 반영합니다.
+    """
+
+    def __init__(self, redis_client, db_pool, keyspace, flush_interval=1.0, max_lag=10.0,
+                 inflight_policy="exactly_once", hot_keys=None):
+        if inflight_policy not in INFLIGHT_POLICIES:
+            raise ValueError(f"inflight_policy must be one of {INFLIGHT_POLICIES}")
+        self.redis = redis_client
+        self.db_pool = db_pool
+        self.keyspace = keyspace  # post_keys.CounterKeySpace
+        self.hot_keys = hot_keys  # hot_keys.ShardedCounters (없으면 기존 키만 증가)
+        self.flush_interval = flush_interval
+        self.max_lag = max_lag
+        self.inflight_policy = inflight_policy
+
+        self._claim = redis_client.register_script(CLAIM_SCRIPT)
+        self._stop = threading.Event()
+        self._thread = None
+        self._stats_lock = threading.Lock()
+        self._last_success = time.monotonic()
+
+        self._flushes = 0
+        self._failed_flushes = 0
+        self._rows_applied = 0
+        self._views_applied = 0
+        self._duplicates_skipped = 0
+        self._last_batch_size = 0
+
+    # --------------------
+    # 요청 경로
+    # --------------------
+    def record(self, post_id, extra=None):
+        """
+        조회수 캐시와 미반영 증가분을 한 번의 왕복(MULTI)으로 증가시키고 최신 캐시 값을 반환합니다.
+        extra(pipe): 같은 MULTI 에 붙일 명령 (예: unique_viewers.add 의 PFADD)
+        """
+        pipe = self.redis.pipeline(transaction=True)
+        if self.hot_keys:
+            n = self.hot_keys.queue_incr(pipe, post_id)
+        else:
+            n = 1
+            self.keyspace.incr(pipe, post_id)
+        self.queue_delta(pipe, post_id, 1)
+        if extra is not None:
+            extra(pipe)
+        results = pipe.execute()
+        return self.hot_keys.total(results[:n]) if self.hot_keys else results[0]
+
+    def queue_delta(self, pipe, post_id, n):
+        """이미 열린 파이프라인에 미반영 증가분 기록 명령을 추가합니다. (CounterBuffer.on_flush 용)"""
+        pipe.incrby(delta_key(post_id), n)
+        pipe.sadd(DIRTY_SET, post_id)
+
+    def lagging(self):
+        """마지막 성공 플러시가 max_lag 보다 오래되었으면 True (요청 경로가 동기 반영으로 전환할 기준)."""
+        return time.monotonic() - self._last_success > self.max_lag
+
+    # --------------------
+    # 플러시
+    # --------------------
+    def flush_once(self):
+        post_ids = self.redis.sunion(DIRTY_SET, INFLIGHT_SET)
+        batch = []
+        for post_id in post_ids:
+            claimed = self._claim(
+                keys=[delta_key(post_id), inflight_key(post_id), DIRTY_SET, INFLIGHT_SET, SEQ_KEY],
+                args=[post_id])
+            if claimed and claimed[0] is not None:
+                batch.append((int(post_id), int(claimed[0]), int(claimed[1])))
+
+        if not batch:
+            self._mark_success(0)
+            return 0
+
+        try:
+            applied = self._apply(batch)
+        except Exception:
+            # inflight 키는 그대로 남아 다음 주기에 다시 시도됩니다.
+            with self._stats_lock:
+                self._failed_flushes += 1
+            raise
+
+        pipe = self.redis.pipeline(transaction=False)
+        for post_id, _, _ in batch:
+            pipe.delete(inflight_key(post_id))
+        pipe.srem(INFLIGHT_SET, *[post_id for post_id, _, _ in batch])
+        pipe.execute()
+
+        self._mark_success(len(batch), applied)
+        return len(batch)
+
+    def _apply(self, batch):
+        with self.db_pool.connection() as conn:
+            cursor = conn.cursor()
+            rows = batch
+            if self.inflight_policy == "exactly_once":
+                # 조건부 upsert 가 view_flush_log 행을 잠그므로, 같은 inflight 를 가져간 다른 플러셔는
+                # 커밋까지 기다린 뒤 영향 행 수 0 (last_seq 가 이미 같거나 큼) 을 보고 건너뜁니다.
+                # 게시글 ID 순으로 잠가 플러셔끼리 교착되지 않게 합니다.
+                rows = [b for b in sorted(batch) if cursor.execute(
+                    "INSERT INTO view_flush_log (post_id, last_seq) VALUES (%s, %s) "
+                    "ON DUPLICATE KEY UPDATE last_seq = IF(last_seq < VALUES(last_seq), VALUES(last_seq), last_seq)",
+                    (b[0], b[2])) > 0]
+                with self._stats_lock:
+                    self._duplicates_skipped += len(batch) - len(rows)
+
+            if rows:
+                cursor.executemany(
+                    "UPDATE content SET view_count = view_count + %s WHERE id = %s",
+                    [(delta, post_id) for post_id, delta, _ in rows])
+            conn.commit()
+        return sum(delta for _, delta, _ in rows)
+
+    def _mark_success(self, batch_size, views=0):
+        with self._stats_lock:
+            self._last_success = time.monotonic()
+            self._flushes += 1
+            self._rows_applied += batch_size
+            self._views_applied += views
+            self._last_batch_size = batch_size
+
+    def recover(self):
+        """시작 시 이전 프로세스가 남긴 inflight 증가분을 정책에 따라 처리합니다."""
+        leftover = self.redis.smembers(INFLIGHT_SET)
+        if not leftover:
+            return 0
+        if self.inflight_policy == "discard":
+            pipe = self.redis.pipeline(transaction=False)
+            for post_id in leftover:
+                pipe.delete(inflight_key(post_id))
+            pipe.delete(INFLIGHT_SET)
+            pipe.execute()
+            logger.warning(f"Discarded {len(leftover)} in-flight write-behind deltas")
+            return 0
+        logger.info(f"Replaying {len(leftover)} in-flight write-behind deltas ({self.inflight_policy})")
+        return self.flush_once()
+
+    # --------------------
+    # 백그라운드 스레드
+    # --------------------
+    def start(self):
+        self.recover()
+        self._thread = threading.Thread(target=self._run, name="write-behind-flusher", daemon=True)
+        self._thread.start()
+
+    def stop(self, final_flush=True):
+        self._stop.set()
+        if self._thread:
+            self._thread.join()
+        if final_flush:
+            self.flush_once()
+
+    def _run(self):
+        while not self._stop.wait(self.flush_interval):
+            try:
+                self.flush_once()
+            except Exception as e:
+                logger.error(f"Write-behind flush failed: {e}", exc_info=True)
+
+    def stats(self):
+        with self._stats_lock:
+            return {
+                "flush_interval": self.flush_interval,
+                "max_lag": self.max_lag,
+                "inflight_policy": self.inflight_policy,
+                "lag_seconds": round(time.monotonic() - self._last_success, 3),
+                "flushes": self._flushes,
+                "failed_flushes": self._failed_flushes,
+                "rows_applied": self._rows_applied,
+                "views_applied": self._views_applied,
+                "duplicates_skipped": self._duplicates_skipped,
+                "last_batch_size": self._last_batch_size,
+            }